@@ -3,8 +3,11 @@ from __future__ import annotations
 from abc import ABC, abstractmethod
 from typing import TYPE_CHECKING
 
+from app.rag.defenses import sanitize
+
 if TYPE_CHECKING:
     from app.governance.audit import AuditLogger
+    from app.schemas.core import PlanStep, Task
 
 
 class Agent(ABC):
@@ -15,3 +18,8 @@ class Agent(ABC):
     @abstractmethod
     def act(self, *args, **kwargs):
         raise NotImplementedError
+
+
+def step_retrieval_query(task: 'Task', step: 'PlanStep') -> str:
+    "Query the executor retrieves with for a step; shared so the planner can prefetch it."
+    return sanitize(step.instruction) or task.description
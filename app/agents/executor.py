@@ -2,16 +2,16 @@ from __future__ import annotations
 
 from typing import List, Optional
 
-from app.agents.base import Agent
+from app.agents.base import Agent, step_retrieval_query
 from app.governance.approvals import ApprovalRepository
 from app.governance.audit import AuditLogger
 from app.governance.costs import BudgetExceededError, CostTracker
 from app.governance.policies import PolicyStore
-from app.llm import call_llm
+from app.llm import LLMDeferred, call_llm
 from app.llm_rate_limit import RateLimiter
 from app.metrics.llm_usage import LLMUsageLogger
 from app.rag.defenses import sanitize
-from app.rag.retriever import CorpusRetriever, require_citations
+from app.rag.retriever import CorpusRetriever, cited_sources, require_citations
 from app.schemas.core import ExecutionResult, PlanStep, Task
 from app.telemetry import span
 from app.tools.github_client import GitHubClientProtocol
@@ -68,9 +68,9 @@ class Executor(Agent):
 
         sanitized_instruction = sanitize(step.instruction)
         citations = list(step.citations)
-        retrieved = self.retriever.retrieve(sanitized_instruction or task.description)
+        retrieved = self.retriever.retrieve(step_retrieval_query(task, step))
         if retrieved and not citations:
-            citations = [src for _, src in retrieved[:2]]
+            citations = cited_sources(retrieved[:2], self.retriever.sources_for)
 
         try:
             with span(f"executor_{step.tool}"):
@@ -82,6 +82,8 @@ class Executor(Agent):
                     output = self.jira.execute_instruction(task, sanitized_instruction)
                 else:
                     output = f"No-op for unsupported tool {step.tool}."
+        except LLMDeferred:
+            raise
         except Exception as exc:  # pragma: no cover
             result = ExecutionResult(
                 step_id=step.id,
@@ -94,8 +96,8 @@ class Executor(Agent):
             return result
 
         if self.enforce_citations and retrieved:
-            enriched_output = require_citations(output, retrieved)
-            citations = citations or [src for _, src in retrieved[:2]]
+            enriched_output = require_citations(output, retrieved, self.retriever.sources_for)
+            citations = citations or cited_sources(retrieved[:2], self.retriever.sources_for)
         else:
             enriched_output = output
             if not self.enforce_citations:
@@ -155,8 +157,11 @@ class Executor(Agent):
                 usage_logger=self.usage_logger,
                 rate_limiter=self.rate_limiter,
                 rate_limit_keys=self._rate_limit_keys(step.tool),
+                agent=self.name.lower(),
             )
             return generated or synopsis
+        except LLMDeferred:
+            raise
         except Exception as exc:  # pragma: no cover - provider failures fall back
             self.audit.log(self.name, "provider_error", {"step_id": step.id, "error": str(exc)})
             return synopsis
@@ -0,0 +1,88 @@
+from __future__ import annotations
+
+import json
+import re
+from typing import Any, Dict, List
+
+_STEPS_KEY = re.compile(r'"steps"\s*:\s*\[')
+# longest tail that may hold the start of a ``"steps": [`` split across chunks
+_KEY_OVERLAP = 64
+
+
+class PlanStepParser:
+    """Incremental parser for the planner's ``{"steps": [...]}`` response.
+
+    ``feed`` takes the response as it streams in and returns the step objects that the new text
+    completed, so a step can run while the model is still writing the next one. Text before the
+    ``steps`` array is skipped (permissive models like to preface their JSON), strings and escapes
+    are tracked so braces inside instructions do not count, and objects that fail to parse are
+    dropped. Everything after the closing ``]`` is ignored.
+    """
+
+    def __init__(self) -> None:
+        self._buffer = ''
+        self._pos = 0
+        self._state = 'seek'
+        self._depth = 0
+        self._start = 0
+        self._in_string = False
+        self._escape = False
+
+    @property
+    def done(self) -> bool:
+        return self._state == 'done'
+
+    def feed(self, text: str) -> List[Dict[str, Any]]:
+        if self._state == 'done' or not text:
+            return []
+        self._buffer += text
+        if self._state == 'seek':
+            match = _STEPS_KEY.search(self._buffer, self._pos)
+            if match is None:
+                self._pos = max(self._pos, len(self._buffer) - _KEY_OVERLAP)
+                return []
+            self._buffer = self._buffer[match.end():]
+            self._pos = 0
+            self._state = 'array'
+        return self._scan()
+
+    def _scan(self) -> List[Dict[str, Any]]:
+        steps: List[Dict[str, Any]] = []
+        buffer = self._buffer
+        index = self._pos
+        while index < len(buffer):
+            char = buffer[index]
+            if self._depth == 0:
+                if char == '{':
+                    self._start = index
+                    self._depth = 1
+                elif char == ']':
+                    self._state = 'done'
+                    break
+            elif self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == '\\':
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in '{[':
+                self._depth += 1
+            elif char in '}]':
+                self._depth -= 1
+                if self._depth == 0:
+                    try:
+                        step = json.loads(buffer[self._start : index + 1])
+                    except json.JSONDecodeError:
+                        step = None
+                    if isinstance(step, dict):
+                        steps.append(step)
+            index += 1
+        if self._depth == 0:  # nothing pending: drop what has been consumed
+            self._buffer, self._pos = buffer[index:], 0
+        else:
+            self._buffer, self._pos = buffer[self._start :], index - self._start
+            self._start = 0
+        return steps
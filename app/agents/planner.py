@@ -2,14 +2,15 @@ from __future__ import annotations
 
 import itertools
 import random
-from typing import List, Optional, Sequence
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
 
-from app.agents.base import Agent
+from app.agents.base import Agent, step_retrieval_query
+from app.agents.plan_stream import PlanStepParser
 from app.governance.policies import PolicyStore
-from app.llm import call_llm, load_json_safely
+from app.llm import call_llm, load_json_safely, stream_llm
 from app.llm_rate_limit import RateLimiter
 from app.metrics.llm_usage import LLMUsageLogger
-from app.rag.retriever import CorpusRetriever
+from app.rag.retriever import CorpusRetriever, cited_sources
 from app.schemas.core import PlanStep, Task
 from providers.base import BaseProvider
 
@@ -37,34 +38,72 @@ class Planner(Agent):
         self.usage_logger = usage_logger
         self.rate_limiter = rate_limiter
 
-    def act(self, task: Task) -> List[PlanStep]:
-        seed = hash(task.id) & 0xFFFF
-        random.seed(seed)
-        retrieved = self.retriever.retrieve(task.description or task.desired_outcome)
-        citations = [src for _, src in retrieved[:2]]
+    def act(self, task: Task, on_token: Optional[Callable[[str], None]] = None) -> List[PlanStep]:
+        "Plan ``task``; with ``on_token`` the LLM plan is streamed, each chunk passed on as it arrives."
+        retrieved, citations = self._prepare(task)
         steps: List[PlanStep] = []
 
-        llm_plan = self._plan_with_llm(task, citations, retrieved)
+        llm_plan = self._plan_with_llm(task, citations, retrieved, on_token)
         if llm_plan:
             steps.extend(llm_plan)
         else:
             steps.extend(self._fallback_plan(task, citations))
+        self.prefetch(task, steps)
+        self._log_plan(task, steps)
+        return steps
+
+    def plan_stream(self, task: Task, on_token: Optional[Callable[[str], None]] = None) -> Iterator[PlanStep]:
+        """Yield each step as soon as the streamed LLM plan completes it.
 
+        Steps go through the same checks as ``act`` (tool whitelist, approval flags, ``max_steps``);
+        steps past ``max_steps`` are ignored but the stream is read to the end so its usage is
+        logged. If the response holds no parsable ``steps`` array, the whole text is parsed as
+        ``act`` would, and failing that the rule-based fallback plan is yielded.
+        """
+        retrieved, citations = self._prepare(task)
+        steps: List[PlanStep] = []
+        if self.provider:
+            parser = PlanStepParser()
+            chunks: List[str] = []
+            for chunk in stream_llm(self.provider, **self._llm_options(task, retrieved)):
+                chunks.append(chunk)
+                if on_token is not None:
+                    on_token(chunk)
+                for raw in parser.feed(chunk):
+                    step = self._build_step(task, raw, len(steps) + 1, citations)
+                    if step is not None and len(steps) < self.max_steps:
+                        steps.append(step)
+                        yield step
+            if not steps:
+                for step in self._steps_from_response(task, "".join(chunks), citations):
+                    steps.append(step)
+                    yield step
+        if not steps:
+            for step in self._fallback_plan(task, citations):
+                steps.append(step)
+                yield step
+        self._log_plan(task, steps)
+
+    def prefetch(self, task: Task, steps: Sequence[PlanStep]) -> None:
+        "Warm the retrieval cache for every step in one batched call before execution starts."
+        if steps:
+            self.retriever.retrieve_many([step_retrieval_query(task, step) for step in steps])
+
+    def _prepare(self, task: Task) -> Tuple[List[Tuple[str, str]], List[str]]:
+        seed = hash(task.id) & 0xFFFF
+        random.seed(seed)
+        retrieved = self.retriever.retrieve(task.description or task.desired_outcome)
+        citations = cited_sources(retrieved[:2], self.retriever.sources_for)
+        return retrieved, citations
+
+    def _log_plan(self, task: Task, steps: Sequence[PlanStep]) -> None:
         self.audit.log(
             self.name,
             "plan_generated",
             {"task_id": task.id, "steps": [s.model_dump(mode="json") for s in steps]},
         )
-        return steps
 
-    def _plan_with_llm(
-        self,
-        task: Task,
-        citations: List[str],
-        retrieved: List[tuple[str, str]],
-    ) -> List[PlanStep]:
-        if not self.provider:
-            return []
+    def _llm_options(self, task: Task, retrieved: List[tuple[str, str]]) -> Dict[str, Any]:
         context = []
         for idx, (snippet, source) in enumerate(retrieved[:5], start=1):
             normalised = snippet.replace("\n", " ")
@@ -84,43 +123,70 @@ class Planner(Agent):
             f"Risk level: {task.risk_level}\n"
             f"Knowledge base snippets:\n{sources_text}\n"
         )
-        response = call_llm(
-            self.provider,
+        return dict(
             system="Plan responsibly, follow policies, and only emit valid JSON.",
             prompt=prompt,
             max_tokens=400,
             usage_logger=self.usage_logger,
             rate_limiter=self.rate_limiter,
             rate_limit_keys=self._rate_limit_keys(),
+            agent=self.name.lower(),
         )
+
+    def _plan_with_llm(
+        self,
+        task: Task,
+        citations: List[str],
+        retrieved: List[tuple[str, str]],
+        on_token: Optional[Callable[[str], None]] = None,
+    ) -> List[PlanStep]:
+        if not self.provider:
+            return []
+        options = self._llm_options(task, retrieved)
+        if on_token is None:
+            response = call_llm(self.provider, **options)
+        else:
+            chunks: List[str] = []
+            for chunk in stream_llm(self.provider, **options):
+                chunks.append(chunk)
+                on_token(chunk)
+            response = "".join(chunks)
+        return self._steps_from_response(task, response, citations)
+
+    def _steps_from_response(self, task: Task, response: str, citations: List[str]) -> List[PlanStep]:
         data = load_json_safely(response)
         steps_data = data.get("steps") or []
         if not isinstance(steps_data, list):
             return []
-        counter = itertools.count(1)
         planned_steps: List[PlanStep] = []
         for raw in steps_data:
-            tool = str(raw.get("tool", "none")).lower()
-            if tool not in {"none", "github", "jira"}:
-                tool = "none"
-            instruction = str(raw.get("instruction", "")).strip()
-            if not instruction:
+            step = self._build_step(task, raw, len(planned_steps) + 1, citations)
+            if step is None:
                 continue
-            needs_approval = bool(raw.get("needs_approval") or tool in {"github", "jira"})
-            step_id = f"{task.id}-step-{next(counter)}"
-            planned_steps.append(
-                PlanStep(
-                    id=step_id,
-                    tool=tool,  # type: ignore[arg-type]
-                    instruction=instruction,
-                    needs_approval=needs_approval or task.risk_level == "high",
-                    citations=list(citations),
-                )
-            )
+            planned_steps.append(step)
             if len(planned_steps) >= self.max_steps:
                 break
         return planned_steps
 
+    def _build_step(self, task: Task, raw: Any, number: int, citations: List[str]) -> Optional[PlanStep]:
+        "One LLM step as a ``PlanStep``, or ``None`` if it has no instruction."
+        if not isinstance(raw, dict):
+            return None
+        tool = str(raw.get("tool", "none")).lower()
+        if tool not in {"none", "github", "jira"}:
+            tool = "none"
+        instruction = str(raw.get("instruction", "")).strip()
+        if not instruction:
+            return None
+        needs_approval = bool(raw.get("needs_approval") or tool in {"github", "jira"})
+        return PlanStep(
+            id=f"{task.id}-step-{number}",
+            tool=tool,  # type: ignore[arg-type]
+            instruction=instruction,
+            needs_approval=needs_approval or task.risk_level == "high",
+            citations=list(citations),
+        )
+
     def _rate_limit_keys(self) -> List[str]:
         provider_key = getattr(self.provider, "provider_name", "provider")
         return [f"provider:{provider_key}"]
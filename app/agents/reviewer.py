@@ -86,6 +86,7 @@ class Reviewer(Agent):
                 usage_logger=self.usage_logger,
                 rate_limiter=self.rate_limiter,
                 rate_limit_keys=self._rate_limit_keys(),
+                agent=self.name.lower(),
             )
             verdict = critique.strip().lower()
             if any(token in verdict for token in ["reject", "block", "violation"]):
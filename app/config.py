@@ -20,7 +20,30 @@ class Settings(BaseSettings):
     POLICY_PATH: Path = Field(default=RUNTIME_DIR / 'policies.yaml')
     BUDGET_PATH: Path = Field(default=RUNTIME_DIR / 'budget.yaml')
     MODEL_CONFIG_PATH: Path = Field(default=RUNTIME_DIR / 'model_config.yaml')
-    RAG_INDEX_PATH: Path = Field(default=RUNTIME_DIR / 'rag_index.pkl')
+    INJECTION_PATTERNS_PATH: Path = Field(default=RUNTIME_DIR / 'injection_patterns.yaml')
+    RAG_INDEX_PATH: Path = Field(default=RUNTIME_DIR / 'rag_index')
+    RAG_RETRIEVAL_MODE: str = Field(default='dense')
+    RAG_SEARCH_MODE: str = Field(default='auto')
+    RAG_IVF_NPROBE: int = Field(default=8)
+    RAG_INDEX_BATCH_SIZE: int = Field(default=64)
+    RAG_INDEX_MEMORY_MB: int = Field(default=256)
+    RAG_INDEX_WORKERS: int = Field(default=1)
+    RAG_INDEX_QUANTIZATION: str = Field(default='none')
+    RAG_INDEX_PCA_DIMS: int = Field(default=0)
+    RAG_RESCORE_FACTOR: int = Field(default=4)
+    RAG_INDEX_DEDUP: bool = Field(default=True)
+    RAG_DEDUP_THRESHOLD: float = Field(default=0.75)
+    RAG_ROUTE_TOP_N: int = Field(default=2)
+    RAG_QUERY_ENCODER: str = Field(default='default')
+    RAG_QUERY_THREADS: int = Field(default=0)
+    RAG_QUERY_MAX_SEQ_LENGTH: int = Field(default=128)
+    RAG_EMBED_BATCHING: bool = Field(default=True)
+    RAG_EMBED_BATCH_MAX_SIZE: int = Field(default=32)
+    RAG_EMBED_BATCH_MAX_WAIT_MS: float = Field(default=2.0)
+    RAG_INJECTION_POLICY: str = Field(default='off')
+    RAG_RELOAD_CHECK_SECONDS: float = Field(default=5.0)
+    RAG_QUERY_CACHE_BYTES: int = Field(default=8 * 1024 * 1024)
+    RAG_RESULT_CACHE_ENTRIES: int = Field(default=2048)
     SANDBOX_REPO_PATH: Path = Field(default=BASE_DIR / 'sandbox_repo')
     LOG_LEVEL: str = Field(default='INFO')
     LLM_PROVIDER: str = Field(default='stub')
@@ -29,6 +52,19 @@ class Settings(BaseSettings):
     OPENAI_API_BASE: str | None = Field(default=None)
     RUN_BUDGET_USD: float | None = Field(default=None)
     LLM_RATE_LIMIT_PER_MIN: int = Field(default=60)
+    LLM_SINGLE_FLIGHT: bool = Field(default=True)
+    PLAN_OVERLAP_EXECUTION: bool = Field(default=True)
+    HARNESS_BATCH_MODE: bool = Field(default=False)
+    LLM_BATCH_POLL_SECONDS: float = Field(default=30.0)
+    LLM_BATCH_COMPLETION_WINDOW: str = Field(default='24h')
+    LLM_CACHE_ENABLED: bool = Field(default=False)
+    LLM_CACHE_TTL_SECONDS: float = Field(default=24 * 3600)
+    LLM_CACHE_MAX_ENTRIES: int = Field(default=5000)
+    LLM_CACHE_AGENTS: str = Field(default='planner,executor,reviewer')
+    LLM_SEMANTIC_CACHE_ENABLED: bool = Field(default=False)
+    LLM_SEMANTIC_CACHE_MODEL: str = Field(default='')
+    LLM_SEMANTIC_CACHE_THRESHOLDS: str = Field(default='planner=0.95,executor=0.97,reviewer=0.98')
+    LLM_SEMANTIC_CACHE_AUDIT_RATE: float = Field(default=0.05)
 
     class Config:
         env_file = '.env'
@@ -40,6 +76,7 @@ class Settings(BaseSettings):
         self.POLICY_PATH.parent.mkdir(parents=True, exist_ok=True)
         self.BUDGET_PATH.parent.mkdir(parents=True, exist_ok=True)
         self.MODEL_CONFIG_PATH.parent.mkdir(parents=True, exist_ok=True)
+        self.INJECTION_PATTERNS_PATH.parent.mkdir(parents=True, exist_ok=True)
         self.RAG_INDEX_PATH.parent.mkdir(parents=True, exist_ok=True)
         Path(self.SANDBOX_REPO_PATH).mkdir(parents=True, exist_ok=True)
 
@@ -0,0 +1,312 @@
+from __future__ import annotations
+
+import functools
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from app.config import Settings, get_settings
+from app.llm import LLMDeferred
+from app.llm_singleflight import request_key
+from app.metrics.llm_usage import BATCH_PROVIDER_SUFFIX
+from providers.base import BATCH_TERMINAL_STATES, BaseProvider, BatchResult, UsageSlot, parse_batch_output
+
+if TYPE_CHECKING:
+    from app.main import OpsCopilotRuntime, RunResponse
+    from app.schemas.core import Task
+
+# The Batch API accepts at most this many requests per input file.
+MAX_BATCH_REQUESTS = 50_000
+
+STAGE_TAGS = {
+    '[LLM_PLAN_REQUEST]': 'planner',
+    '[LLM_EXECUTOR_REQUEST]': 'executor',
+    '[LLM_REVIEW_REQUEST]': 'reviewer',
+}
+
+
+class BatchPending(LLMDeferred):
+    """Raised in a scenario suspended on an unanswered request when the batch run is abandoned.
+
+    ``call_llm`` and the agents let it through, so the scenario's ``run_task`` unwinds without
+    falling back to the stub or carrying on with later steps.
+    """
+
+
+class BatchJobError(RuntimeError):
+    pass
+
+
+def request_stage(prompt: str) -> str:
+    "Which agent wrote ``prompt``, from the request tag it opens with."
+    for tag, stage in STAGE_TAGS.items():
+        if tag in prompt:
+            return stage
+    return 'other'
+
+
+@dataclass
+class BatchRequest:
+    "One distinct LLM request and where it came from; identical requests are sent once."
+
+    key: str
+    custom_id: str
+    stage: str
+    system: str
+    prompt: str
+    max_tokens: int
+    scenarios: List[Tuple[str, int]] = field(default_factory=list)
+    batch_id: str | None = None
+    result: BatchResult | None = None
+    billed: bool = False
+
+
+# the scenario whose thread is making a call
+_current = threading.local()
+
+
+class _Scenario:
+    """One task's ``run_task`` on a thread of its own, suspended at each LLM call no batch job has
+    answered yet and resumed, where it stopped, once one has.
+
+    The runner hands control to one scenario at a time and waits for it to suspend or finish, so
+    scenarios never run concurrently: each makes its audit writes, approvals and tool calls once,
+    in the order a run on the caller's thread would.
+    """
+
+    def __init__(self, label: str, index: int, run: Callable[[], 'RunResponse']) -> None:
+        self.label = label
+        self.index = index
+        self.response: 'RunResponse | None' = None
+        self.error: BaseException | None = None
+        self.done = False
+        self._run = run
+        self._cancelled = False
+        self._resume = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._main, name=f'batch-{label or "run"}-{index}', daemon=True)
+
+    def advance(self) -> None:
+        "Run the scenario until its next unanswered request, or to the end."
+        if self._thread.ident is None:
+            self._thread.start()
+        else:
+            self._resume.set()
+        self._stopped.wait()
+        self._stopped.clear()
+
+    def suspend(self, custom_id: str) -> None:
+        "On the scenario's thread: hand control back until the runner has flushed a batch."
+        self._stopped.set()
+        self._resume.wait()
+        self._resume.clear()
+        if self._cancelled:
+            raise BatchPending(custom_id)
+
+    def cancel(self) -> None:
+        "Unwind a suspended scenario (its pending call raises ``BatchPending``) and wait for it."
+        if self._thread.ident is None or self.done:
+            return
+        self._cancelled = True
+        self._resume.set()
+        self._thread.join()
+
+    def _main(self) -> None:
+        _current.scenario = self
+        try:
+            self.response = self._run()
+        except BaseException as exc:  # re-raised on the runner's thread
+            self.error = exc
+        finally:
+            self.done = True
+            self._stopped.set()
+
+
+class _ReplayProvider:
+    """Stands in for the runtime's provider while scenarios run in batch mode.
+
+    Requests already answered by a batch job are returned as the provider would have answered
+    them (usage is reported on first use only, so a request shared by several scenarios is billed
+    once); a request the job failed raises like a failed provider call, and anything else is queued
+    for the next job while the calling scenario is suspended.
+    """
+
+    # the runner dedupes requests itself, and a flight led by a suspended scenario would hold up
+    # every scenario waiting on it
+    single_flight = False
+
+    def __init__(self, runner: 'BatchRunner', provider: BaseProvider) -> None:
+        self.runner = runner
+        self.model = getattr(provider, 'model', 'unknown')
+        self.provider_name = getattr(provider, 'provider_name', 'provider') + BATCH_PROVIDER_SUFFIX
+        self._usage = UsageSlot()
+
+    def generate(self, prompt: str, system: str | None = None, max_tokens: int = 512) -> str:
+        scenario: _Scenario = _current.scenario
+        request = self.runner.request(self.provider_name, self.model, system or '', prompt, max_tokens)
+        if (scenario.label, scenario.index) not in request.scenarios:
+            request.scenarios.append((scenario.label, scenario.index))
+        if request.result is None:
+            # every queued request has a result (or an error) once a batch has been flushed
+            scenario.suspend(request.custom_id)
+        result: BatchResult = request.result  # type: ignore[assignment]
+        if result.error is not None:
+            raise BatchJobError(f'Batch request {request.custom_id} failed: {result.error}')
+        if not request.billed:
+            request.billed = True
+            self._usage.set({**result.usage, 'model': result.model or self.model})
+        return result.text
+
+    def estimate_cost(self, input_tokens: int, output_tokens: int) -> float:
+        return (input_tokens + output_tokens) / 100000
+
+    def pop_last_usage(self) -> Optional[Dict[str, Any]]:
+        return self._usage.pop()
+
+
+class BatchRunner:
+    """Runs harness scenarios with their LLM calls sent as offline Batch API jobs.
+
+    Every scenario runs through ``run_task`` on its own thread with the agents' provider swapped
+    for one that answers from completed jobs. In each round the runner resumes the unfinished
+    scenarios one after another, each running until it makes a call no job has answered yet;
+    the round's new requests (deduplicated across scenarios) are then written as one JSONL job in
+    the OpenAI Batch format, submitted through the provider's batch interface and polled until
+    done, and the next round resumes each scenario at the call it was suspended on. Stages that
+    depend on each other take a round each (plan, then each step's executor and reviewer calls).
+    Nothing is replayed: audit writes, approvals, costs and github/jira actions happen once, as in
+    a live run answered with the same text.
+
+    Answers are kept for the runner's lifetime, so evaluations sharing a runner (baseline and
+    governed) send shared requests once. Nothing goes through the live rate limits: the calls
+    are logged to ``llm_usage`` as ``<provider>-batch`` at batch pricing.
+    """
+
+    def __init__(
+        self,
+        settings: Settings | None = None,
+        *,
+        poll_seconds: float | None = None,
+        completion_window: str | None = None,
+        sleep: Callable[[float], None] = time.sleep,
+    ) -> None:
+        self.settings = settings or get_settings()
+        self.poll_seconds = self.settings.LLM_BATCH_POLL_SECONDS if poll_seconds is None else poll_seconds
+        self.completion_window = completion_window or self.settings.LLM_BATCH_COMPLETION_WINDOW
+        self.sleep = sleep
+        self.requests: Dict[str, BatchRequest] = {}
+        self.jobs: List[Dict[str, Any]] = []
+        self.rounds = 0
+        self.wait_seconds = 0.0
+        self._pending: List[BatchRequest] = []
+
+    def request(self, provider: str, model: str, system: str, prompt: str, max_tokens: int) -> BatchRequest:
+        key = request_key(provider, model, system, prompt, max_tokens)
+        request = self.requests.get(key)
+        if request is None:
+            stage = request_stage(prompt)
+            request = BatchRequest(key, f'{stage}-{key[:32]}', stage, system, prompt, max_tokens)
+            self.requests[key] = request
+            self._pending.append(request)
+        return request
+
+    def run(
+        self, runtime: 'OpsCopilotRuntime', tasks: Sequence['Task'], *, auto_approve: bool, label: str = ''
+    ) -> List['RunResponse']:
+        "Run every task to completion; responses come back in ``tasks`` order."
+        provider = runtime.provider
+        if provider is None:
+            return [runtime.run_task(task, auto_approve=auto_approve, overlap=False) for task in tasks]
+        if not callable(getattr(provider, 'submit_batch', None)):
+            raise BatchJobError(f'Provider {getattr(provider, "provider_name", provider)} has no batch interface')
+        run = functools.partial(runtime.run_task, auto_approve=auto_approve, overlap=False)
+        scenarios = [_Scenario(label, index, functools.partial(run, task)) for index, task in enumerate(tasks)]
+        agents = (runtime.planner, runtime.executor, runtime.reviewer)
+        originals = [agent.provider for agent in agents]
+        replay = _ReplayProvider(self, provider)
+        for agent in agents:
+            agent.provider = replay
+        try:
+            while not all(scenario.done for scenario in scenarios):
+                self.rounds += 1
+                for scenario in scenarios:
+                    if scenario.done:
+                        continue
+                    scenario.advance()
+                    if scenario.error is not None:
+                        raise scenario.error
+                if not all(scenario.done for scenario in scenarios):
+                    self._flush(provider, label)
+        finally:
+            for scenario in scenarios:
+                scenario.cancel()
+            for agent, original in zip(agents, originals):
+                agent.provider = original
+        return [scenario.response for scenario in scenarios]  # type: ignore[misc]
+
+    def for_scenario(self, label: str, index: int) -> List[BatchRequest]:
+        "The requests scenario ``index`` of evaluation ``label`` made, with their batch ids and results."
+        return [request for request in self.requests.values() if (label, index) in request.scenarios]
+
+    def stats(self) -> Dict[str, object]:
+        stages: Dict[str, int] = {}
+        prompt_tokens = completion_tokens = errors = 0
+        for request in self.requests.values():
+            stages[request.stage] = stages.get(request.stage, 0) + 1
+            if request.result is not None:
+                prompt_tokens += request.result.usage.get('prompt_tokens', 0)
+                completion_tokens += request.result.usage.get('completion_tokens', 0)
+                errors += request.result.error is not None
+        return {
+            'jobs': len(self.jobs),
+            'rounds': self.rounds,
+            'requests': len(self.requests),
+            'requests_by_stage': stages,
+            'shared_requests': sum(1 for request in self.requests.values() if len(request.scenarios) > 1),
+            'failed_requests': errors,
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'wait_seconds': round(self.wait_seconds, 2),
+        }
+
+    def _flush(self, provider: BaseProvider, label: str) -> None:
+        "Send the queued requests as batch jobs and wait for their results."
+        pending, self._pending = self._pending, []
+        if not pending:
+            raise BatchJobError('Scenarios are waiting on requests that were never queued')
+        started = time.perf_counter()
+        submitted: List[Tuple[str, List[BatchRequest]]] = []
+        for chunk in _chunks(pending, MAX_BATCH_REQUESTS):
+            lines = [
+                provider.batch_line(request.custom_id, request.prompt, request.system, request.max_tokens)
+                for request in chunk
+            ]
+            metadata = {'source': 'ops-copilot-harness', 'evaluation': label, 'round': str(self.rounds)}
+            batch_id = provider.submit_batch(lines, completion_window=self.completion_window, metadata=metadata)
+            for request in chunk:
+                request.batch_id = batch_id
+            submitted.append((batch_id, chunk))
+        for batch_id, chunk in submitted:
+            batch = self._wait(provider, batch_id)
+            self.jobs.append(batch)
+            if batch.get('status') == 'failed' and not batch.get('output_file_id'):
+                raise BatchJobError(f'Batch {batch_id} failed: {batch.get("errors")}')
+            results = parse_batch_output(provider.batch_output(batch))
+            for request in chunk:
+                request.result = results.get(request.custom_id) or BatchResult(
+                    request.custom_id, error=f'missing from the output of batch {batch_id} ({batch.get("status")})'
+                )
+        self.wait_seconds += time.perf_counter() - started
+
+    def _wait(self, provider: BaseProvider, batch_id: str) -> Dict[str, Any]:
+        while True:
+            batch = provider.batch_status(batch_id)
+            if batch.get('status') in BATCH_TERMINAL_STATES:
+                return batch
+            self.sleep(self.poll_seconds)
+
+
+def _chunks(items: List[BatchRequest], size: int) -> Iterator[List[BatchRequest]]:
+    for start in range(0, len(items), size):
+        yield items[start : start + size]
@@ -2,6 +2,7 @@ from __future__ import annotations
 
 import json
 import sqlite3
+import threading
 from datetime import datetime
 from pathlib import Path
 from typing import Any, Dict
@@ -38,6 +39,8 @@ class AuditLogger:
         self.settings = settings or get_settings()
         self.db_path = Path(self.settings.DB_PATH)
         self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        # one writer at a time: agents on different threads share this logger
+        self._lock = threading.Lock()
         self._ensure_table()
 
     def _connect(self) -> sqlite3.Connection:
@@ -50,7 +53,7 @@ class AuditLogger:
 
     def log(self, agent: str, action: str, payload: Dict[str, Any]) -> None:
         safe_payload = json.dumps(_mask_payload(payload), default=str)
-        with self._connect() as conn:
+        with self._lock, self._connect() as conn:
             conn.execute(
                 "INSERT INTO audit_logs(ts, agent, action, payload_json) VALUES (?, ?, ?, ?)",
                 (datetime.utcnow().isoformat(), agent, action, safe_payload),
@@ -1,8 +1,11 @@
 from __future__ import annotations
 
 import math
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
 from pathlib import Path
-from typing import Dict
+from typing import Dict, Iterator, List
 
 import yaml
 
@@ -30,7 +33,11 @@ class CostTracker:
         self.model = model
         self.budget = self._load_budget()
         self.pricing = self._load_pricing()
-        self.total_cost = 0.0
+        self._total = 0.0
+        # the running total of the run being tracked in this context, see run_scope
+        self._run: ContextVar[List[float] | None] = ContextVar(f'cost_run_{id(self)}', default=None)
+        # the planner's stream thread and the executor track costs concurrently
+        self._lock = threading.Lock()
 
     def _load_budget(self) -> float:
         path = Path(self.settings.BUDGET_PATH)
@@ -56,8 +63,29 @@ class CostTracker:
         words = len((text or '').split())
         return max(1, int(math.ceil(words * 1.3)))
 
+    @property
+    def total_cost(self) -> float:
+        run = self._run.get()
+        with self._lock:
+            return self._total if run is None else run[0]
+
+    @contextmanager
+    def run_scope(self) -> Iterator[None]:
+        """Track a run's costs apart from any other run in progress: within the block (and threads
+        started with a copy of its context) ``total_cost`` and the budget count this run's calls only."""
+        token = self._run.set([0.0])
+        try:
+            yield
+        finally:
+            self._run.reset(token)
+
     def reset(self) -> None:
-        self.total_cost = 0.0
+        run = self._run.get()
+        with self._lock:
+            if run is None:
+                self._total = 0.0
+            else:
+                run[0] = 0.0
 
     def track(self, prompt_text: str, response_text: str) -> float:
         pricing = self.pricing.get(self.model) or {'input_per_1k': 0.0004, 'output_per_1k': 0.0012}
@@ -67,9 +95,16 @@ class CostTracker:
             (input_tokens / 1000) * pricing.get('input_per_1k', 0)
             + (output_tokens / 1000) * pricing.get('output_per_1k', 0)
         )
-        self.total_cost += cost
-        if self.total_cost > self.budget:
+        run = self._run.get()
+        with self._lock:
+            if run is None:
+                self._total += cost
+                total_cost = self._total
+            else:
+                run[0] += cost
+                total_cost = run[0]
+        if total_cost > self.budget:
             raise BudgetExceededError(
-                f"Run cost exceeded budget: {self.total_cost:.4f} > {self.budget:.2f}"
+                f"Run cost exceeded budget: {total_cost:.4f} > {self.budget:.2f}"
             )
         return cost
@@ -1,20 +1,39 @@
 from __future__ import annotations
 
+import asyncio
+import functools
 import json
 import time
-from typing import Any, Dict, Iterable, Optional
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Generator, Iterable, Iterator, List, Optional, Tuple
 
 import httpx
 
 from app.config import get_settings
+from app.llm_cache import (
+    CachedResponse,
+    LLMResponseCache,
+    SemanticResponseCache,
+    get_response_cache,
+    get_semantic_cache,
+)
 from app.metrics.llm_usage import LLMUsageLogger
 from app.llm_rate_limit import RateLimiter, RateLimitExceeded
+from app.llm_singleflight import SingleFlight, get_single_flight, request_key
 from providers.base import BaseProvider, StubProvider
 
 _USAGE_LOGGER: LLMUsageLogger | None = None
 _RATE_LIMITER: RateLimiter | None = None
 
 
+class LLMDeferred(Exception):
+    """A provider call whose answer is not available yet (e.g. an offline batch job still running).
+
+    ``call_llm`` neither retries it nor falls back to the stub, and the agents re-raise it from
+    their provider-error handling, so the caller can abandon the run.
+    """
+
+
 def _get_usage_logger() -> LLMUsageLogger:
     global _USAGE_LOGGER
     if _USAGE_LOGGER is None:
@@ -40,12 +59,322 @@ def _provider_name(provider: BaseProvider) -> str:
     return getattr(provider, "provider_name", provider.__class__.__name__.lower())
 
 
+def _flights(provider: BaseProvider, single_flight: Optional[SingleFlight]) -> Optional[SingleFlight]:
+    "Providers with ``single_flight = False`` (e.g. ones that dedupe requests themselves) are never merged."
+    if not getattr(provider, "single_flight", True):
+        return None
+    return single_flight or get_single_flight()
+
+
 def _provider_model(provider: BaseProvider, usage: Dict[str, int] | None) -> str:
     if usage and "model" in usage:
         return str(usage["model"])
     return getattr(provider, "model", "unknown")
 
 
+def _log_usage(
+    provider: BaseProvider, logger: LLMUsageLogger, usage: Optional[Dict[str, int]], latency_ms: float
+) -> None:
+    if not usage:
+        return
+    prompt_tokens = int(usage.get("prompt_tokens", 0))
+    completion_tokens = int(usage.get("completion_tokens", 0))
+    if prompt_tokens or completion_tokens:
+        logger.log_usage(
+            provider=_provider_name(provider),
+            model=str(_provider_model(provider, usage)),
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            latency_ms=latency_ms,
+        )
+
+
+def _retry_delay(exc: Exception, attempt: int, max_retries: int, backoff_seconds: float) -> float | None:
+    """Seconds to wait before the next attempt after ``exc``, or ``None`` to give up.
+
+    Shared by ``call_llm`` and ``acall_llm`` so both retry the same errors on the same schedule.
+    """
+    if isinstance(exc, RateLimitExceeded):
+        return backoff_seconds
+    if isinstance(exc, httpx.HTTPStatusError):
+        if exc.response.status_code in {429, 500, 502, 503, 504} and attempt <= max_retries:
+            return backoff_seconds * attempt
+        return None
+    if isinstance(exc, httpx.HTTPError) and attempt <= max_retries:
+        return backoff_seconds * attempt
+    return None
+
+
+def _fallback(prompt: str, system: str, max_tokens: int, last_exception: Exception | None) -> str:
+    # Fall back to stub provider to keep the pipeline moving
+    try:
+        fallback_provider = StubProvider(get_settings())
+        return fallback_provider.generate(prompt=prompt, system=system, max_tokens=max_tokens)
+    except Exception:
+        if last_exception:
+            raise last_exception
+        raise
+
+
+@dataclass
+class _CacheProbe:
+    "What one call looked up in the response caches, so a miss can be stored under the same keys."
+
+    agent: str | None
+    provider: str
+    model: str
+    system: str
+    prompt: str
+    max_tokens: int
+    exact_key: str | None = None
+    scope: str | None = None
+    vector: Any = None
+    hit: CachedResponse | None = None
+
+
+def _flight_key(
+    provider: BaseProvider,
+    system: str,
+    prompt: str,
+    max_tokens: int,
+    *,
+    agent: str | None,
+    cache: Optional[LLMResponseCache],
+    semantic: Optional[SemanticResponseCache],
+    max_retries: int,
+    backoff_seconds: float,
+) -> str:
+    "Calls only merge when they would make the same request under the same cache and retry policy."
+    exact = semantic_scope = None
+    if cache is not None and cache.enabled_for(agent):
+        exact = [str(cache.db_path), cache.ttl_seconds]
+    if semantic is not None and semantic.enabled_for(agent):
+        semantic_scope = [str(semantic.db_path), semantic.ttl_seconds, semantic.thresholds[agent.lower()]]
+    return request_key(
+        _provider_name(provider),
+        getattr(provider, "model", "unknown"),
+        system,
+        prompt,
+        max_tokens,
+        agent=agent,
+        cache=exact,
+        semantic_cache=semantic_scope,
+        max_retries=max_retries,
+        backoff_seconds=backoff_seconds,
+    )
+
+
+def _cache_lookup(
+    cache: Optional[LLMResponseCache],
+    semantic: Optional[SemanticResponseCache],
+    agent: str | None,
+    provider: BaseProvider,
+    logger: LLMUsageLogger,
+    *,
+    system: str,
+    prompt: str,
+    max_tokens: int,
+) -> _CacheProbe:
+    """Exact cache first, then the semantic one; hits are logged at zero cost."""
+    model = getattr(provider, "model", "unknown")
+    probe = _CacheProbe(agent, _provider_name(provider), model, system, prompt, max_tokens)
+    layer = None
+    if cache is not None and cache.enabled_for(agent):
+        probe.exact_key = cache.key(probe.provider, probe.model, system, prompt, max_tokens)
+        probe.hit = cache.get(probe.exact_key)
+        layer = "exact"
+    if probe.hit is None and semantic is not None and semantic.enabled_for(agent):
+        probe.scope = semantic.scope(agent, probe.provider, probe.model, system, max_tokens)
+        probe.vector = semantic.embed(prompt)
+        match = semantic.lookup(agent, probe.scope, probe.vector)
+        if match is not None:
+            probe.hit = match.entry
+            layer = "semantic"
+            semantic.audit(agent, prompt, match)
+    if probe.hit is not None:
+        logger.log_usage(
+            provider=probe.hit.provider,
+            model=probe.hit.model,
+            prompt_tokens=probe.hit.prompt_tokens,
+            completion_tokens=probe.hit.completion_tokens,
+            latency_ms=0.0,
+            cache_hit=True,
+            cache_layer=layer,
+        )
+    return probe
+
+
+def _cache_store(
+    probe: _CacheProbe,
+    cache: Optional[LLMResponseCache],
+    semantic: Optional[SemanticResponseCache],
+    provider: BaseProvider,
+    response: str,
+    usage: Optional[Dict[str, int]],
+) -> None:
+    usage = usage or {}
+    entry = CachedResponse(
+        response=response,
+        provider=probe.provider,
+        model=_provider_model(provider, usage),
+        prompt_tokens=int(usage.get("prompt_tokens", 0)),
+        completion_tokens=int(usage.get("completion_tokens", 0)),
+    )
+    if cache is not None and probe.exact_key is not None:
+        cache.put(probe.exact_key, entry, agent=probe.agent)
+    if semantic is not None and probe.scope is not None:
+        semantic.put(probe.agent, probe.scope, probe.prompt, probe.vector, entry)
+
+
+@dataclass
+class _Acquire:
+    key: str
+
+
+@dataclass
+class _Sleep:
+    seconds: float
+
+
+@dataclass
+class _Blocking:
+    "Blocking I/O (SQLite caches and usage log); coroutines run it on a worker thread."
+
+    fn: Callable[..., Any]
+    args: Tuple[Any, ...]
+
+
+_GENERATE = object()
+
+
+def _request_flow(
+    provider: BaseProvider,
+    limiter: RateLimiter,
+    logger: LLMUsageLogger,
+    cache: Optional[LLMResponseCache],
+    semantic: Optional[SemanticResponseCache],
+    *,
+    system: str,
+    prompt: str,
+    max_tokens: int,
+    rate_limit_keys: Iterable[str] | None,
+    max_retries: int,
+    backoff_seconds: float,
+    agent: str | None,
+) -> Generator[Any, Any, str]:
+    """The one request policy behind ``call_llm``, ``acall_llm`` and ``stream_llm``.
+
+    Cache lookup, rate limiting, retries with backoff, usage logging, cache store and the stub
+    fallback are decided here; the flow yields what it needs done (``_Acquire``, ``_Sleep``,
+    ``_Blocking``, or ``_GENERATE`` for the provider call, which is answered with ``(response,
+    usage)``) and a driver does it the sync or the async way, throwing failures back in. The
+    return value is the response text.
+    """
+    probe = yield _Blocking(
+        functools.partial(_cache_lookup, system=system, prompt=prompt, max_tokens=max_tokens),
+        (cache, semantic, agent, provider, logger),
+    )
+    if probe.hit is not None:
+        return probe.hit.response
+    keys = list(rate_limit_keys or [])
+    last_exception: Exception | None = None
+    for attempt in range(1, max_retries + 2):
+        try:
+            for key in keys:
+                yield _Acquire(key)
+            start = time.perf_counter()
+            response, usage = yield _GENERATE
+        except LLMDeferred:
+            raise
+        except Exception as exc:
+            last_exception = exc
+            delay = _retry_delay(exc, attempt, max_retries, backoff_seconds)
+            if delay is None:
+                break
+            yield _Sleep(delay)
+            continue
+        latency_ms = (time.perf_counter() - start) * 1000
+        yield _Blocking(_log_usage, (provider, logger, usage, latency_ms))
+        yield _Blocking(_cache_store, (probe, cache, semantic, provider, response, usage))
+        return response
+    return _fallback(prompt, system, max_tokens, last_exception)
+
+
+def _drive(
+    flow: Generator[Any, Any, str],
+    limiter: RateLimiter,
+    generate: Callable[[], Generator[str, None, Tuple[str, Optional[Dict[str, int]]]]],
+) -> Generator[str, None, str]:
+    """Run ``flow`` on this thread. ``generate`` makes one provider call; the chunks it yields are
+    passed on, and once one has been, a failure propagates instead of being retried."""
+    reply: Any = None
+    error: Exception | None = None
+    while True:
+        try:
+            step = flow.throw(error) if error is not None else flow.send(reply)
+        except StopIteration as stop:
+            return stop.value
+        reply, error = None, None
+        streamed = False
+        try:
+            if isinstance(step, _Acquire):
+                limiter.acquire(step.key, timeout=30.0)
+            elif isinstance(step, _Sleep):
+                time.sleep(step.seconds)
+            elif isinstance(step, _Blocking):
+                reply = step.fn(*step.args)
+            else:
+                call = generate()
+                while True:
+                    try:
+                        chunk = next(call)
+                    except StopIteration as stop:
+                        reply = stop.value
+                        break
+                    streamed = True
+                    yield chunk
+        except Exception as exc:
+            if streamed:
+                raise
+            error = exc
+
+
+async def _adrive(
+    flow: Generator[Any, Any, str],
+    limiter: RateLimiter,
+    generate: Callable[[], Awaitable[Tuple[str, Optional[Dict[str, int]]]]],
+) -> str:
+    "``_drive`` for coroutines: every wait is awaited and blocking I/O runs on a worker thread."
+    reply: Any = None
+    error: Exception | None = None
+    while True:
+        try:
+            step = flow.throw(error) if error is not None else flow.send(reply)
+        except StopIteration as stop:
+            return stop.value
+        reply, error = None, None
+        try:
+            if isinstance(step, _Acquire):
+                await limiter.aacquire(step.key, timeout=30.0)
+            elif isinstance(step, _Sleep):
+                await asyncio.sleep(step.seconds)
+            elif isinstance(step, _Blocking):
+                reply = await asyncio.to_thread(step.fn, *step.args)
+            else:
+                reply = await generate()
+        except Exception as exc:
+            error = exc
+
+
+def _run(drive: Generator[str, None, str]) -> str:
+    "The return value of a driver whose provider calls yield no chunks."
+    while True:
+        try:
+            next(drive)
+        except StopIteration as stop:
+            return stop.value
+
+
 def call_llm(
     provider: Optional[BaseProvider],
     *,
@@ -57,67 +386,221 @@ def call_llm(
     rate_limit_keys: Iterable[str] | None = None,
     max_retries: int = 2,
     backoff_seconds: float = 1.0,
+    agent: str | None = None,
+    response_cache: Optional[LLMResponseCache] = None,
+    semantic_cache: Optional[SemanticResponseCache] = None,
+    single_flight: Optional[SingleFlight] = None,
 ) -> str:
-    """Execute a single-turn request against the configured provider while capturing metrics and enforcing rate limits."""
+    """Execute a single-turn request against the configured provider while capturing metrics and enforcing rate limits.
+
+    With ``LLM_CACHE_ENABLED`` (or an explicit ``response_cache``) and ``agent`` among the cached
+    agents, identical requests are answered from the persistent response cache; with
+    ``LLM_SEMANTIC_CACHE_ENABLED`` (or ``semantic_cache``) near-identical prompts of agents with a
+    similarity threshold are too. With ``LLM_SINGLE_FLIGHT`` (or ``single_flight``) concurrent
+    identical requests share one provider call: only that call takes rate-limit tokens and is
+    logged to ``llm_usage``; the callers that waited on it are counted in the flight stats.
+    """
     if provider is None:
         return ""
     limiter = rate_limiter or _get_rate_limiter()
     logger = usage_logger or _get_usage_logger()
-    keys = list(rate_limit_keys or [])
-    attempt = 0
-    last_exception: Exception | None = None
+    cache = response_cache or get_response_cache()
+    semantic = semantic_cache or get_semantic_cache()
+    flights = _flights(provider, single_flight)
 
-    while attempt <= max_retries:
-        attempt += 1
-        try:
-            for key in keys:
-                limiter.acquire(key, timeout=30.0)
-            start = time.perf_counter()
+    def generate() -> Generator[str, None, Tuple[str, Optional[Dict[str, int]]]]:
+        response = provider.generate(prompt=prompt, system=system, max_tokens=max_tokens)
+        return response, _pop_usage(provider)
+        yield  # a generator that streams nothing
+
+    def lead() -> str:
+        flow = _request_flow(
+            provider,
+            limiter,
+            logger,
+            cache,
+            semantic,
+            system=system,
+            prompt=prompt,
+            max_tokens=max_tokens,
+            rate_limit_keys=rate_limit_keys,
+            max_retries=max_retries,
+            backoff_seconds=backoff_seconds,
+            agent=agent,
+        )
+        return _run(_drive(flow, limiter, generate))
+
+    if flights is None:
+        return lead()
+    key = _flight_key(
+        provider,
+        system,
+        prompt,
+        max_tokens,
+        agent=agent,
+        cache=cache,
+        semantic=semantic,
+        max_retries=max_retries,
+        backoff_seconds=backoff_seconds,
+    )
+    response, _shared = flights.do(key, lead)
+    return response
+
+
+def stream_llm(
+    provider: Optional[BaseProvider],
+    *,
+    system: str,
+    prompt: str,
+    max_tokens: int = 512,
+    usage_logger: Optional[LLMUsageLogger] = None,
+    rate_limiter: Optional[RateLimiter] = None,
+    rate_limit_keys: Iterable[str] | None = None,
+    max_retries: int = 2,
+    backoff_seconds: float = 1.0,
+    agent: str | None = None,
+    response_cache: Optional[LLMResponseCache] = None,
+    semantic_cache: Optional[SemanticResponseCache] = None,
+    single_flight: Optional[SingleFlight] = None,
+) -> Iterator[str]:
+    """``call_llm`` that yields the response in chunks as the provider produces them.
+
+    Caches, rate limits and usage logging behave as in ``call_llm`` (usage is logged once the
+    stream ends). Retries and the stub fallback only apply before the first chunk; an error after
+    that propagates, since the caller has already seen part of the answer. Providers without
+    ``generate_stream`` yield their whole ``generate`` result as one chunk. Single-flight shares
+    streams with ``call_llm`` callers: the leader streams, and callers that joined its flight get
+    the whole text as one chunk once it has finished.
+    """
+    if provider is None:
+        return
+    limiter = rate_limiter or _get_rate_limiter()
+    logger = usage_logger or _get_usage_logger()
+    cache = response_cache or get_response_cache()
+    semantic = semantic_cache or get_semantic_cache()
+    flights = _flights(provider, single_flight)
+
+    def lead() -> Iterator[str]:
+        streamed: List[str] = []
+
+        def generate() -> Generator[str, None, Tuple[str, Optional[Dict[str, int]]]]:
+            stream = getattr(provider, "generate_stream", None)
+            if stream is None:
+                chunks = [provider.generate(prompt=prompt, system=system, max_tokens=max_tokens)]
+            else:
+                chunks = stream(prompt=prompt, system=system, max_tokens=max_tokens)
+            for chunk in chunks:
+                streamed.append(chunk)
+                yield chunk
+            return "".join(streamed), _pop_usage(provider)
+
+        flow = _request_flow(
+            provider,
+            limiter,
+            logger,
+            cache,
+            semantic,
+            system=system,
+            prompt=prompt,
+            max_tokens=max_tokens,
+            rate_limit_keys=rate_limit_keys,
+            max_retries=max_retries,
+            backoff_seconds=backoff_seconds,
+            agent=agent,
+        )
+        response = yield from _drive(flow, limiter, generate)
+        if not streamed:  # a cache hit or the fallback: nothing came from the provider stream
+            yield response
+
+    if flights is None:
+        yield from lead()
+        return
+    key = _flight_key(
+        provider,
+        system,
+        prompt,
+        max_tokens,
+        agent=agent,
+        cache=cache,
+        semantic=semantic,
+        max_retries=max_retries,
+        backoff_seconds=backoff_seconds,
+    )
+    yield from flights.stream(key, lead)
+
+
+async def _agenerate(provider: BaseProvider, prompt: str, system: str, max_tokens: int) -> tuple:
+    "``(response, usage)``; providers without ``agenerate`` run their blocking call on a worker thread."
+    agenerate = getattr(provider, "agenerate", None)
+    if agenerate is None:
+        def blocking() -> tuple:
             response = provider.generate(prompt=prompt, system=system, max_tokens=max_tokens)
-            latency_ms = (time.perf_counter() - start) * 1000
-            usage = _pop_usage(provider)
-            if usage:
-                provider_name = _provider_name(provider)
-                model_name = _provider_model(provider, usage)
-                prompt_tokens = int(usage.get("prompt_tokens", 0))
-                completion_tokens = int(usage.get("completion_tokens", 0))
-                if prompt_tokens or completion_tokens:
-                    logger.log_usage(
-                        provider=provider_name,
-                        model=str(model_name),
-                        prompt_tokens=prompt_tokens,
-                        completion_tokens=completion_tokens,
-                        latency_ms=latency_ms,
-                    )
-            return response
-        except RateLimitExceeded as exc:
-            last_exception = exc
-            time.sleep(backoff_seconds)
-        except httpx.HTTPStatusError as exc:
-            last_exception = exc
-            status = exc.response.status_code
-            if status in {429, 500, 502, 503, 504} and attempt <= max_retries:
-                time.sleep(backoff_seconds * attempt)
-                continue
-            break
-        except httpx.HTTPError as exc:
-            last_exception = exc
-            if attempt <= max_retries:
-                time.sleep(backoff_seconds * attempt)
-                continue
-            break
-        except Exception as exc:
-            last_exception = exc
-            break
+            return response, _pop_usage(provider)
 
-    # Fall back to stub provider to keep the pipeline moving
-    try:
-        fallback_provider = StubProvider(get_settings())
-        return fallback_provider.generate(prompt=prompt, system=system, max_tokens=max_tokens)
-    except Exception:
-        if last_exception:
-            raise last_exception
-        raise
+        return await asyncio.to_thread(blocking)
+    response = await agenerate(prompt=prompt, system=system, max_tokens=max_tokens)
+    return response, _pop_usage(provider)
+
+
+async def acall_llm(
+    provider: Optional[BaseProvider],
+    *,
+    system: str,
+    prompt: str,
+    max_tokens: int = 512,
+    usage_logger: Optional[LLMUsageLogger] = None,
+    rate_limiter: Optional[RateLimiter] = None,
+    rate_limit_keys: Iterable[str] | None = None,
+    max_retries: int = 2,
+    backoff_seconds: float = 1.0,
+    agent: str | None = None,
+    response_cache: Optional[LLMResponseCache] = None,
+    semantic_cache: Optional[SemanticResponseCache] = None,
+    single_flight: Optional[SingleFlight] = None,
+) -> str:
+    """``call_llm`` for coroutines: same caches, single-flight, rate limits, retries, usage logging
+    and stub fallback, but waiting (on the limiter, between retries, on the provider) never holds
+    a thread."""
+    if provider is None:
+        return ""
+    limiter = rate_limiter or _get_rate_limiter()
+    logger = usage_logger or _get_usage_logger()
+    cache = response_cache or get_response_cache()
+    semantic = semantic_cache or get_semantic_cache()
+    flights = _flights(provider, single_flight)
+
+    async def lead() -> str:
+        flow = _request_flow(
+            provider,
+            limiter,
+            logger,
+            cache,
+            semantic,
+            system=system,
+            prompt=prompt,
+            max_tokens=max_tokens,
+            rate_limit_keys=rate_limit_keys,
+            max_retries=max_retries,
+            backoff_seconds=backoff_seconds,
+            agent=agent,
+        )
+        return await _adrive(flow, limiter, lambda: _agenerate(provider, prompt, system, max_tokens))
+
+    if flights is None:
+        return await lead()
+    key = _flight_key(
+        provider,
+        system,
+        prompt,
+        max_tokens,
+        agent=agent,
+        cache=cache,
+        semantic=semantic,
+        max_retries=max_retries,
+        backoff_seconds=backoff_seconds,
+    )
+    response, _shared = await flights.ado(key, lead)
+    return response
 
 
 def load_json_safely(payload: str) -> Dict[str, Any]:
@@ -0,0 +1,476 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import random
+import re
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+from app.config import Settings, get_settings
+from app.llm_singleflight import request_key
+
+LLM_CACHE_TABLE = """
+CREATE TABLE IF NOT EXISTS llm_cache (
+    key TEXT PRIMARY KEY,
+    agent TEXT,
+    provider TEXT NOT NULL,
+    model TEXT NOT NULL,
+    response TEXT NOT NULL,
+    prompt_tokens INTEGER NOT NULL,
+    completion_tokens INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    last_used_at REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0
+);
+"""
+LLM_CACHE_INDEX = "CREATE INDEX IF NOT EXISTS llm_cache_last_used ON llm_cache(last_used_at)"
+
+SEMANTIC_CACHE_TABLE = """
+CREATE TABLE IF NOT EXISTS llm_semantic_cache (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    scope TEXT NOT NULL,
+    agent TEXT NOT NULL,
+    prompt TEXT NOT NULL,
+    embedding BLOB NOT NULL,
+    provider TEXT NOT NULL,
+    model TEXT NOT NULL,
+    response TEXT NOT NULL,
+    prompt_tokens INTEGER NOT NULL,
+    completion_tokens INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    last_used_at REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0
+);
+"""
+SEMANTIC_CACHE_INDEX = "CREATE INDEX IF NOT EXISTS llm_semantic_cache_scope ON llm_semantic_cache(scope)"
+DEFAULT_SEMANTIC_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+_UUID = re.compile(r"\b[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}\b", re.IGNORECASE)
+_HEX_ID = re.compile(r"\b(?=[0-9a-f]*\d)[0-9a-f]{12,}\b", re.IGNORECASE)
+_NUMBER = re.compile(r"\d+")
+
+
+@dataclass
+class CachedResponse:
+    response: str
+    provider: str
+    model: str
+    prompt_tokens: int
+    completion_tokens: int
+
+
+def parse_agents(value: str | Iterable[str]) -> frozenset:
+    "``'planner, executor'`` or an iterable -> lower-cased agent names; ``'*'`` enables every caller."
+    names = value.split(",") if isinstance(value, str) else value
+    return frozenset(name.strip().lower() for name in names if name and name.strip())
+
+
+def parse_thresholds(value: str | Dict[str, float]) -> Dict[str, float]:
+    "``'planner=0.95,reviewer=0.98'`` or a mapping -> per-agent similarity thresholds."
+    if isinstance(value, dict):
+        return {name.lower(): float(threshold) for name, threshold in value.items()}
+    thresholds: Dict[str, float] = {}
+    for item in value.split(","):
+        if "=" in item:
+            name, threshold = item.split("=", 1)
+            thresholds[name.strip().lower()] = float(threshold)
+    return thresholds
+
+
+def normalise_prompt(prompt: str) -> str:
+    "Prompt with ids and numbers masked, lower-cased and whitespace-collapsed, as embedded by the semantic cache."
+    text = _UUID.sub("<id>", prompt)
+    text = _HEX_ID.sub("<id>", text)
+    text = _NUMBER.sub("<n>", text)
+    return " ".join(text.lower().split())
+
+
+class LLMResponseCache:
+    """Provider responses persisted in SQLite, keyed by (provider, model, system, prompt, max_tokens).
+
+    Entries older than ``ttl_seconds`` are treated as misses and dropped when read; once the table
+    holds more than ``max_entries`` rows the least recently used ones are evicted. Only callers
+    listed in ``agents`` are cached, so e.g. the planner can be cached while the reviewer always
+    asks the model.
+    """
+
+    def __init__(
+        self,
+        settings: Settings | None = None,
+        *,
+        db_path: Path | str | None = None,
+        ttl_seconds: float | None = None,
+        max_entries: int | None = None,
+        agents: str | Iterable[str] | None = None,
+    ) -> None:
+        self.settings = settings or get_settings()
+        self.db_path = Path(db_path or self.settings.DB_PATH)
+        self.ttl_seconds = float(self.settings.LLM_CACHE_TTL_SECONDS if ttl_seconds is None else ttl_seconds)
+        self.max_entries = int(self.settings.LLM_CACHE_MAX_ENTRIES if max_entries is None else max_entries)
+        self.agents = parse_agents(self.settings.LLM_CACHE_AGENTS if agents is None else agents)
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._expired = 0
+        self._evictions = 0
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute(LLM_CACHE_TABLE)
+            conn.execute(LLM_CACHE_INDEX)
+            conn.commit()
+
+    def enabled_for(self, agent: str | None) -> bool:
+        return "*" in self.agents or (agent is not None and agent.lower() in self.agents)
+
+    @staticmethod
+    def key(provider: str, model: str, system: str, prompt: str, max_tokens: int) -> str:
+        return request_key(provider, model, system, prompt, max_tokens)
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        now = time.time()
+        with sqlite3.connect(self.db_path) as conn:
+            row = conn.execute(
+                "SELECT response, provider, model, prompt_tokens, completion_tokens, created_at "
+                "FROM llm_cache WHERE key = ?",
+                (key,),
+            ).fetchone()
+            if row is not None and self.ttl_seconds > 0 and now - row[5] > self.ttl_seconds:
+                conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                conn.commit()
+                with self._lock:
+                    self._expired += 1
+                row = None
+            if row is None:
+                with self._lock:
+                    self._misses += 1
+                return None
+            conn.execute("UPDATE llm_cache SET last_used_at = ?, hits = hits + 1 WHERE key = ?", (now, key))
+            conn.commit()
+        with self._lock:
+            self._hits += 1
+        return CachedResponse(row[0], row[1], row[2], int(row[3]), int(row[4]))
+
+    def put(self, key: str, entry: CachedResponse, *, agent: str | None = None) -> None:
+        now = time.time()
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute(
+                """
+                INSERT OR REPLACE INTO llm_cache(
+                    key, agent, provider, model, response, prompt_tokens, completion_tokens, created_at, last_used_at
+                )
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    key,
+                    agent,
+                    entry.provider,
+                    entry.model,
+                    entry.response,
+                    entry.prompt_tokens,
+                    entry.completion_tokens,
+                    now,
+                    now,
+                ),
+            )
+            evicted = 0
+            if self.max_entries > 0:
+                evicted = conn.execute(
+                    "DELETE FROM llm_cache WHERE key IN ("
+                    "SELECT key FROM llm_cache ORDER BY last_used_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,),
+                ).rowcount
+            conn.commit()
+        if evicted:
+            with self._lock:
+                self._evictions += evicted
+
+    def clear(self) -> None:
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("DELETE FROM llm_cache")
+            conn.commit()
+
+    def stats(self) -> Dict[str, object]:
+        with sqlite3.connect(self.db_path) as conn:
+            entries = conn.execute("SELECT COUNT(1) FROM llm_cache").fetchone()[0]
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "entries": int(entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "agents": sorted(self.agents),
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / lookups, 4) if lookups else 0.0,
+                "expired": self._expired,
+                "evictions": self._evictions,
+            }
+
+
+def rag_embedding_model(settings: Settings) -> Any:
+    "The embedding model of the live RAG index (loaded once, shared with retrieval)."
+    from app.rag.models import get_embedding_model
+    from app.rag.store import IndexStore, resolve_index_root
+
+    name = settings.LLM_SEMANTIC_CACHE_MODEL
+    if not name:
+        store = IndexStore(resolve_index_root(settings.RAG_INDEX_PATH)[0])
+        manifest = store.read_manifest() if store.exists() else None
+        name = manifest.model_name if manifest is not None else DEFAULT_SEMANTIC_MODEL
+    return get_embedding_model(name)
+
+
+@dataclass
+class _Scope:
+    ids: List[int] = field(default_factory=list)
+    created: List[float] = field(default_factory=list)
+    vectors: np.ndarray | None = None
+
+
+@dataclass
+class SemanticHit:
+    entry: CachedResponse
+    similarity: float
+    cached_prompt: str
+
+
+class SemanticResponseCache:
+    """Reuses a response when a new prompt embeds close enough to an earlier one of the same agent.
+
+    Prompts are normalised (``normalise_prompt``) and embedded with the RAG embedding model;
+    lookups compare against earlier prompts in the same scope (agent, provider, model, system
+    prompt and ``max_tokens``) and hit when the best cosine similarity reaches that agent's
+    threshold. Agents without a threshold are never served from here. Entries are persisted in
+    ``llm_semantic_cache`` and mirrored in memory per scope, with the TTL and LRU limit of the
+    exact cache. A sample (``audit_rate``) of hits is written to the audit log with both prompts
+    so false hits can be reviewed and thresholds tuned.
+    """
+
+    def __init__(
+        self,
+        settings: Settings | None = None,
+        *,
+        encoder: Any = None,
+        db_path: Path | str | None = None,
+        thresholds: str | Dict[str, float] | None = None,
+        ttl_seconds: float | None = None,
+        max_entries: int | None = None,
+        audit_rate: float | None = None,
+        audit_logger: Any = None,
+    ) -> None:
+        self.settings = settings or get_settings()
+        self.db_path = Path(db_path or self.settings.DB_PATH)
+        self.thresholds = parse_thresholds(
+            self.settings.LLM_SEMANTIC_CACHE_THRESHOLDS if thresholds is None else thresholds
+        )
+        self.ttl_seconds = float(self.settings.LLM_CACHE_TTL_SECONDS if ttl_seconds is None else ttl_seconds)
+        self.max_entries = int(self.settings.LLM_CACHE_MAX_ENTRIES if max_entries is None else max_entries)
+        self.audit_rate = float(self.settings.LLM_SEMANTIC_CACHE_AUDIT_RATE if audit_rate is None else audit_rate)
+        self._encoder = encoder
+        self._audit = audit_logger
+        self._lock = threading.Lock()
+        self._scopes: Dict[str, _Scope] = {}
+        self._stats: Dict[str, Dict[str, float]] = {}
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute(SEMANTIC_CACHE_TABLE)
+            conn.execute(SEMANTIC_CACHE_INDEX)
+            conn.commit()
+
+    def enabled_for(self, agent: str | None) -> bool:
+        return agent is not None and agent.lower() in self.thresholds
+
+    @staticmethod
+    def scope(agent: str, provider: str, model: str, system: str, max_tokens: int) -> str:
+        payload = json.dumps([agent.lower(), provider, model, system, int(max_tokens)], ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def embed(self, prompt: str) -> np.ndarray:
+        if self._encoder is None:
+            self._encoder = rag_embedding_model(self.settings)
+        vector = self._encoder.encode([normalise_prompt(prompt)], convert_to_numpy=True, normalize_embeddings=True)
+        return np.asarray(vector, dtype=np.float32)[0]
+
+    def lookup(self, agent: str, scope: str, vector: np.ndarray) -> Optional[SemanticHit]:
+        "Nearest earlier prompt of ``scope`` if it clears ``agent``'s threshold."
+        threshold = self.thresholds[agent.lower()]
+        now = time.time()
+        with self._lock:
+            state = self._load(scope)
+            best, similarity = -1, -1.0
+            # rows embedded by a different model (other width) can never match
+            if state.vectors is not None and len(state.ids) and state.vectors.shape[1] == vector.shape[0]:
+                sims = state.vectors @ vector
+                if self.ttl_seconds > 0:
+                    sims[np.asarray(state.created) < now - self.ttl_seconds] = -1.0
+                best = int(np.argmax(sims))
+                similarity = float(sims[best])
+            hit = similarity >= threshold
+            self._record(agent, hit, similarity if hit else None)
+            if not hit:
+                return None
+            row_id = state.ids[best]
+        with sqlite3.connect(self.db_path) as conn:
+            row = conn.execute(
+                "SELECT response, provider, model, prompt_tokens, completion_tokens, prompt "
+                "FROM llm_semantic_cache WHERE id = ?",
+                (row_id,),
+            ).fetchone()
+            if row is None:  # evicted by another process
+                return None
+            conn.execute(
+                "UPDATE llm_semantic_cache SET last_used_at = ?, hits = hits + 1 WHERE id = ?", (now, row_id)
+            )
+            conn.commit()
+        entry = CachedResponse(row[0], row[1], row[2], int(row[3]), int(row[4]))
+        return SemanticHit(entry, round(similarity, 4), row[5])
+
+    def put(self, agent: str, scope: str, prompt: str, vector: np.ndarray, entry: CachedResponse) -> None:
+        now = time.time()
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.execute(
+                """
+                INSERT INTO llm_semantic_cache(
+                    scope, agent, prompt, embedding, provider, model, response, prompt_tokens, completion_tokens,
+                    created_at, last_used_at
+                )
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    scope,
+                    agent.lower(),
+                    prompt,
+                    np.asarray(vector, dtype=np.float32).tobytes(),
+                    entry.provider,
+                    entry.model,
+                    entry.response,
+                    entry.prompt_tokens,
+                    entry.completion_tokens,
+                    now,
+                    now,
+                ),
+            )
+            row_id = int(cursor.lastrowid)
+            evicted = 0
+            if self.max_entries > 0:
+                evicted = conn.execute(
+                    "DELETE FROM llm_semantic_cache WHERE id IN ("
+                    "SELECT id FROM llm_semantic_cache ORDER BY last_used_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,),
+                ).rowcount
+            conn.commit()
+        with self._lock:
+            if evicted:
+                self._scopes.clear()  # reloaded from SQLite on next use
+                return
+            state = self._scopes.get(scope)
+            if state is not None:
+                row = np.asarray(vector, dtype=np.float32)[None, :]
+                state.vectors = row if state.vectors is None else np.vstack([state.vectors, row])
+                state.ids.append(row_id)
+                state.created.append(now)
+
+    def audit(self, agent: str, prompt: str, hit: SemanticHit) -> None:
+        "Write a sample of hits, with both prompts, to the audit log for false-hit review."
+        if self.audit_rate <= 0 or random.random() >= self.audit_rate:
+            return
+        if self._audit is None:
+            from app.governance.audit import AuditLogger
+
+            self._audit = AuditLogger(self.settings)
+        self._audit.log(
+            agent,
+            "semantic_cache_sample",
+            {
+                "similarity": hit.similarity,
+                "threshold": self.thresholds[agent.lower()],
+                "prompt": prompt[:2000],
+                "cached_prompt": hit.cached_prompt[:2000],
+                "response": hit.entry.response[:2000],
+            },
+        )
+
+    def clear(self) -> None:
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("DELETE FROM llm_semantic_cache")
+            conn.commit()
+        with self._lock:
+            self._scopes.clear()
+
+    def stats(self) -> Dict[str, object]:
+        with sqlite3.connect(self.db_path) as conn:
+            entries = dict(conn.execute("SELECT agent, COUNT(1) FROM llm_semantic_cache GROUP BY agent").fetchall())
+        with self._lock:
+            agents = {}
+            for agent, threshold in self.thresholds.items():
+                counters = self._stats.get(agent, {"hits": 0, "misses": 0, "similarity_sum": 0.0})
+                lookups = counters["hits"] + counters["misses"]
+                agents[agent] = {
+                    "threshold": threshold,
+                    "entries": int(entries.get(agent, 0)),
+                    "hits": int(counters["hits"]),
+                    "misses": int(counters["misses"]),
+                    "hit_rate": round(counters["hits"] / lookups, 4) if lookups else 0.0,
+                    "mean_hit_similarity": (
+                        round(counters["similarity_sum"] / counters["hits"], 4) if counters["hits"] else None
+                    ),
+                }
+        return {"agents": agents, "audit_rate": self.audit_rate, "ttl_seconds": self.ttl_seconds}
+
+    def _record(self, agent: str, hit: bool, similarity: float | None) -> None:
+        counters = self._stats.setdefault(agent.lower(), {"hits": 0, "misses": 0, "similarity_sum": 0.0})
+        counters["hits" if hit else "misses"] += 1
+        if similarity is not None:
+            counters["similarity_sum"] += similarity
+
+    def _load(self, scope: str) -> _Scope:
+        state = self._scopes.get(scope)
+        if state is None:
+            with sqlite3.connect(self.db_path) as conn:
+                rows = conn.execute(
+                    "SELECT id, created_at, embedding FROM llm_semantic_cache WHERE scope = ? ORDER BY id", (scope,)
+                ).fetchall()
+            state = _Scope([int(row[0]) for row in rows], [float(row[1]) for row in rows])
+            if rows:
+                state.vectors = np.stack([np.frombuffer(row[2], dtype=np.float32) for row in rows])
+            self._scopes[scope] = state
+        return state
+
+
+_RESPONSE_CACHE: LLMResponseCache | None = None
+_RESPONSE_CACHE_LOCK = threading.Lock()
+
+
+def get_response_cache() -> LLMResponseCache | None:
+    "Process-wide cache, or ``None`` unless ``LLM_CACHE_ENABLED`` is set."
+    global _RESPONSE_CACHE
+    settings = get_settings()
+    if not settings.LLM_CACHE_ENABLED:
+        return None
+    if _RESPONSE_CACHE is None:
+        with _RESPONSE_CACHE_LOCK:
+            if _RESPONSE_CACHE is None:
+                _RESPONSE_CACHE = LLMResponseCache(settings)
+    return _RESPONSE_CACHE
+
+
+_SEMANTIC_CACHE: SemanticResponseCache | None = None
+
+
+def get_semantic_cache() -> SemanticResponseCache | None:
+    "Process-wide semantic cache, or ``None`` unless ``LLM_SEMANTIC_CACHE_ENABLED`` is set."
+    global _SEMANTIC_CACHE
+    settings = get_settings()
+    if not settings.LLM_SEMANTIC_CACHE_ENABLED:
+        return None
+    if _SEMANTIC_CACHE is None:
+        with _RESPONSE_CACHE_LOCK:
+            if _SEMANTIC_CACHE is None:
+                _SEMANTIC_CACHE = SemanticResponseCache(settings)
+    return _SEMANTIC_CACHE
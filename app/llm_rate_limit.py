@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import asyncio
 import threading
 import time
 from collections import deque
@@ -42,24 +43,44 @@ class RateLimiter:
     def _ensure_bucket(self, key: str) -> Bucket | None:
         return self._buckets.get(key)
 
+    def _try_acquire(self, bucket: Bucket, key: str, block: bool) -> float:
+        "Take a slot and return 0.0, or return how long to wait before the oldest slot frees up."
+        with bucket.lock:
+            now = time.monotonic()
+            interval = 60.0 / bucket.limit if bucket.limit else 0.0
+            while bucket.timestamps and now - bucket.timestamps[0] >= interval:
+                bucket.timestamps.popleft()
+            if len(bucket.timestamps) < bucket.limit:
+                bucket.timestamps.append(now)
+                return 0.0
+            if not block:
+                raise RateLimitExceeded(f"Rate limit exceeded for key {key}")
+            oldest = bucket.timestamps[0]
+            return max(1e-6, interval - (now - oldest))
+
     def acquire(self, key: str, *, block: bool = True, timeout: float | None = None) -> None:
         bucket = self._ensure_bucket(key)
         if bucket is None:
             return
         deadline = time.monotonic() + timeout if timeout is not None else None
         while True:
-            with bucket.lock:
-                now = time.monotonic()
-                interval = 60.0 / bucket.limit if bucket.limit else 0.0
-                while bucket.timestamps and now - bucket.timestamps[0] >= interval:
-                    bucket.timestamps.popleft()
-                if len(bucket.timestamps) < bucket.limit:
-                    bucket.timestamps.append(now)
-                    return
-                if not block:
-                    raise RateLimitExceeded(f"Rate limit exceeded for key {key}")
-                oldest = bucket.timestamps[0]
-                sleep_for = max(0.0, interval - (now - oldest))
+            sleep_for = self._try_acquire(bucket, key, block)
+            if not sleep_for:
+                return
             if deadline is not None and time.monotonic() + sleep_for > deadline:
                 raise RateLimitExceeded(f"Rate limit timeout for key {key}")
             time.sleep(sleep_for)
+
+    async def aacquire(self, key: str, *, block: bool = True, timeout: float | None = None) -> None:
+        "``acquire`` for coroutines: waits with ``asyncio.sleep`` so the event loop keeps running."
+        bucket = self._ensure_bucket(key)
+        if bucket is None:
+            return
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while True:
+            sleep_for = self._try_acquire(bucket, key, block)
+            if not sleep_for:
+                return
+            if deadline is not None and time.monotonic() + sleep_for > deadline:
+                raise RateLimitExceeded(f"Rate limit timeout for key {key}")
+            await asyncio.sleep(sleep_for)
@@ -0,0 +1,145 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import threading
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Tuple
+
+from app.config import get_settings
+
+
+def request_key(provider: str, model: str, system: str, prompt: str, max_tokens: int, **scope: Any) -> str:
+    """Hash of one provider request. ``scope`` adds whatever else decides its outcome (agent, cache
+    and retry settings); without it the key is the one persisted by the response cache."""
+    fields: List[Any] = [provider, model, system, prompt, int(max_tokens)]
+    if scope:
+        fields.append(sorted(scope.items()))
+    payload = json.dumps(fields, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class _Flight:
+    future: Future
+    waiters: int = 0
+
+
+class SingleFlight:
+    """Collapses concurrent calls with the same key into one.
+
+    The first caller for a key (the leader) runs the work; callers that arrive while it is in
+    flight wait for and share its result or exception instead of repeating it. Sync (``do``) and
+    async (``ado``) callers never share a flight: a ``do`` on an event loop's thread would block the
+    loop an ``ado`` leader needs to finish.
+    Nothing is cached once the flight lands; the next caller leads a new one.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._flights: Dict[Tuple[bool, str], _Flight] = {}
+        self._leaders = 0
+        self._waiters = 0
+        self._shared_flights = 0
+        self._max_waiters = 0
+
+    def _join(self, key: Tuple[bool, str]) -> Tuple[_Flight, bool]:
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                flight.waiters += 1
+                self._waiters += 1
+                return flight, False
+            flight = self._flights[key] = _Flight(Future())
+            self._leaders += 1
+            return flight, True
+
+    def _land(self, key: Tuple[bool, str], flight: _Flight) -> None:
+        with self._lock:
+            self._flights.pop(key, None)
+            if flight.waiters:
+                self._shared_flights += 1
+                self._max_waiters = max(self._max_waiters, flight.waiters)
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        "``(result, shared)``; ``shared`` is true for callers that waited on another's call."
+        flight, leader = self._join((False, key))
+        if not leader:
+            return flight.future.result(), True
+        try:
+            result = fn()
+        except BaseException as exc:
+            self._land((False, key), flight)
+            flight.future.set_exception(exc)
+            raise
+        self._land((False, key), flight)
+        flight.future.set_result(result)
+        return result, False
+
+    def stream(self, key: str, fn: Callable[[], Iterator[str]]) -> Iterator[str]:
+        """``do`` for a stream of text chunks, sharing flights with ``do`` callers: the leader yields
+        the chunks as ``fn`` produces them, everyone else gets the joined text as one chunk."""
+        flight, leader = self._join((False, key))
+        if not leader:
+            yield flight.future.result()
+            return
+        chunks: List[str] = []
+        try:
+            for chunk in fn():
+                chunks.append(chunk)
+                yield chunk
+        except BaseException as exc:
+            self._land((False, key), flight)
+            if isinstance(exc, GeneratorExit):  # the leader stopped reading; its waiters get no text
+                flight.future.set_exception(RuntimeError("single-flight stream abandoned by its leader"))
+            else:
+                flight.future.set_exception(exc)
+            raise
+        self._land((False, key), flight)
+        flight.future.set_result("".join(chunks))
+
+    async def ado(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        flight, leader = self._join((True, key))
+        if not leader:
+            return await asyncio.wrap_future(flight.future), True
+        try:
+            result = await fn()
+        except BaseException as exc:
+            self._land((True, key), flight)
+            flight.future.set_exception(exc)
+            raise
+        self._land((True, key), flight)
+        flight.future.set_result(result)
+        return result, False
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            return {
+                "in_flight": len(self._flights),
+                "waiting": sum(flight.waiters for flight in self._flights.values()),
+                "leaders": self._leaders,
+                "waiters": self._waiters,
+                "shared_flights": self._shared_flights,
+                "max_waiters": self._max_waiters,
+                "mean_waiters_per_shared_flight": (
+                    round(self._waiters / self._shared_flights, 3) if self._shared_flights else 0.0
+                ),
+            }
+
+
+_SINGLE_FLIGHT: SingleFlight | None = None
+_SINGLE_FLIGHT_LOCK = threading.Lock()
+
+
+def get_single_flight() -> SingleFlight | None:
+    "Process-wide flight group for ``call_llm``, or ``None`` when ``LLM_SINGLE_FLIGHT`` is off."
+    global _SINGLE_FLIGHT
+    if not get_settings().LLM_SINGLE_FLIGHT:
+        return None
+    if _SINGLE_FLIGHT is None:
+        with _SINGLE_FLIGHT_LOCK:
+            if _SINGLE_FLIGHT is None:
+                _SINGLE_FLIGHT = SingleFlight()
+    return _SINGLE_FLIGHT
@@ -1,12 +1,19 @@
 from __future__ import annotations
 
+import contextvars
+import json
+import queue
+import threading
+import time
 import uuid
 from collections import deque
+from contextlib import asynccontextmanager
 from pathlib import Path
-from typing import Deque, Dict, Iterable, List, Tuple
+from typing import Any, AsyncIterator, Callable, Deque, Dict, Iterable, Iterator, List, Tuple
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
 import typer
 
@@ -21,14 +28,48 @@ from app.governance.policies import PolicyStore
 from app.metrics.llm_usage import LLMUsageLogger
 from app.metrics.api import router as metrics_router
 from app.llm_rate_limit import RateLimiter
-from app.rag.indexer import CorpusIndexer
+from app.rag.bootstrap import IndexBootstrap, get_index_bootstrap
+from app.rag.collection import discover_collections
+from app.rag.indexer import BuildProgress, CorpusIndexer, IndexedCorpus, ProgressCallback
 from app.rag.retriever import CorpusRetriever
+from app.rag.store import resolve_index_root
 from app.schemas.core import ExecutionResult, PlanStep, RunMetrics, Task
-from app.telemetry import collect_metrics, p95, reset_metrics
+from app.telemetry import collect_metrics, metrics_scope, p95
 from app.tools.github_client import get_github_client
 from app.tools.jira_client import get_jira_client
 
 
+def index_corpus(
+    settings: Settings,
+    *,
+    full: bool = False,
+    batch_size: int | None = None,
+    memory_limit_mb: int | None = None,
+    workers: int | None = None,
+    collection: str | None = None,
+    progress: ProgressCallback | None = None,
+) -> Dict[str, IndexedCorpus]:
+    """Build one collection's shard, or every collection found in the corpus when none is given.
+
+    Only the indexer runs: no retriever is created, so nothing builds or opens the index first.
+    """
+    corpus_dir = Path(__file__).resolve().parent / 'data' / 'corpus'
+    index_root, _ = resolve_index_root(Path(settings.RAG_INDEX_PATH))
+    names = [collection] if collection else discover_collections(corpus_dir, index_root)
+    built: Dict[str, IndexedCorpus] = {}
+    for name in names:
+        indexer = CorpusIndexer.from_settings(
+            settings,
+            corpus_dir,
+            collection=name,
+            batch_size=batch_size,
+            memory_limit_mb=memory_limit_mb,
+            workers=workers,
+        )
+        built[name] = indexer.build(full=full, progress=progress)
+    return built
+
+
 class TaskRequest(BaseModel):
     title: str
     description: str
@@ -44,13 +85,19 @@ class RunResponse(BaseModel):
 
 
 class OpsCopilotRuntime:
-    def __init__(self, settings: Settings | None = None, governed: bool = True) -> None:
+    def __init__(
+        self,
+        settings: Settings | None = None,
+        governed: bool = True,
+        *,
+        bootstrap: IndexBootstrap | None = None,
+    ) -> None:
         self.settings = settings or get_settings()
         self.audit = AuditLogger(self.settings)
         self.policies = PolicyStore(self.settings)
         self.approvals = ApprovalRepository(self.settings)
         self.cost_tracker = CostTracker(self.settings)
-        self.retriever = CorpusRetriever(self.settings)
+        self.retriever = CorpusRetriever(self.settings, bootstrap=bootstrap)
         self.llm_usage = LLMUsageLogger(self.settings)
         self.provider = get_llm_provider(self.settings)
         self.rate_limiter = RateLimiter()
@@ -110,13 +157,46 @@ class OpsCopilotRuntime:
         self.audit.log('Runtime', 'task_created', task.model_dump())
         return task
 
-    def run_task(self, task: Task, *, auto_approve: bool = False) -> RunResponse:
-        self.cost_tracker.reset()
-        reset_metrics()
-        plan = self.planner.act(task)
+    def run_task(
+        self,
+        task: Task,
+        *,
+        auto_approve: bool = False,
+        emit: Callable[[Dict[str, Any]], None] | None = None,
+        overlap: bool | None = None,
+    ) -> RunResponse:
+        """Plan, execute and review ``task``. ``emit`` (see ``stream_task``) receives planner
+        tokens, the plan, each step's executor output and each reviewer verdict as they happen.
+
+        With ``overlap`` (default ``PLAN_OVERLAP_EXECUTION``) the plan is streamed and each step
+        is executed and reviewed as soon as the planner has written it, while later steps are
+        still being generated. ``RunMetrics`` reports the run's critical path and what it would
+        have been with planning and steps back to back.
+
+        Costs and span timings are kept per run, so runs in progress on other threads don't
+        count towards this one's metrics or budget.
+        """
+        with self.cost_tracker.run_scope(), metrics_scope():
+            return self._run_task(task, auto_approve=auto_approve, emit=emit, overlap=overlap)
+
+    def _run_task(
+        self,
+        task: Task,
+        *,
+        auto_approve: bool,
+        emit: Callable[[Dict[str, Any]], None] | None,
+        overlap: bool | None,
+    ) -> RunResponse:
+        on_token = None if emit is None else (lambda text: emit({'event': 'plan_token', 'text': text}))
+        emit = emit or (lambda event: None)
+        overlap = self.settings.PLAN_OVERLAP_EXECUTION if overlap is None else overlap
+        started = time.perf_counter()
+        plan: List[PlanStep] = []
+        timings = {'planning_ms': 0.0, 'steps_ms': 0.0}
         results: List[ExecutionResult] = []
         hallucinations = 0
-        for step in plan:
+        for step in self._planned_steps(task, plan, timings, overlap=overlap, emit=emit, on_token=on_token):
+            step_started = time.perf_counter()
             if auto_approve and step.needs_approval:
                 self.approvals.ensure(step.id)
                 self.approvals.approve(step.id)
@@ -131,8 +211,13 @@ class OpsCopilotRuntime:
                     errors=[str(exc)],
                 )
                 results.append(result)
+                timings['steps_ms'] += (time.perf_counter() - step_started) * 1000
+                emit({'event': 'step', 'result': result.model_dump(mode='json')})
                 break
+            emit({'event': 'step', 'result': result.model_dump(mode='json')})
             approved, reason = self.reviewer.act(task, step, result)
+            timings['steps_ms'] += (time.perf_counter() - step_started) * 1000
+            emit({'event': 'review', 'step_id': step.id, 'approved': approved, 'reason': reason})
             if not approved:
                 result.success = False
                 if reason:
@@ -142,6 +227,7 @@ class OpsCopilotRuntime:
             if not result.citations:
                 hallucinations += 1
             results.append(result)
+        critical_path_ms = (time.perf_counter() - started) * 1000
 
         success_count = sum(1 for r in results if r.success)
         total_steps = max(1, len(plan))
@@ -152,11 +238,97 @@ class OpsCopilotRuntime:
             hallucination_rate=round(hallucinations / max(1, len(results)), 2),
             p95_latency_ms=p95(all_durations),
             total_cost_usd=round(self.cost_tracker.total_cost, 4),
+            critical_path_ms=round(critical_path_ms, 2),
+            critical_path_no_overlap_ms=round(timings['planning_ms'] + timings['steps_ms'], 2),
         )
         response = RunResponse(task=task, plan=plan, results=results, metrics=metrics)
         self.recent_runs.appendleft(response)
+        emit({'event': 'done', 'metrics': metrics.model_dump(mode='json')})
         return response
 
+    def _planned_steps(
+        self,
+        task: Task,
+        plan: List[PlanStep],
+        timings: Dict[str, float],
+        *,
+        overlap: bool,
+        emit: Callable[[Dict[str, Any]], None],
+        on_token: Callable[[str], None] | None,
+    ) -> Iterator[PlanStep]:
+        """Steps in plan order, appended to ``plan`` as they are planned. With ``overlap`` the
+        planner streams on a worker thread and steps arrive while it is still writing; closing
+        the iterator early still waits for planning to finish so ``plan`` is complete."""
+        started = time.perf_counter()
+        if not overlap:
+            plan.extend(self.planner.act(task, on_token=on_token))
+            timings['planning_ms'] = (time.perf_counter() - started) * 1000
+            emit({'event': 'plan', 'steps': [step.model_dump(mode='json') for step in plan]})
+            yield from list(plan)
+            return
+
+        planned: 'queue.Queue[Any]' = queue.Queue()
+        finished = object()
+
+        def run_planner() -> None:
+            try:
+                for step in self.planner.plan_stream(task, on_token=on_token):
+                    plan.append(step)
+                    emit({'event': 'plan_step', 'step': step.model_dump(mode='json')})
+                    planned.put(step)
+                timings['planning_ms'] = (time.perf_counter() - started) * 1000
+                emit({'event': 'plan', 'steps': [step.model_dump(mode='json') for step in plan]})
+            except Exception as exc:  # re-raised on the caller's thread
+                planned.put(exc)
+            finally:
+                planned.put(finished)
+
+        # the planner's spans belong to this run's metrics scope
+        context = contextvars.copy_context()
+        planner = threading.Thread(
+            target=context.run, args=(run_planner,), name=f'planner-{task.id}', daemon=True
+        )
+        planner.start()
+        try:
+            while True:
+                item = planned.get()
+                if item is finished:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            planner.join()
+
+    def stream_task(
+        self, task: Task, *, auto_approve: bool = False, overlap: bool | None = None
+    ) -> Iterator[Dict[str, Any]]:
+        """Events of ``run_task`` as they are produced: ``task``, then ``plan_token`` chunks,
+        ``plan_step`` per planned step (with overlap), ``step`` and ``review`` per executed step,
+        ``plan`` once planning is complete, and finally ``done`` (or ``error``). Without overlap
+        ``plan`` comes before the first ``step``.
+
+        The run happens on a worker thread so planner tokens reach the caller while the provider
+        is still streaming; if the caller stops reading, the run still completes.
+        """
+        events: 'queue.Queue[Dict[str, Any] | None]' = queue.Queue()
+
+        def run() -> None:
+            try:
+                self.run_task(task, auto_approve=auto_approve, emit=events.put, overlap=overlap)
+            except Exception as exc:  # surfaced as the last event
+                events.put({'event': 'error', 'error': f'{type(exc).__name__}: {exc}'})
+            finally:
+                events.put(None)
+
+        threading.Thread(target=run, name=f'task-stream-{task.id}', daemon=True).start()
+        yield {'event': 'task', 'task': task.model_dump(mode='json')}
+        while True:
+            event = events.get()
+            if event is None:
+                return
+            yield event
+
     def approve_step(self, step_id: str) -> Dict[str, str]:
         record = self.approvals.approve(step_id)
         return {'step_id': record.step_id, 'status': record.status, 'updated_at': record.updated_at}
@@ -164,9 +336,9 @@ class OpsCopilotRuntime:
     def pending_approvals(self) -> List[Dict[str, str]]:
         return [record.__dict__ for record in self.approvals.pending()]
 
-    def index_corpus(self) -> None:
-        corpus_dir = Path(__file__).resolve().parent / 'data' / 'corpus'
-        CorpusIndexer(corpus_dir=corpus_dir, index_path=self.settings.RAG_INDEX_PATH).build()
+    def index_corpus(self, **options: Any) -> Dict[str, IndexedCorpus]:
+        "``index_corpus`` with this runtime's settings; the live retriever picks the result up on reload."
+        return index_corpus(self.settings, **options)
 
     def llm_usage_summary(self) -> Dict[str, float]:
         return self.llm_usage.summary()
@@ -177,9 +349,43 @@ class OpsCopilotRuntime:
         return [asdict(record) for record in self.llm_usage.recent(limit)]
 
 
-runtime = OpsCopilotRuntime()
+_RUNTIME: OpsCopilotRuntime | None = None
+_RUNTIME_LOCK = threading.Lock()
+
+
+def get_runtime(*, background_index: bool = False) -> OpsCopilotRuntime:
+    """Process-wide runtime, created on first use rather than at import.
+
+    With ``background_index`` a missing index is built by the shared :class:`IndexBootstrap`
+    while the runtime serves degraded lexical retrieval; otherwise it is built synchronously.
+    The first call decides.
+    """
+    global _RUNTIME
+    if _RUNTIME is None:
+        with _RUNTIME_LOCK:
+            if _RUNTIME is None:
+                bootstrap = None
+                if background_index:
+                    bootstrap = get_index_bootstrap()
+                    bootstrap.start()
+                _RUNTIME = OpsCopilotRuntime(bootstrap=bootstrap)
+    return _RUNTIME
+
+
+def __getattr__(name: str) -> Any:
+    # ``app.main.runtime`` predates the lazy factory; keep it working for existing callers.
+    if name == 'runtime':
+        return get_runtime()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
-fastapi_app = FastAPI(title='Multi-Agent Ops Copilot')
+@asynccontextmanager
+async def lifespan(_: FastAPI) -> AsyncIterator[None]:
+    get_runtime(background_index=True)
+    yield
+
+
+fastapi_app = FastAPI(title='Multi-Agent Ops Copilot', lifespan=lifespan)
 fastapi_app.add_middleware(
     CORSMiddleware,
     allow_origins=['http://localhost:3000'],
@@ -201,14 +407,50 @@ def healthz() -> Dict[str, str]:
     return {'status': 'ok'}
 
 
+@fastapi_app.get('/readyz')
+def readyz() -> JSONResponse:
+    "503 while retrieval is degraded (index still building or embedding model not loaded)."
+    runtime = _RUNTIME
+    ready = runtime is not None and not runtime.retriever.degraded
+    body = {**get_index_bootstrap().status(), 'ready': ready, 'degraded': not ready}
+    return JSONResponse(body, status_code=200 if ready else 503)
+
+
+@fastapi_app.post('/admin/index/reload')
+def reload_index(force: bool = False) -> Dict[str, object]:
+    "Swap in the latest published RAG index generation without restarting this worker."
+    return get_runtime().retriever.reload(force=force)
+
+
+@fastapi_app.get('/admin/index/risk')
+def index_risk() -> Dict[str, object]:
+    "Corpus chunks flagged by the index-time injection scan and the sources kept out of results."
+    return get_runtime().retriever.risk_report()
+
+
 @fastapi_app.post('/tasks', response_model=RunResponse)
 def create_and_run_task(request: TaskRequest):
+    runtime = get_runtime()
     task = runtime.create_task(request)
     return runtime.run_task(task)
 
 
+@fastapi_app.post('/tasks/stream')
+def stream_task(request: TaskRequest, stream_format: str = Query('ndjson', alias='format')):
+    "Run a task and stream its events as NDJSON (default) or server-sent events (``?format=sse``)."
+    if stream_format not in ('ndjson', 'sse'):
+        raise HTTPException(status_code=400, detail='format must be ndjson or sse')
+    runtime = get_runtime()
+    events = runtime.stream_task(runtime.create_task(request))
+    if stream_format == 'sse':
+        body = (f"event: {event['event']}\ndata: {json.dumps(event)}\n\n" for event in events)
+        return StreamingResponse(body, media_type='text/event-stream')
+    return StreamingResponse((json.dumps(event) + '\n' for event in events), media_type='application/x-ndjson')
+
+
 @fastapi_app.post('/approvals/{step_id}:approve')
 def approve_step(step_id: str):
+    runtime = get_runtime()
     if not runtime.approvals.get(step_id):
         raise HTTPException(status_code=404, detail='Approval not found')
     return runtime.approve_step(step_id)
@@ -216,44 +458,113 @@ def approve_step(step_id: str):
 
 @fastapi_app.get('/approvals/pending')
 def approvals_pending():
-    return runtime.pending_approvals()
+    return get_runtime().pending_approvals()
 
 
 @fastapi_app.get('/runs/latest')
 def latest_runs():
-    return [run.model_dump() for run in runtime.recent_runs]
+    return [run.model_dump() for run in get_runtime().recent_runs]
 
 
 @fastapi_app.get('/metrics/llm/summary')
 def llm_usage_summary():
-    return runtime.llm_usage_summary()
+    return get_runtime().llm_usage_summary()
 
 
 @fastapi_app.get('/metrics/llm/recent')
 def llm_usage_recent(limit: int = 20):
-    return runtime.llm_usage_recent(limit)
+    return get_runtime().llm_usage_recent(limit)
 
 
 cli = typer.Typer(help='Ops Copilot CLI')
 
 
 @cli.command()
-def index():
-    "Build the RAG index from the local corpus."
-    runtime.index_corpus()
-    typer.echo('Corpus indexed successfully')
+def index(
+    full: bool = typer.Option(False, '--full', help='Re-embed every file, ignoring unchanged ones.'),
+    batch_size: int = typer.Option(0, '--batch-size', help='Chunks per encode batch (0 = settings).'),
+    memory_mb: int = typer.Option(0, '--memory-mb', help='Ceiling for buffered chunks and vectors (0 = settings).'),
+    workers: int = typer.Option(0, '--workers', help='Embedding worker processes (0 = settings).'),
+    collection: str = typer.Option('', '--collection', help='Only rebuild this collection (default: all).'),
+):
+    "Build the RAG index from the local corpus, one shard per collection."
+    last_report = [0.0]
+
+    def report(progress: BuildProgress) -> None:
+        now = time.monotonic()
+        if now - last_report[0] < 1.0 and progress.files_done < progress.files_total:
+            return
+        last_report[0] = now
+        typer.echo(
+            f'  {progress.files_done}/{progress.files_total} files, {progress.rows_written} chunks written, '
+            f'{progress.chunks_per_second:.1f} chunks/s'
+        )
+
+    built = index_corpus(
+        get_settings(),
+        full=full,
+        batch_size=batch_size or None,
+        memory_limit_mb=memory_mb or None,
+        workers=workers or None,
+        collection=collection or None,
+        progress=report,
+    )
+    for name, corpus in built.items():
+        stats = corpus.stats
+        typer.echo(
+            f'Collection {name!r} indexed successfully (generation {corpus.generation}): '
+            f'{stats.reused} chunks reused, {stats.embedded} embedded, {stats.removed} removed '
+            f'in {stats.elapsed_seconds:.2f}s ({stats.chunks_per_second:.1f} chunks/s)'
+        )
+        if stats.workers > 1 and stats.embedded:
+            typer.echo(
+                f'  {stats.workers} workers: {stats.worker_seconds / stats.embed_seconds:.2f}x serial encode time, '
+                f'scaling efficiency {stats.scaling_efficiency:.0%}'
+            )
+        duplicates = stats.exact_duplicates + stats.near_duplicates
+        if duplicates:
+            typer.echo(
+                f'  dedup: {duplicates} of {stats.chunks} chunks collapsed '
+                f'({stats.exact_duplicates} exact, {stats.near_duplicates} near), '
+                f'index {stats.dedup_ratio:.1%} smaller'
+            )
+
+
+@cli.command('reload-index')
+def reload_index_command(
+    url: str = typer.Option('http://localhost:8000', '--url', help='Base URL of the running API.'),
+    force: bool = typer.Option(False, '--force', help='Reopen the index even if the generation is unchanged.'),
+):
+    """Ask a running API worker to swap in the latest index generation.
+
+    Other workers behind the same URL pick it up on their next RAG_RELOAD_CHECK_SECONDS check.
+    """
+    import httpx
+
+    response = httpx.post(f"{url.rstrip('/')}/admin/index/reload", params={'force': force}, timeout=300.0)
+    response.raise_for_status()
+    result = response.json()
+    if result['swapped']:
+        typer.echo(f"Swapped index generation {result['previous']} -> {result['current']}")
+    else:
+        typer.echo(f"Index already at generation {result['current']}")
 
 
 @cli.command('run-scenarios')
-def run_scenarios():
+def run_scenarios(
+    batch: bool = typer.Option(
+        None, '--batch/--live', help='Send LLM calls as Batch API jobs (default: HARNESS_BATCH_MODE).'
+    ),
+):
     from app.evaluation.harness import run_harness
 
-    run_harness()
+    run_harness(batch=batch)
 
 
 @cli.command()
 def approve(step_id: str):
     "Approve a pending step by id."
+    runtime = get_runtime()
     if not runtime.approvals.get(step_id):
         raise typer.BadParameter('Unknown step id')
     record = runtime.approve_step(step_id)
@@ -264,6 +575,7 @@ def approve(step_id: str):
 def demo(title: str = 'Sample Task', description: str = 'Generate deployment checklist', risk_level: str = 'medium'):
     "Run a demo task directly from the CLI."
     request = TaskRequest(title=title, description=description, risk_level=risk_level, desired_outcome='Demo outcome')
+    runtime = get_runtime()
     task = runtime.create_task(request)
     response = runtime.run_task(task)
     typer.echo(response.model_dump_json(indent=2))
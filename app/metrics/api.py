@@ -9,6 +9,12 @@ from typing import Dict, Iterable, List
 from fastapi import APIRouter, Query
 
 from app.config import get_settings
+from app.llm_cache import get_response_cache, get_semantic_cache
+from app.llm_singleflight import get_single_flight
+from app.metrics.llm_usage import LLMUsageLogger
+from app.rag.batching import batching_stats
+from app.rag.cache import get_retrieval_cache
+from app.rag.models import get_model_registry
 
 router = APIRouter(prefix="/metrics", tags=["metrics"])
 
@@ -28,6 +34,7 @@ class LLMUsagePoint:
     total_tokens: int
     latency_ms: float
     cost_usd: float
+    cache_hit: bool
 
 
 @router.get("/llm/timeseries")
@@ -36,7 +43,8 @@ def llm_timeseries(limit: int = Query(200, ge=1, le=1000)) -> Dict[str, List[Dic
     with _connect() as conn:
         rows = conn.execute(
             """
-            SELECT created_at, provider, model, prompt_tokens, completion_tokens, total_tokens, latency_ms, cost_usd
+            SELECT created_at, provider, model, prompt_tokens, completion_tokens, total_tokens, latency_ms, cost_usd,
+                   cache_hit
             FROM llm_usage
             ORDER BY id DESC
             LIMIT ?
@@ -53,6 +61,7 @@ def llm_timeseries(limit: int = Query(200, ge=1, le=1000)) -> Dict[str, List[Dic
             total_tokens=row[5],
             latency_ms=row[6],
             cost_usd=row[7],
+            cache_hit=bool(row[8]),
         )
         for row in rows
     ]
@@ -60,6 +69,32 @@ def llm_timeseries(limit: int = Query(200, ge=1, le=1000)) -> Dict[str, List[Dic
     return {"points": [asdict(p) for p in points]}
 
 
+@router.get("/llm/cache")
+def llm_cache_stats() -> Dict[str, object]:
+    """Response cache hit rates and the spend they avoided, from ``llm_usage`` and the live caches."""
+    cache = get_response_cache()
+    semantic = get_semantic_cache()
+    return {
+        "enabled": cache is not None,
+        "semantic_enabled": semantic is not None,
+        "usage": LLMUsageLogger().cache_savings(),
+        "cache": cache.stats() if cache is not None else None,
+        "semantic": semantic.stats() if semantic is not None else None,
+        "generated_at": datetime.utcnow().isoformat(),
+    }
+
+
+@router.get("/llm/singleflight")
+def llm_single_flight_stats() -> Dict[str, object]:
+    """Identical in-flight LLM requests collapsed into one provider call, with waiter counts."""
+    flights = get_single_flight()
+    return {
+        "enabled": flights is not None,
+        **(flights.stats() if flights is not None else {}),
+        "generated_at": datetime.utcnow().isoformat(),
+    }
+
+
 @router.get("/governance/summary")
 def governance_summary() -> Dict[str, object]:
     """Summaries for approvals, reviewer rejections, hallucination events."""
@@ -92,3 +127,21 @@ def governance_summary() -> Dict[str, object]:
         "reviewer_outcomes": reviewer_series,
         "generated_at": datetime.utcnow().isoformat(),
     }
+
+
+@router.get("/rag/cache")
+def rag_cache_stats() -> Dict[str, object]:
+    """Hit, miss and eviction counters for the retrieval caches."""
+    return {**get_retrieval_cache().stats(), "generated_at": datetime.utcnow().isoformat()}
+
+
+@router.get("/rag/models")
+def rag_model_stats() -> Dict[str, object]:
+    """Embedding models loaded in this process, with load time and resident size."""
+    return {**get_model_registry().stats(), "generated_at": datetime.utcnow().isoformat()}
+
+
+@router.get("/rag/batching")
+def rag_batching_stats() -> Dict[str, object]:
+    """Queue depth and batch size histograms of the query micro-batchers."""
+    return {**batching_stats(), "generated_at": datetime.utcnow().isoformat()}
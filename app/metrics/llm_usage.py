@@ -20,6 +20,11 @@ PRICING_USD_PER_MILLION = {
 
 DEFAULT_PRICING = {"input": 0.2, "output": 0.8}
 
+# Calls answered through a provider's Batch API are logged as "<provider>-batch" and billed at
+# this fraction of the provider's list price.
+BATCH_PROVIDER_SUFFIX = "-batch"
+BATCH_PRICE_FACTOR = 0.5
+
 LLM_USAGE_TABLE = """
 CREATE TABLE IF NOT EXISTS llm_usage (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -30,7 +35,9 @@ CREATE TABLE IF NOT EXISTS llm_usage (
     total_tokens INTEGER NOT NULL,
     latency_ms REAL NOT NULL,
     cost_usd REAL NOT NULL,
-    created_at TEXT NOT NULL
+    created_at TEXT NOT NULL,
+    cache_hit INTEGER NOT NULL DEFAULT 0,
+    cache_layer TEXT
 );
 """
 
@@ -45,6 +52,8 @@ class UsageRecord:
     latency_ms: float
     cost_usd: float
     created_at: str
+    cache_hit: bool = False
+    cache_layer: Optional[str] = None
 
 
 class LLMUsageLogger:
@@ -57,10 +66,18 @@ class LLMUsageLogger:
     def _ensure_table(self) -> None:
         with sqlite3.connect(self.db_path) as conn:
             conn.execute(LLM_USAGE_TABLE)
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(llm_usage)")}
+            for column, ddl in (("cache_hit", "INTEGER NOT NULL DEFAULT 0"), ("cache_layer", "TEXT")):
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE llm_usage ADD COLUMN {column} {ddl}")
             conn.commit()
 
     def _pricing(self, provider: str, model: str) -> Dict[str, float]:
-        return PRICING_USD_PER_MILLION.get((provider.lower(), model.lower()), DEFAULT_PRICING)
+        provider = provider.lower()
+        if provider.endswith(BATCH_PROVIDER_SUFFIX):
+            listed = self._pricing(provider[: -len(BATCH_PROVIDER_SUFFIX)], model)
+            return {kind: price * BATCH_PRICE_FACTOR for kind, price in listed.items()}
+        return PRICING_USD_PER_MILLION.get((provider, model.lower()), DEFAULT_PRICING)
 
     def calculate_cost(self, provider: str, model: str, prompt_tokens: int, completion_tokens: int) -> float:
         pricing = self._pricing(provider, model)
@@ -77,9 +94,15 @@ class LLMUsageLogger:
         prompt_tokens: int,
         completion_tokens: int,
         latency_ms: float,
+        cache_hit: bool = False,
+        cache_layer: Optional[str] = None,
     ) -> None:
+        """Record one call. Cache hits keep the tokens of the cached response (the work saved)
+        but cost nothing and take no provider time; ``cache_layer`` says which cache answered."""
         total_tokens = prompt_tokens + completion_tokens
-        cost_usd = self.calculate_cost(provider, model, prompt_tokens, completion_tokens)
+        cost_usd = 0.0 if cache_hit else self.calculate_cost(provider, model, prompt_tokens, completion_tokens)
+        if cache_hit:
+            latency_ms = 0.0
         record = UsageRecord(
             provider=provider,
             model=model,
@@ -89,12 +112,20 @@ class LLMUsageLogger:
             latency_ms=latency_ms,
             cost_usd=cost_usd,
             created_at=datetime.utcnow().isoformat(),
+            cache_hit=cache_hit,
+            cache_layer=cache_layer if cache_hit else None,
         )
         with sqlite3.connect(self.db_path) as conn:
             conn.execute(
                 """
-                INSERT INTO llm_usage(provider, model, prompt_tokens, completion_tokens, total_tokens, latency_ms, cost_usd, created_at)
-                VALUES (:provider, :model, :prompt_tokens, :completion_tokens, :total_tokens, :latency_ms, :cost_usd, :created_at)
+                INSERT INTO llm_usage(
+                    provider, model, prompt_tokens, completion_tokens, total_tokens, latency_ms, cost_usd, created_at,
+                    cache_hit, cache_layer
+                )
+                VALUES (
+                    :provider, :model, :prompt_tokens, :completion_tokens, :total_tokens, :latency_ms, :cost_usd,
+                    :created_at, :cache_hit, :cache_layer
+                )
                 """,
                 record.__dict__,
             )
@@ -103,24 +134,53 @@ class LLMUsageLogger:
     def recent(self, limit: int = 20) -> Iterable[UsageRecord]:
         with sqlite3.connect(self.db_path) as conn:
             rows = conn.execute(
-                "SELECT provider, model, prompt_tokens, completion_tokens, total_tokens, latency_ms, cost_usd, created_at "
+                "SELECT provider, model, prompt_tokens, completion_tokens, total_tokens, latency_ms, cost_usd, created_at, "
+                "cache_hit, cache_layer "
                 "FROM llm_usage ORDER BY id DESC LIMIT ?",
                 (limit,),
             ).fetchall()
         for row in rows:
-            yield UsageRecord(*row)
+            yield UsageRecord(*row[:-2], cache_hit=bool(row[-2]), cache_layer=row[-1])
 
     def summary(self) -> Dict[str, float]:
         with sqlite3.connect(self.db_path) as conn:
             row = conn.execute(
-                "SELECT COUNT(1), SUM(total_tokens), SUM(cost_usd), AVG(latency_ms) FROM llm_usage"
+                "SELECT COUNT(1), SUM(total_tokens), SUM(cost_usd), AVG(latency_ms), SUM(cache_hit) FROM llm_usage"
             ).fetchone()
         if not row or row[0] is None:
-            return {"runs": 0, "tokens": 0.0, "cost_usd": 0.0, "avg_latency_ms": 0.0}
-        runs, tokens, cost, latency = row
+            return {"runs": 0, "tokens": 0.0, "cost_usd": 0.0, "avg_latency_ms": 0.0, "cache_hits": 0}
+        runs, tokens, cost, latency, cache_hits = row
         return {
             "runs": int(runs),
             "tokens": float(tokens or 0.0),
             "cost_usd": round(float(cost or 0.0), 6),
             "avg_latency_ms": round(float(latency or 0.0), 2),
+            "cache_hits": int(cache_hits or 0),
+        }
+
+    def cache_savings(self) -> Dict[str, object]:
+        "Calls answered from the response caches and what they would have cost at list price, per layer."
+        with sqlite3.connect(self.db_path) as conn:
+            rows = conn.execute(
+                "SELECT COALESCE(cache_layer, 'exact'), provider, model, COUNT(1), SUM(prompt_tokens), "
+                "SUM(completion_tokens) FROM llm_usage WHERE cache_hit = 1 GROUP BY 1, provider, model"
+            ).fetchall()
+            total = conn.execute("SELECT COUNT(1) FROM llm_usage").fetchone()[0]
+        layers: Dict[str, Dict[str, float]] = {}
+        for layer, provider, model, hits, prompt_tokens, completion_tokens in rows:
+            entry = layers.setdefault(layer, {"cache_hits": 0, "saved_usd": 0.0})
+            entry["cache_hits"] += int(hits)
+            entry["saved_usd"] += self.calculate_cost(
+                provider, model, int(prompt_tokens or 0), int(completion_tokens or 0)
+            )
+        for entry in layers.values():
+            entry["hit_rate"] = round(entry["cache_hits"] / total, 4) if total else 0.0
+            entry["saved_usd"] = round(entry["saved_usd"], 6)
+        hits = sum(entry["cache_hits"] for entry in layers.values())
+        return {
+            "calls": int(total or 0),
+            "cache_hits": hits,
+            "hit_rate": round(hits / total, 4) if total else 0.0,
+            "saved_usd": round(sum(entry["saved_usd"] for entry in layers.values()), 6),
+            "layers": layers,
         }
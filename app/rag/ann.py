@@ -0,0 +1,161 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Dict, Protocol, Tuple
+
+import numpy as np
+
+from app.rag.store import IndexSnapshot
+
+SearchHits = Tuple[np.ndarray, np.ndarray]
+
+IVF_CENTROIDS = 'ivf.centroids'
+IVF_OFFSETS = 'ivf.offsets'
+IVF_IDS = 'ivf.ids'
+ASSIGN_BLOCK_ROWS = 8192
+
+
+class VectorSearch(Protocol):
+    def search(self, query: np.ndarray, top_k: int) -> SearchHits: ...
+
+    def search_many(self, queries: np.ndarray, top_k: int) -> SearchHits:
+        "Batched search; rows with fewer than ``top_k`` hits are padded with id -1."
+        ...
+
+
+def top_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    "Indices of the ``k`` highest scores in descending order, without sorting the whole array."
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    if k < len(scores):
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(len(scores))
+    return candidates[np.argsort(-scores[candidates], kind='stable')]
+
+
+def top_indices_many(scores: np.ndarray, k: int) -> np.ndarray:
+    "Row-wise :func:`top_indices` for a ``(queries, rows)`` score matrix."
+    queries, rows = scores.shape
+    k = min(k, rows)
+    if k <= 0:
+        return np.zeros((queries, 0), dtype=np.int64)
+    if k < rows:
+        candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        candidates = np.broadcast_to(np.arange(rows), (queries, rows))
+    order = np.argsort(-np.take_along_axis(scores, candidates, axis=1), axis=1, kind='stable')
+    return np.take_along_axis(candidates, order, axis=1)
+
+
+class ExactSearch:
+    "Brute-force inner-product search over the full matrix."
+
+    def __init__(self, embeddings: np.ndarray) -> None:
+        self.embeddings = embeddings
+
+    def search(self, query: np.ndarray, top_k: int) -> SearchHits:
+        scores = self.embeddings @ query
+        ranked = top_indices(scores, top_k)
+        return ranked, scores[ranked]
+
+    def search_many(self, queries: np.ndarray, top_k: int) -> SearchHits:
+        scores = queries @ self.embeddings.T
+        ranked = top_indices_many(scores, top_k)
+        return ranked, np.take_along_axis(scores, ranked, axis=1)
+
+
+@dataclass
+class IVFLists:
+    centroids: np.ndarray
+    offsets: np.ndarray
+    ids: np.ndarray
+
+    def as_arrays(self) -> Dict[str, np.ndarray]:
+        return {IVF_CENTROIDS: self.centroids, IVF_OFFSETS: self.offsets, IVF_IDS: self.ids}
+
+
+def build_ivf(
+    embeddings: np.ndarray,
+    n_lists: int | None = None,
+    *,
+    iterations: int = 10,
+    sample_per_list: int = 256,
+    seed: int = 0,
+) -> IVFLists:
+    """Train a spherical k-means coarse quantizer and bucket every row under its nearest centroid.
+
+    Training runs on a bounded sample (``sample_per_list`` rows per list) so build time stays
+    roughly linear in corpus size; the final assignment pass covers every row.
+    """
+    rows = embeddings.shape[0]
+    if rows == 0:
+        raise ValueError('cannot build an IVF index over an empty matrix')
+    n_lists = n_lists or max(1, int(np.sqrt(rows)))
+    n_lists = min(n_lists, rows)
+    rng = np.random.default_rng(seed)
+    sample_size = min(rows, n_lists * sample_per_list)
+    sample_ids = np.sort(rng.choice(rows, size=sample_size, replace=False))
+    sample = np.asarray(embeddings[sample_ids], dtype=np.float32)
+    centroids = sample[rng.choice(sample_size, size=n_lists, replace=False)].copy()
+
+    for _ in range(iterations):
+        assignment = np.argmax(sample @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, sample)
+        counts = np.bincount(assignment, minlength=n_lists)
+        empty = counts == 0
+        if empty.any():
+            sums[empty] = sample[rng.choice(sample_size, size=int(empty.sum()))]
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        centroids = sums / np.maximum(norms, 1e-12)
+
+    assignment = np.empty(rows, dtype=np.int64)
+    for start in range(0, rows, ASSIGN_BLOCK_ROWS):
+        block = np.asarray(embeddings[start : start + ASSIGN_BLOCK_ROWS], dtype=np.float32)
+        assignment[start : start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    ids = np.argsort(assignment, kind='stable').astype(np.int64)
+    offsets = np.zeros(n_lists + 1, dtype=np.int64)
+    np.cumsum(np.bincount(assignment, minlength=n_lists), out=offsets[1:])
+    return IVFLists(centroids=centroids.astype(np.float32), offsets=offsets, ids=ids)
+
+
+class IVFSearch:
+    "Inverted-file search: scores ``nprobe`` nearest lists exactly and ignores the rest."
+
+    def __init__(self, embeddings: np.ndarray, lists: IVFLists, *, nprobe: int = 8) -> None:
+        self.embeddings = embeddings
+        self.lists = lists
+        self.nprobe = max(1, nprobe)
+
+    @classmethod
+    def from_snapshot(cls, snapshot: IndexSnapshot, *, nprobe: int = 8) -> 'IVFSearch | None':
+        centroids = snapshot.load_array(IVF_CENTROIDS)
+        offsets = snapshot.load_array(IVF_OFFSETS)
+        ids = snapshot.load_array(IVF_IDS)
+        if centroids is None or offsets is None or ids is None:
+            return None
+        lists = IVFLists(centroids=np.asarray(centroids), offsets=np.asarray(offsets), ids=ids)
+        return cls(snapshot.embeddings, lists, nprobe=nprobe)
+
+    def search(self, query: np.ndarray, top_k: int) -> SearchHits:
+        probes = top_indices(self.lists.centroids @ query, self.nprobe)
+        offsets = self.lists.offsets
+        parts = [self.lists.ids[offsets[p] : offsets[p + 1]] for p in probes]
+        candidates = np.sort(np.concatenate(parts)) if parts else np.zeros(0, dtype=np.int64)
+        if not len(candidates):
+            return candidates, np.zeros(0, dtype=np.float32)
+        scores = self.embeddings[candidates] @ query
+        best = top_indices(scores, top_k)
+        return candidates[best], scores[best]
+
+    def search_many(self, queries: np.ndarray, top_k: int) -> SearchHits:
+        # Probed lists differ per query, so candidates cannot share one product.
+        ids = np.full((len(queries), top_k), -1, dtype=np.int64)
+        scores = np.full((len(queries), top_k), -np.inf, dtype=np.float32)
+        for row, query in enumerate(queries):
+            hit_ids, hit_scores = self.search(query, top_k)
+            ids[row, : len(hit_ids)] = hit_ids
+            scores[row, : len(hit_scores)] = hit_scores
+        return ids, scores
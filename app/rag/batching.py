@@ -0,0 +1,189 @@
+from __future__ import annotations
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from app.rag.models import EmbeddingModel, QueryEncoderOptions, get_query_encoder
+
+HISTOGRAM_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+
+
+def _histogram() -> Dict[str, int]:
+    return {**{str(bound): 0 for bound in HISTOGRAM_BUCKETS}, f'{HISTOGRAM_BUCKETS[-1]}+': 0}
+
+
+def _observe(histogram: Dict[str, int], value: int) -> None:
+    "Count ``value`` in the first power-of-two bucket that holds it."
+    for bound in HISTOGRAM_BUCKETS:
+        if value <= bound:
+            histogram[str(bound)] += 1
+            return
+    histogram[f'{HISTOGRAM_BUCKETS[-1]}+'] += 1
+
+
+@dataclass
+class _Request:
+    texts: List[str]
+    future: Future
+    enqueued: float = field(default_factory=time.perf_counter)
+
+
+class EmbeddingBatcher:
+    """Coalesces encode requests from many threads into batched forward passes.
+
+    Callers ``submit`` texts and get a future; one worker thread takes the oldest request, keeps
+    collecting until the batch holds ``max_batch_size`` texts or ``max_wait_ms`` has passed since
+    that request arrived, then runs a single ``encode`` and hands every caller its own rows.
+    Concurrent ``/tasks`` requests thus share one forward pass instead of contending for torch's
+    intra-op threads with one query each. A request is never split across batches.
+    """
+
+    def __init__(
+        self,
+        model: Callable[[], EmbeddingModel],
+        *,
+        max_batch_size: int = 32,
+        max_wait_ms: float = 2.0,
+        name: str = 'embeddings',
+    ) -> None:
+        self.model = model
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self.name = name
+        self._queue: 'queue.Queue[_Request | None]' = queue.Queue()
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._batches = 0
+        self._texts = 0
+        self._wait_seconds = 0.0
+        self._max_queue_depth = 0
+        self._batch_sizes = _histogram()
+        self._queue_depths = _histogram()
+        self._thread = threading.Thread(target=self._run, name=f'embedding-batcher-{name}', daemon=True)
+        self._thread.start()
+
+    def submit(self, texts: Sequence[str]) -> Future:
+        "Queue ``texts`` for encoding; the future resolves to their unit-length float32 vectors."
+        request = _Request(list(texts), Future())
+        if not request.texts:
+            request.future.set_result(np.zeros((0, 0), dtype=np.float32))
+            return request.future
+        with self._lock:
+            depth = self._queue.qsize()
+            self._requests += 1
+            self._max_queue_depth = max(self._max_queue_depth, depth + 1)
+            _observe(self._queue_depths, depth + 1)
+        self._queue.put(request)
+        return request.future
+
+    def encode(self, texts: Sequence[str], timeout: float | None = None) -> np.ndarray:
+        return self.submit(texts).result(timeout)
+
+    def close(self) -> None:
+        self._queue.put(None)
+        self._thread.join(timeout=5)
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            return {
+                'name': self.name,
+                'max_batch_size': self.max_batch_size,
+                'max_wait_ms': self.max_wait * 1000,
+                'requests': self._requests,
+                'batches': self._batches,
+                'texts': self._texts,
+                'mean_batch_size': round(self._texts / self._batches, 3) if self._batches else 0.0,
+                'mean_wait_ms': round(1000 * self._wait_seconds / self._requests, 3) if self._requests else 0.0,
+                'queue_depth': self._queue.qsize(),
+                'max_queue_depth': self._max_queue_depth,
+                'batch_size_histogram': dict(self._batch_sizes),
+                'queue_depth_histogram': dict(self._queue_depths),
+            }
+
+    def _run(self) -> None:
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch, closing = self._gather(first)
+            self._encode(batch)
+            if closing:
+                return
+
+    def _gather(self, first: _Request) -> Tuple[List[_Request], bool]:
+        batch = [first]
+        size = len(first.texts)
+        deadline = first.enqueued + self.max_wait
+        while size < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                request = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if request is None:
+                return batch, True
+            batch.append(request)
+            size += len(request.texts)
+        return batch, False
+
+    def _encode(self, batch: List[_Request]) -> None:
+        texts = [text for request in batch for text in request.texts]
+        started = time.perf_counter()
+        with self._lock:
+            self._batches += 1
+            self._texts += len(texts)
+            self._wait_seconds += sum(started - request.enqueued for request in batch)
+            _observe(self._batch_sizes, len(texts))
+        try:
+            vectors = np.asarray(
+                self.model().encode(
+                    texts, batch_size=len(texts), convert_to_numpy=True, normalize_embeddings=True
+                ),
+                dtype=np.float32,
+            )
+        except Exception as exc:  # every caller in the batch sees the failure
+            for request in batch:
+                request.future.set_exception(exc)
+            return
+        offset = 0
+        for request in batch:
+            request.future.set_result(vectors[offset : offset + len(request.texts)])
+            offset += len(request.texts)
+
+
+_BATCHERS: Dict[str, EmbeddingBatcher] = {}
+_BATCHERS_LOCK = threading.Lock()
+
+
+def get_embedding_batcher(
+    name: str,
+    options: QueryEncoderOptions | None = None,
+    *,
+    max_batch_size: int = 32,
+    max_wait_ms: float = 2.0,
+) -> EmbeddingBatcher:
+    "Process-wide batcher for queries against an index built with ``name``."
+    key = name if options is None else f'{name}@{options.key}'
+    with _BATCHERS_LOCK:
+        batcher = _BATCHERS.get(key)
+        if batcher is None:
+            batcher = EmbeddingBatcher(
+                lambda: get_query_encoder(name, options),
+                max_batch_size=max_batch_size,
+                max_wait_ms=max_wait_ms,
+                name=key,
+            )
+            _BATCHERS[key] = batcher
+        return batcher
+
+
+def batching_stats() -> Dict[str, object]:
+    with _BATCHERS_LOCK:
+        batchers = list(_BATCHERS.values())
+    return {'batchers': [batcher.stats() for batcher in batchers]}
@@ -0,0 +1,122 @@
+from __future__ import annotations
+
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, List
+
+from app.config import Settings, get_settings
+from app.rag.collection import DEFAULT_COLLECTION, collection_index_root, discover_collections
+from app.rag.indexer import DEFAULT_CORPUS_DIR, CorpusIndexer
+from app.rag.models import get_embedding_model, get_query_encoder, query_encoder_options, warm_up
+from app.rag.store import IndexStore, resolve_index_root
+
+
+def ensure_index(
+    settings: Settings, corpus_dir: Path = DEFAULT_CORPUS_DIR, collection: str = DEFAULT_COLLECTION
+) -> IndexStore:
+    "Return the store for ``collection``, migrating a legacy pickle or building it if missing."
+    index_root, legacy_path = resolve_index_root(Path(settings.RAG_INDEX_PATH))
+    if collection != DEFAULT_COLLECTION:
+        legacy_path = None
+    store = IndexStore(collection_index_root(index_root, collection))
+    if not store.exists() and not (legacy_path and store.migrate_legacy(legacy_path)):
+        CorpusIndexer.from_settings(settings, corpus_dir, collection=collection).build()
+    return store
+
+
+def ensure_collections(settings: Settings, corpus_dir: Path = DEFAULT_CORPUS_DIR) -> Dict[str, IndexStore]:
+    "``ensure_index`` for every collection found in the corpus or the index root."
+    index_root, _ = resolve_index_root(Path(settings.RAG_INDEX_PATH))
+    return {
+        name: ensure_index(settings, corpus_dir, name) for name in discover_collections(corpus_dir, index_root)
+    }
+
+
+class IndexBootstrap:
+    """Prepares the RAG index off the request path.
+
+    ``start`` launches a daemon thread that builds (or migrates) any missing collection shard,
+    then loads the embedding model and warms up the query encoder; callbacks registered with
+    ``on_ready`` run once that finishes, so retrievers can switch from degraded lexical search to
+    the full index.
+    """
+
+    def __init__(self, settings: Settings | None = None) -> None:
+        self.settings = settings or get_settings()
+        self.state = 'idle'
+        self.error: str | None = None
+        self.started_at: float | None = None
+        self.finished_at: float | None = None
+        self._ready = threading.Event()
+        self._listeners: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set()
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is not None:
+                return
+            self.state = 'building'
+            self.started_at = time.monotonic()
+            self._thread = threading.Thread(target=self._run, name='rag-index-bootstrap', daemon=True)
+            self._thread.start()
+
+    def wait(self, timeout: float | None = None) -> bool:
+        return self._ready.wait(timeout)
+
+    def on_ready(self, callback: Callable[[], None]) -> None:
+        "Run ``callback`` once the index is ready; immediately if it already is."
+        with self._lock:
+            if self.state != 'ready':
+                self._listeners.append(callback)
+                return
+        callback()
+
+    def status(self) -> Dict[str, object]:
+        elapsed = None
+        if self.started_at is not None:
+            elapsed = round((self.finished_at or time.monotonic()) - self.started_at, 3)
+        return {'state': self.state, 'ready': self.ready, 'error': self.error, 'elapsed_seconds': elapsed}
+
+    def _run(self) -> None:
+        try:
+            store = ensure_collections(self.settings)[DEFAULT_COLLECTION]
+            if self.settings.RAG_RETRIEVAL_MODE.lower() != 'lexical':
+                model_name = store.read_manifest().model_name
+                get_embedding_model(model_name)
+                warm_up(get_query_encoder(model_name, query_encoder_options(self.settings)))
+        except Exception as exc:  # surfaced through /readyz
+            with self._lock:
+                self.state = 'failed'
+                self.error = f'{type(exc).__name__}: {exc}'
+                self.finished_at = time.monotonic()
+            return
+        with self._lock:
+            self.state = 'ready'
+            self.finished_at = time.monotonic()
+            listeners, self._listeners = self._listeners, []
+        for callback in listeners:
+            try:
+                callback()
+            except Exception as exc:  # pragma: no cover - one bad listener must not block the rest
+                self.error = f'ready callback failed: {exc}'
+        # Set last so ``wait`` returns only after every listener has switched over.
+        self._ready.set()
+
+
+_INDEX_BOOTSTRAP: IndexBootstrap | None = None
+_BOOTSTRAP_LOCK = threading.Lock()
+
+
+def get_index_bootstrap() -> IndexBootstrap:
+    global _INDEX_BOOTSTRAP
+    if _INDEX_BOOTSTRAP is None:
+        with _BOOTSTRAP_LOCK:
+            if _INDEX_BOOTSTRAP is None:
+                _INDEX_BOOTSTRAP = IndexBootstrap()
+    return _INDEX_BOOTSTRAP
@@ -0,0 +1,119 @@
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Tuple
+
+from app.config import get_settings
+
+
+def normalise_query(query: str | None) -> str:
+    "Collapse whitespace so trivially different spellings of a query share cache entries."
+    return ' '.join((query or '').split())
+
+
+class LRUCache:
+    "Thread-safe LRU map bounded by entry count and/or an approximate byte budget."
+
+    def __init__(self, *, max_entries: int | None = None, max_bytes: int | None = None) -> None:
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._items: 'OrderedDict[Hashable, Tuple[Any, int]]' = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries != 0 and self.max_bytes != 0
+
+    def get(self, key: Hashable) -> Any | None:
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def put(self, key: Hashable, value: Any, size: int = 0) -> None:
+        if not self.enabled or (self.max_bytes is not None and size > self.max_bytes):
+            return
+        with self._lock:
+            previous = self._items.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[1]
+            self._items[key] = (value, size)
+            self._bytes += size
+            while self._items and (
+                (self.max_entries is not None and len(self._items) > self.max_entries)
+                or (self.max_bytes is not None and self._bytes > self.max_bytes)
+            ):
+                _, (_, evicted_size) = self._items.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, int | None]:
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self._items),
+                'bytes': self._bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+            }
+
+
+class RetrievalCache:
+    """Process-wide query-vector and top-k result caches shared by every retriever.
+
+    Entries are only valid for one published index generation; ``observe_index`` drops both
+    caches as soon as a different generation of the same index is seen.
+    """
+
+    def __init__(self, *, vector_bytes: int, result_entries: int) -> None:
+        self.vectors = LRUCache(max_bytes=vector_bytes)
+        self.results = LRUCache(max_entries=result_entries)
+        self._versions: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def observe_index(self, root: str, generation: int) -> None:
+        with self._lock:
+            known = self._versions.get(root)
+            self._versions[root] = generation
+        if known is not None and known != generation:
+            self.invalidate()
+
+    def invalidate(self) -> None:
+        self.vectors.clear()
+        self.results.clear()
+
+    def stats(self) -> Dict[str, Dict[str, int | None]]:
+        return {'query_vectors': self.vectors.stats(), 'results': self.results.stats()}
+
+
+_RETRIEVAL_CACHE: RetrievalCache | None = None
+_CACHE_LOCK = threading.Lock()
+
+
+def get_retrieval_cache() -> RetrievalCache:
+    global _RETRIEVAL_CACHE
+    if _RETRIEVAL_CACHE is None:
+        with _CACHE_LOCK:
+            if _RETRIEVAL_CACHE is None:
+                settings = get_settings()
+                _RETRIEVAL_CACHE = RetrievalCache(
+                    vector_bytes=settings.RAG_QUERY_CACHE_BYTES,
+                    result_entries=settings.RAG_RESULT_CACHE_ENTRIES,
+                )
+    return _RETRIEVAL_CACHE
@@ -0,0 +1,66 @@
+from __future__ import annotations
+
+import re
+from pathlib import Path
+from typing import List
+
+import numpy as np
+
+from app.rag.store import IndexStore
+
+DEFAULT_COLLECTION = 'default'
+COLLECTIONS_DIR = 'collections'
+CENTROID_ARRAY = 'collection.centroid'
+CENTROID_BLOCK_ROWS = 16384
+_NAME = re.compile(r'^[A-Za-z0-9][A-Za-z0-9_.-]*$')
+
+
+def validate_collection(name: str) -> str:
+    if not _NAME.match(name):
+        raise ValueError(f"Invalid collection name '{name}'; use letters, digits, '.', '_' or '-'")
+    return name
+
+
+def collection_corpus_dir(corpus_dir: Path, collection: str) -> Path:
+    "Top-level markdown files form the default collection; each subdirectory is another one."
+    return corpus_dir if collection == DEFAULT_COLLECTION else corpus_dir / validate_collection(collection)
+
+
+def collection_index_root(index_root: Path, collection: str) -> Path:
+    "The default collection keeps the original index location; named ones get a shard under it."
+    if collection == DEFAULT_COLLECTION:
+        return index_root
+    return index_root / COLLECTIONS_DIR / validate_collection(collection)
+
+
+def source_prefix(collection: str) -> str:
+    return '' if collection == DEFAULT_COLLECTION else f'{collection}/'
+
+
+def discover_collections(corpus_dir: Path, index_root: Path | None = None) -> List[str]:
+    """Collection names, default first: corpus subdirectories holding markdown files plus any
+    shard already published under ``index_root`` (so a shard stays searchable without its corpus)."""
+    names = set()
+    if corpus_dir.is_dir():
+        names.update(
+            child.name
+            for child in corpus_dir.iterdir()
+            if child.is_dir() and _NAME.match(child.name) and any(child.glob('*.md'))
+        )
+    if index_root is not None and (index_root / COLLECTIONS_DIR).is_dir():
+        names.update(
+            child.name
+            for child in (index_root / COLLECTIONS_DIR).iterdir()
+            if child.is_dir() and _NAME.match(child.name) and IndexStore(child).exists()
+        )
+    names.discard(DEFAULT_COLLECTION)
+    return [DEFAULT_COLLECTION, *sorted(names)]
+
+
+def centroid(embeddings: np.ndarray) -> np.ndarray:
+    "Unit-length mean of the rows, summed in blocks so a memory-mapped matrix is not paged in at once."
+    total = np.zeros(embeddings.shape[1], dtype=np.float64)
+    for start in range(0, len(embeddings), CENTROID_BLOCK_ROWS):
+        total += np.asarray(embeddings[start : start + CENTROID_BLOCK_ROWS], dtype=np.float64).sum(axis=0)
+    norm = np.linalg.norm(total)
+    return (total / norm if norm else total).astype(np.float32)
@@ -0,0 +1,98 @@
+from __future__ import annotations
+
+import hashlib
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+MINHASH_PERMUTATIONS = 128
+MINHASH_BANDS = 32
+SHINGLE_WORDS = 3
+_MERSENNE_PRIME = (1 << 31) - 1
+_COEFFICIENTS = np.random.default_rng(0x5EED).integers(
+    1, _MERSENNE_PRIME, size=(2, MINHASH_PERMUTATIONS), dtype=np.uint64
+)
+
+
+def normalise_chunk(text: str) -> str:
+    "Case- and whitespace-insensitive form used for exact duplicate hashing."
+    return ' '.join(text.lower().split())
+
+
+def minhash(words: List[str], *, shingle: int = SHINGLE_WORDS) -> np.ndarray:
+    "MinHash signature of the word ``shingle``-grams; equal slots estimate Jaccard similarity."
+    grams = {' '.join(words[i : i + shingle]) for i in range(max(1, len(words) - shingle + 1))}
+    hashes = np.fromiter(
+        (int.from_bytes(hashlib.blake2b(gram.encode('utf-8'), digest_size=4).digest(), 'big') for gram in grams),
+        dtype=np.uint64,
+        count=len(grams),
+    )
+    a, b = _COEFFICIENTS
+    permuted = (hashes[:, None] * a + b) % _MERSENNE_PRIME
+    return permuted.min(axis=0).astype(np.uint32)
+
+
+class DuplicateIndex:
+    """Finds chunks that repeat an earlier chunk exactly or nearly (shared headers, footers,
+    copied policy paragraphs).
+
+    Exact matches compare a hash of the normalised text. Near matches compare MinHash signatures
+    of word shingles: candidates come from LSH buckets (``MINHASH_BANDS`` bands of the signature)
+    and count as duplicates when the estimated Jaccard similarity reaches ``threshold``. Chunks
+    shorter than ``min_words`` only take part in exact matching; a handful of shingles says too
+    little about them.
+    """
+
+    def __init__(self, *, threshold: float = 0.75, min_words: int = 8) -> None:
+        self.threshold = threshold
+        self.min_words = min_words
+        self._exact: Dict[bytes, str] = {}
+        self._buckets: Dict[Tuple[int, bytes], List[Tuple[np.ndarray, str]]] = {}
+
+    @property
+    def near_enabled(self) -> bool:
+        return 0 < self.threshold <= 1
+
+    def match(self, text: str) -> Tuple[str | None, str | None]:
+        "``(source, 'exact' | 'near')`` of an indexed duplicate of ``text``, or ``(None, None)``."
+        normalised = normalise_chunk(text)
+        source = self._exact.get(self._digest(normalised))
+        if source is not None:
+            return source, 'exact'
+        words = normalised.split()
+        if not self.near_enabled or len(words) < self.min_words:
+            return None, None
+        signature = minhash(words)
+        for key in self._keys(signature):
+            for candidate, source in self._buckets.get(key, ()):
+                if float(np.mean(candidate == signature)) >= self.threshold:
+                    return source, 'near'
+        return None, None
+
+    def add(self, text: str, source: str) -> None:
+        "Index ``text`` as the primary copy stored under ``source``."
+        normalised = normalise_chunk(text)
+        self._exact.setdefault(self._digest(normalised), source)
+        words = normalised.split()
+        if not self.near_enabled or len(words) < self.min_words:
+            return
+        signature = minhash(words)
+        for key in self._keys(signature):
+            self._buckets.setdefault(key, []).append((signature, source))
+
+    @staticmethod
+    def _keys(signature: np.ndarray) -> List[Tuple[int, bytes]]:
+        return [(band, rows.tobytes()) for band, rows in enumerate(np.split(signature, MINHASH_BANDS))]
+
+    @staticmethod
+    def _digest(normalised: str) -> bytes:
+        return hashlib.blake2b(normalised.encode('utf-8'), digest_size=16).digest()
+
+
+def alias_map(files: Dict[str, Dict[str, Any]]) -> Dict[str, Tuple[str, ...]]:
+    "Primary source -> sources whose chunks were collapsed into it, from the manifest ``files``."
+    aliases: Dict[str, List[str]] = {}
+    for entry in files.values():
+        for source, primary, _kind in entry.get('aliases', ()):
+            aliases.setdefault(primary, []).append(source)
+    return {primary: tuple(sources) for primary, sources in aliases.items()}
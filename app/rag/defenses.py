@@ -1,30 +1,325 @@
 from __future__ import annotations
 
+import hashlib
+import json
 import re
-from typing import List, Tuple
+import threading
+from dataclasses import astuple, dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Sequence, Tuple
 
-PATTERNS = {
-    "ignore_previous": re.compile(r"ignore\s+previous", re.IGNORECASE),
-    "override_system": re.compile(r"override\s+the\s+system", re.IGNORECASE),
-    "act_as_system": re.compile(r"act\s+as\s+system", re.IGNORECASE),
-    "change_rules": re.compile(r"change\s+the\s+rules", re.IGNORECASE),
-    "exfiltrate": re.compile(r"exfiltrate|leak\s+data", re.IGNORECASE),
-}
+import numpy as np
+import yaml
+
+from app.config import get_settings
+
+DEFAULT_INJECTION_PATTERNS = '''
+rules:
+  - name: ignore_previous
+    regex: 'ignore\\s+previous'
+  - name: override_system
+    phrases: [override the system]
+  - name: act_as_system
+    phrases: [act as system]
+  - name: change_rules
+    phrases: [change the rules]
+  - name: exfiltrate
+    phrases: [exfiltrate, leak data]
+'''
+
+DEFAULT_RULE_WEIGHT = 0.2
+REDACTED = '[redacted]'
+
+
+@dataclass(frozen=True)
+class InjectionRule:
+    """One entry of the pattern pack: literal ``phrases`` (case-insensitive, any run of whitespace
+    between words), a ``regex``, or both. ``weight`` is what a match adds to the injection score."""
+
+    name: str
+    regex: str | None = None
+    phrases: Tuple[str, ...] = ()
+    weight: float = DEFAULT_RULE_WEIGHT
+
+    @classmethod
+    def from_dict(cls, raw: Dict[str, Any]) -> 'InjectionRule':
+        phrases = raw.get('phrases') or ()
+        if isinstance(phrases, str):
+            phrases = (phrases,)
+        rule = cls(
+            name=str(raw['name']),
+            regex=raw.get('regex') or None,
+            phrases=tuple(str(phrase) for phrase in phrases),
+            weight=float(raw.get('weight', DEFAULT_RULE_WEIGHT)),
+        )
+        if not rule.regex and not rule.phrases:
+            raise ValueError(f'injection rule {rule.name!r} needs a regex or phrases')
+        if rule.regex:
+            try:
+                re.compile(rule.regex)
+            except re.error as exc:
+                raise ValueError(f'injection rule {rule.name!r}: bad regex: {exc}') from exc
+        return rule
+
+
+def _phrase_key(text: str) -> str:
+    return ' '.join(text.lower().split())
+
+
+def _build_trie(phrases: Iterable[str]) -> Dict[str, Any]:
+    "Prefix trie of normalised ``phrases``; a node that ends a phrase holds it under ``''``."
+    trie: Dict[str, Any] = {}
+    for phrase in phrases:
+        node = trie
+        for char in phrase:
+            node = node.setdefault(char, {})
+        node[''] = phrase
+    return trie
+
+
+def _trie_pattern(trie: Dict[str, Any]) -> str:
+    "Regex for ``trie`` that prefers the longest phrase; spaces match any run of whitespace."
+
+    def render(node: Dict[str, Any]) -> str:
+        terminal = '' in node
+        branches = [
+            (r'\s+' if char == ' ' else re.escape(char)) + render(child)
+            for char, child in sorted(node.items())
+            if char
+        ]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        if terminal:
+            return f'(?:{body})?' if len(branches) == 1 else body + '?'
+        return body
+
+    return render(trie)
+
+
+class InjectionEngine:
+    """Matches a whole pattern pack and reports every rule that fires.
+
+    All literal phrases share one prefix trie. It is compiled into a lookahead, so a single
+    ``finditer`` stops at every position where some phrase starts, overlapping ones included;
+    walking the trie along the longest match there yields every phrase that starts at that
+    position (``ignore`` as well as ``ignore previous``), and each phrase counts for every rule
+    that lists it. Regex rules are searched one by one, so a regex still fires where a phrase
+    (or another regex) matches the same text. Redaction replaces the union of all matched spans.
+    """
+
+    def __init__(self, rules: Sequence[InjectionRule]) -> None:
+        self.rules = list(rules)
+        self.names = [rule.name for rule in self.rules]
+        if len(set(self.names)) != len(self.names):
+            raise ValueError('injection rule names must be unique')
+        # changes with any edit to the pack (phrases, regexes, weights), not just its rule names
+        pack = json.dumps([astuple(rule) for rule in self.rules], ensure_ascii=False)
+        self.fingerprint = hashlib.sha256(pack.encode('utf-8')).hexdigest()
+        self._order = {name: idx for idx, name in enumerate(self.names)}
+        self._weights = {rule.name: rule.weight for rule in self.rules}
+        self._phrases: Dict[str, List[str]] = {}
+        for rule in self.rules:
+            for phrase in rule.phrases:
+                key = _phrase_key(phrase)
+                if key and rule.name not in self._phrases.setdefault(key, []):
+                    self._phrases[key].append(rule.name)
+        self._trie = _build_trie(self._phrases)
+        self._literal = (
+            re.compile(f'(?=({_trie_pattern(self._trie)}))', re.IGNORECASE) if self._phrases else None
+        )
+        self._regexes = [(rule.name, re.compile(rule.regex, re.IGNORECASE)) for rule in self.rules if rule.regex]
+
+    def _phrase_hits(self, text: str) -> Iterable[Tuple[str, int, int]]:
+        "``(phrase, start, end)`` of every phrase occurrence, overlapping ones included."
+        if self._literal is None:
+            return
+        for match in self._literal.finditer(text):
+            start, end = match.start(1), match.end(1)
+            node, pos = self._trie, start
+            while pos < end and node is not None:
+                if text[pos].isspace():
+                    node = node.get(' ')
+                    while pos < end and text[pos].isspace():
+                        pos += 1
+                else:
+                    node = node.get(text[pos].lower())
+                    pos += 1
+                if node is not None and '' in node:
+                    yield node[''], start, pos
+
+    def scan(self, text: str) -> List[Tuple[str, int, int]]:
+        "``(rule, start, end)`` of every match of every rule, by position then pack order."
+        if not text:
+            return []
+        hits = [
+            (name, start, end)
+            for phrase, start, end in self._phrase_hits(text)
+            for name in self._phrases[phrase]
+        ]
+        for name, pattern in self._regexes:
+            hits.extend((name, match.start(), match.end()) for match in pattern.finditer(text))
+        return sorted(hits, key=lambda hit: (hit[1], self._order[hit[0]], hit[2]))
+
+    def score(self, names: Iterable[str]) -> float:
+        return round(min(1.0, sum(self._weights[name] for name in names)), 2)
+
+    def _ordered(self, names: Iterable[str]) -> List[str]:
+        return sorted(set(names), key=self._order.__getitem__)
+
+    def detect(self, text: str) -> Tuple[float, List[str]]:
+        "``(score, rules)``; rules are listed once each, in pack order."
+        if not text:
+            return 0.0, []
+        fired = {name for phrase, _, _ in self._phrase_hits(text) for name in self._phrases[phrase]}
+        fired.update(name for name, pattern in self._regexes if name not in fired and pattern.search(text))
+        matches = self._ordered(fired)
+        return self.score(matches), matches
+
+    def redact(self, text: str) -> str:
+        return self.scan_and_redact(text)[2]
+
+    def scan_and_redact(self, text: str) -> Tuple[float, List[str], str]:
+        "``detect`` and ``redact`` from a single scan."
+        hits = self.scan(text)
+        if not hits:
+            return 0.0, [], text
+        pieces: List[str] = []
+        cursor = 0
+        span_start = span_end = -1
+        for _, start, end in hits:
+            if end <= start:
+                continue
+            if start > span_end:
+                if span_end >= 0:
+                    pieces += [text[cursor:span_start], REDACTED]
+                    cursor = span_end
+                span_start = start
+            span_end = max(span_end, end)
+        if span_end >= 0:
+            pieces += [text[cursor:span_start], REDACTED]
+            cursor = span_end
+        pieces.append(text[cursor:])
+        matches = self._ordered(name for name, _, _ in hits)
+        return self.score(matches), matches, ''.join(pieces)
+
+
+def load_injection_rules(path: Path | str) -> List[InjectionRule]:
+    "Rules from a YAML pattern pack; writes the built-in pack there when the file is missing."
+    path = Path(path)
+    if path.exists():
+        raw = yaml.safe_load(path.read_text(encoding='utf-8')) or {}
+    else:
+        raw = yaml.safe_load(DEFAULT_INJECTION_PATTERNS)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(DEFAULT_INJECTION_PATTERNS, encoding='utf-8')
+    return [InjectionRule.from_dict(entry) for entry in raw.get('rules', [])]
+
+
+_ENGINES: Dict[Path, InjectionEngine] = {}
+_ENGINES_LOCK = threading.Lock()
+
+
+def get_injection_engine(path: Path | str | None = None) -> InjectionEngine:
+    "Engine for the pattern pack at ``path`` (default ``INJECTION_PATTERNS_PATH``), compiled once."
+    key = Path(path or get_settings().INJECTION_PATTERNS_PATH).resolve()
+    engine = _ENGINES.get(key)
+    if engine is None:
+        with _ENGINES_LOCK:
+            engine = _ENGINES.get(key)
+            if engine is None:
+                engine = InjectionEngine(load_injection_rules(key))
+                _ENGINES[key] = engine
+    return engine
 
 
 def detect_prompt_injection(text: str) -> Tuple[float, List[str]]:
-    matches: List[str] = []
-    for name, pattern in PATTERNS.items():
-        if pattern.search(text or ''):
-            matches.append(name)
-    score = round(len(matches) / max(1, len(PATTERNS)), 2)
-    return score, matches
+    return get_injection_engine().detect(text or '')
 
 
 def sanitize(text: str) -> str:
-    if not text:
-        return text
-    cleaned = text
-    for pattern in PATTERNS.values():
-        cleaned = pattern.sub('[redacted]', cleaned)
-    return cleaned
+    return get_injection_engine().redact(text)
+
+
+RISK_SCORES = 'risk.scores'
+RISK_OFFSETS = 'risk.offsets'
+RISK_RULES = 'risk.rules'
+
+
+def rule_pack_fingerprint() -> str:
+    return get_injection_engine().fingerprint
+
+
+class ChunkRiskScanner:
+    """Runs the injection patterns over chunks once, at index time.
+
+    Per row it keeps the injection engine's score and the ids of the rules that fired
+    (CSR: ``offsets[row]:offsets[row + 1]`` slices ``rules``), so retrieval can drop or demote
+    flagged chunks without scanning anything per query.
+    """
+
+    def __init__(self) -> None:
+        self.engine = get_injection_engine()
+        self.rules = list(self.engine.names)
+        self._rule_ids = {name: idx for idx, name in enumerate(self.rules)}
+        self._scores: List[float] = []
+        self._offsets: List[int] = [0]
+        self._hits: List[int] = []
+
+    @property
+    def rows(self) -> int:
+        return len(self._scores)
+
+    @property
+    def flagged(self) -> int:
+        return sum(1 for score in self._scores if score > 0)
+
+    def add(self, documents: Iterable[str]) -> None:
+        for document in documents:
+            score, matches = self.engine.detect(document)
+            self._scores.append(score)
+            self._hits.extend(self._rule_ids[name] for name in matches)
+            self._offsets.append(len(self._hits))
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        return {
+            RISK_SCORES: np.asarray(self._scores, dtype=np.float32),
+            RISK_OFFSETS: np.asarray(self._offsets, dtype=np.int64),
+            RISK_RULES: np.asarray(self._hits, dtype=np.uint16),
+        }
+
+    def manifest_entry(self) -> Dict[str, Any]:
+        return {'rules': self.rules, 'fingerprint': self.engine.fingerprint, 'flagged': self.flagged}
+
+
+@dataclass
+class ChunkRisk:
+    "Index-time injection flags of one generation, as loaded by the retriever."
+
+    scores: np.ndarray
+    offsets: np.ndarray
+    hits: np.ndarray
+    rules: List[str]
+
+    @classmethod
+    def from_snapshot(cls, snapshot: Any) -> 'ChunkRisk | None':
+        entry = snapshot.manifest.extra.get('risk')
+        scores = snapshot.load_array(RISK_SCORES)
+        if not entry or scores is None:
+            return None
+        offsets, hits = snapshot.load_array(RISK_OFFSETS), snapshot.load_array(RISK_RULES)
+        return cls(scores, offsets, hits, list(entry['rules']))
+
+    @classmethod
+    def scan(cls, documents: Iterable[str]) -> 'ChunkRisk':
+        scanner = ChunkRiskScanner()
+        scanner.add(documents)
+        arrays = scanner.arrays()
+        return cls(arrays[RISK_SCORES], arrays[RISK_OFFSETS], arrays[RISK_RULES], scanner.rules)
+
+    @property
+    def flagged(self) -> int:
+        return int(np.count_nonzero(self.scores > 0))
+
+    def reasons(self, row: int) -> List[str]:
+        return [self.rules[idx] for idx in self.hits[self.offsets[row] : self.offsets[row + 1]].tolist()]
@@ -1,24 +1,157 @@
 from __future__ import annotations
 
-import pickle
-from dataclasses import dataclass
+import hashlib
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import List, Sequence
+from typing import Any, Callable, Deque, Dict, Iterator, List, Tuple
 
 import numpy as np
-from sentence_transformers import SentenceTransformer
+
+from app.rag.ann import build_ivf
+from app.rag.cache import get_retrieval_cache
+from app.rag.collection import (
+    CENTROID_ARRAY,
+    DEFAULT_COLLECTION,
+    centroid,
+    collection_corpus_dir,
+    collection_index_root,
+    source_prefix,
+)
+from app.rag.dedup import DuplicateIndex
+from app.rag.defenses import ChunkRiskScanner, rule_pack_fingerprint
+from app.rag.lexical import BM25Builder
+from app.rag.models import EmbeddingModel, get_embedding_model
+from app.rag.quant import QUANTIZATION_KINDS, quantize
+from app.rag.store import IndexFormatError, IndexSnapshot, IndexStore, IndexWriter, resolve_index_root
+
+DEFAULT_CORPUS_DIR = Path(__file__).resolve().parent.parent / 'data' / 'corpus'
+EMBEDDING_DIMENSION = 384
+HASH_BLOCK_BYTES = 1 << 20
+ASSUMED_CHUNK_BYTES = 4096
+
+
+@dataclass
+class BuildStats:
+    reused: int = 0
+    embedded: int = 0
+    removed: int = 0
+    elapsed_seconds: float = 0.0
+    embed_seconds: float = 0.0
+    workers: int = 1
+    worker_seconds: float = 0.0
+    chunks: int = 0
+    exact_duplicates: int = 0
+    near_duplicates: int = 0
+
+    @property
+    def dedup_ratio(self) -> float:
+        "Share of chunks collapsed into an earlier copy instead of getting their own row."
+        return (self.exact_duplicates + self.near_duplicates) / self.chunks if self.chunks else 0.0
+
+    @property
+    def chunks_per_second(self) -> float:
+        return self.embedded / self.embed_seconds if self.embed_seconds else 0.0
+
+    @property
+    def scaling_efficiency(self) -> float:
+        "Busy encode time across workers divided by the wall time they had available."
+        if not self.embed_seconds:
+            return 0.0
+        return self.worker_seconds / (self.embed_seconds * self.workers)
+
+
+@dataclass
+class BuildProgress:
+    files_done: int
+    files_total: int
+    rows_written: int
+    embedded: int
+    chunks_per_second: float
 
 
 @dataclass
 class IndexedCorpus:
-    documents: List[str]
+    "What a build published. Holds no open files: open ``path`` (or the store) to read the rows."
+
+    path: Path
     sources: List[str]
-    embeddings: List[List[float]]
     model_name: str
+    generation: int
+    count: int
+    stats: BuildStats = field(default_factory=BuildStats)
+
+
+@dataclass
+class _FilePlan:
+    path: Path
+    digest: str
+    reuse: Dict[str, Any] | None
+
+
+@dataclass
+class _Reuse:
+    start: int
+    count: int
+
+
+@dataclass
+class _Batch:
+    documents: List[str] = field(default_factory=list)
+    sources: List[str] = field(default_factory=list)
+    text_bytes: int = 0
+
+
+Segment = _Reuse | _Batch
+ProgressCallback = Callable[[BuildProgress], None]
+
+_WORKER_MODEL: EmbeddingModel | None = None
+_WORKER_BATCH_SIZE = 64
+
+
+def _init_worker(model_name: str, batch_size: int, threads: int) -> None:
+    global _WORKER_MODEL, _WORKER_BATCH_SIZE
+    import torch
+
+    torch.set_num_threads(threads)
+    _WORKER_MODEL = get_embedding_model(model_name)
+    _WORKER_BATCH_SIZE = batch_size
+
+
+def _encode_in_worker(chunks: List[str]) -> Tuple[np.ndarray, float]:
+    assert _WORKER_MODEL is not None, 'worker was not initialised'
+    started = time.perf_counter()
+    vectors = _WORKER_MODEL.encode(
+        chunks,
+        batch_size=_WORKER_BATCH_SIZE,
+        convert_to_numpy=True,
+        normalize_embeddings=True,
+    )
+    return np.asarray(vectors, dtype=np.float32), time.perf_counter() - started
 
 
 class CorpusIndexer:
-    "Builds and persists a semantic embedding index for the markdown corpus."
+    """Builds and persists a semantic embedding index for the markdown corpus.
+
+    Building is a streaming pipeline (file discovery -> chunking -> fixed-size encode batches ->
+    append to the on-disk matrix), so peak memory is bounded by one batch rather than the corpus.
+    A batch closes at ``batch_size`` chunks or once its text and vectors reach ``memory_limit_mb``.
+
+    With ``workers > 1`` batches are sharded across a process pool, each worker loading the model
+    once. Batch boundaries do not depend on the worker count and results are written back in
+    submission order, so the published generation matches a serial build.
+
+    With ``dedup`` on, chunks that repeat an earlier chunk exactly, or whose MinHash Jaccard
+    estimate reaches ``dedup_threshold``, are not embedded; the file entry in the manifest records
+    them as aliases of the primary source so the retriever can still cite every file carrying it.
+
+    Every row is also scanned with the prompt-injection patterns; the published risk scores and
+    fired rules let the retriever drop or demote flagged chunks without scanning per query.
+    """
 
     def __init__(
         self,
@@ -27,58 +160,388 @@ class CorpusIndexer:
         *,
         chunk_size: int = 180,
         model_name: str = "sentence-transformers/all-MiniLM-L6-v2",
+        ivf_min_rows: int = 4096,
+        ivf_lists: int | None = None,
+        batch_size: int = 64,
+        memory_limit_mb: int = 256,
+        workers: int = 1,
+        quantization: str | None = None,
+        pca_dims: int | None = None,
+        dedup: bool = False,
+        dedup_threshold: float = 0.75,
+        dedup_min_words: int = 8,
+        collection: str = DEFAULT_COLLECTION,
     ) -> None:
         self.corpus_dir = corpus_dir
         self.index_path = index_path
+        self.index_root, self.legacy_path = resolve_index_root(index_path)
+        self.store = IndexStore(self.index_root)
         self.chunk_size = chunk_size
         self.model_name = model_name
-        self._model: SentenceTransformer | None = None
+        self.ivf_min_rows = ivf_min_rows
+        self.ivf_lists = ivf_lists
+        self.batch_size = max(1, batch_size)
+        self.memory_limit_bytes = max(1, memory_limit_mb) * (1 << 20)
+        self.workers = max(1, workers)
+        if quantization and quantization not in QUANTIZATION_KINDS:
+            raise ValueError(f"Unknown quantization '{quantization}'; expected one of {QUANTIZATION_KINDS}")
+        self.quantization = quantization or None
+        self.pca_dims = (pca_dims or None) if self.quantization else None
+        self.dedup = dedup
+        self.dedup_threshold = dedup_threshold
+        self.dedup_min_words = max(1, dedup_min_words)
+        self.collection = collection
+        self.source_prefix = source_prefix(collection)
 
-    @property
-    def model(self) -> SentenceTransformer:
-        if self._model is None:
-            self._model = SentenceTransformer(self.model_name)
-        return self._model
-
-    def build(self) -> IndexedCorpus:
-        documents: List[str] = []
-        sources: List[str] = []
-
-        for md_file in sorted(self.corpus_dir.glob('*.md')):
-            chunks = self._chunk_file(md_file)
-            for idx, chunk in enumerate(chunks):
-                documents.append(chunk)
-                sources.append(f"{md_file.name}#chunk-{idx}")
-
-        if not documents:
-            embeddings = np.zeros((0, 384), dtype=np.float32)
-        else:
-            embeddings = self.model.encode(documents, convert_to_numpy=True, normalize_embeddings=True)
-
-        payload = {
-            'documents': documents,
-            'sources': sources,
-            'embeddings': embeddings.tolist(),
-            'model_name': self.model_name,
+    @classmethod
+    def from_settings(
+        cls, settings: Any, corpus_dir: Path, *, collection: str = DEFAULT_COLLECTION, **overrides: Any
+    ) -> 'CorpusIndexer':
+        """Indexer configured from the ``RAG_INDEX_*`` settings; falsy overrides other than ``False``
+        fall back. A named ``collection`` reads ``corpus_dir/<collection>`` into its own shard."""
+        quantization = settings.RAG_INDEX_QUANTIZATION.lower()
+        options: Dict[str, Any] = {
+            'batch_size': settings.RAG_INDEX_BATCH_SIZE,
+            'memory_limit_mb': settings.RAG_INDEX_MEMORY_MB,
+            'workers': settings.RAG_INDEX_WORKERS,
+            'quantization': None if quantization in ('', 'none') else quantization,
+            'pca_dims': settings.RAG_INDEX_PCA_DIMS,
+            'dedup': settings.RAG_INDEX_DEDUP,
+            'dedup_threshold': settings.RAG_DEDUP_THRESHOLD,
         }
-        self.index_path.parent.mkdir(parents=True, exist_ok=True)
-        with self.index_path.open('wb') as fh:
-            pickle.dump(payload, fh)
-        return IndexedCorpus(
-            documents=documents,
-            sources=sources,
-            embeddings=payload['embeddings'],
-            model_name=self.model_name,
+        options.update({key: value for key, value in overrides.items() if value or value is False})
+        index_path = Path(settings.RAG_INDEX_PATH)
+        if collection != DEFAULT_COLLECTION:
+            index_path = collection_index_root(resolve_index_root(index_path)[0], collection)
+        return cls(
+            collection_corpus_dir(corpus_dir, collection), index_path, collection=collection, **options
         )
 
-    def _chunk_file(self, path: Path) -> Sequence[str]:
-        text = path.read_text(encoding='utf-8')
-        words = text.split()
-        if not words:
-            return ['']
-        chunks = []
-        for start in range(0, len(words), self.chunk_size):
-            end = min(len(words), start + self.chunk_size)
-            chunk_words = words[start:end]
-            chunks.append(' '.join(chunk_words))
-        return chunks
+    @property
+    def model(self) -> EmbeddingModel:
+        return get_embedding_model(self.model_name)
+
+    def build(self, *, full: bool = False, progress: ProgressCallback | None = None) -> IndexedCorpus:
+        """Publish a new index generation, re-embedding only files whose content or chunking changed.
+
+        Files are matched against the previous generation by SHA-256 and chunk size; unchanged
+        files keep their vectors and rows of deleted files are dropped. ``full`` ignores the
+        previous generation entirely. Incremental builds only dedup new chunks against what came
+        before them, so ``full`` also collapses copies that a changed file now shares with a
+        later, reused one.
+        """
+        started = time.perf_counter()
+        previous = None if full else self._open_previous()
+        try:
+            plan = self._plan(previous)
+            stats = BuildStats(workers=self.workers)
+            for item in plan:
+                if item.reuse:
+                    stats.reused += int(item.reuse['count'])
+                    self._count_chunks(stats, int(item.reuse['count']), item.reuse.get('aliases', []))
+            stats.removed = (previous.manifest.count if previous else 0) - stats.reused
+            unchanged = stats.removed == 0 and all(item.reuse for item in plan)
+            if previous and unchanged and self._layout_matches(previous):
+                stats.elapsed_seconds = time.perf_counter() - started
+                return self._corpus(stats)
+
+            dimension = previous.manifest.dimension if previous else EMBEDDING_DIMENSION
+            files: Dict[str, Dict[str, Any]] = {}
+            lexical = BM25Builder()
+            risk = ChunkRiskScanner()
+            with self.store.writer(self.model_name, dimension=dimension) as writer:
+                segments = self._segments(plan, files, previous, stats)
+                for files_done, segment, vectors in self._embed(segments, stats):
+                    if isinstance(segment, _Reuse):
+                        assert previous is not None
+                        self._copy_rows(previous, segment, writer, lexical, risk)
+                    else:
+                        writer.append(segment.documents, segment.sources, vectors)
+                        lexical.add(segment.documents)
+                        risk.add(segment.documents)
+                    if progress:
+                        progress(
+                            BuildProgress(
+                                files_done=files_done,
+                                files_total=len(plan),
+                                rows_written=writer.count,
+                                embedded=stats.embedded,
+                                chunks_per_second=stats.chunks_per_second,
+                            )
+                        )
+                extra: Dict[str, Any] = {
+                    'chunk_size': self.chunk_size,
+                    'files': files,
+                    'lexical': lexical.manifest_entry(),
+                    'risk': risk.manifest_entry(),
+                    'dedup': {
+                        **self._dedup_config(),
+                        'chunks': stats.chunks,
+                        'exact': stats.exact_duplicates,
+                        'near': stats.near_duplicates,
+                        'rows': writer.count,
+                    },
+                }
+                arrays: Dict[str, np.ndarray] = {**lexical.arrays(), **risk.arrays()}
+                if writer.count:
+                    arrays[CENTROID_ARRAY] = centroid(writer.embeddings())
+                if writer.count >= max(1, self.ivf_min_rows):
+                    lists = build_ivf(writer.embeddings(), self.ivf_lists)
+                    arrays.update(lists.as_arrays())
+                    extra['ann'] = {'kind': 'ivf', 'lists': int(len(lists.centroids))}
+                if self.quantization and writer.count:
+                    compact, extra['quantization'] = quantize(
+                        writer.embeddings(), self.quantization, pca_dims=self.pca_dims
+                    )
+                    arrays.update(compact)
+                manifest = writer.commit(extra=extra, arrays=arrays)
+        finally:
+            if previous:
+                previous.close()
+        get_retrieval_cache().observe_index(str(self.index_root.resolve()), manifest.generation)
+        stats.elapsed_seconds = time.perf_counter() - started
+        return self._corpus(stats)
+
+    def _layout_matches(self, previous: IndexSnapshot) -> bool:
+        "Whether ``previous`` already carries every auxiliary structure this indexer would publish."
+        extra = previous.manifest.extra
+        if 'lexical' not in extra or (extra.get('risk') or {}).get('fingerprint') != rule_pack_fingerprint():
+            return False
+        quantization = extra.get('quantization') or {}
+        return quantization.get('kind') == self.quantization and quantization.get('pca_dims') == self.pca_dims
+
+    def _dedup_config(self) -> Dict[str, Any]:
+        if not self.dedup:
+            return {'enabled': False}
+        return {'enabled': True, 'threshold': self.dedup_threshold, 'min_words': self.dedup_min_words}
+
+    def _plan(self, previous: IndexSnapshot | None) -> List[_FilePlan]:
+        previous_files: Dict[str, Dict[str, Any]] = {}
+        if previous:
+            previous_files = previous.manifest.extra.get('files', {})
+        plan: List[_FilePlan] = []
+        reused: set[str] = set()
+        for md_file in self._discover():
+            digest = self._hash_file(md_file)
+            entry = previous_files.get(md_file.name)
+            reusable = bool(entry and entry['sha256'] == digest and entry['chunk_size'] == self.chunk_size)
+            # Collapsed chunks have no row of their own, so the file they point at must survive too.
+            if reusable and entry:
+                primaries = {
+                    primary.rsplit('#', 1)[0][len(self.source_prefix) :]
+                    for _, primary, _ in entry.get('aliases', ())
+                }
+                reusable = primaries <= reused | {md_file.name}
+            if reusable:
+                reused.add(md_file.name)
+            plan.append(_FilePlan(path=md_file, digest=digest, reuse=entry if reusable else None))
+        return plan
+
+    def iter_chunks(self) -> Iterator[Tuple[str, str]]:
+        "``(source, chunk)`` pairs in index row order, without embedding anything."
+        for path in self._discover():
+            for idx, chunk in enumerate(self._chunk_file(path)):
+                yield self._source(path, idx), chunk
+
+    def _source(self, path: Path, idx: int) -> str:
+        return f"{self.source_prefix}{path.name}#chunk-{idx}"
+
+    def _discover(self) -> Iterator[Path]:
+        yield from sorted(self.corpus_dir.glob('*.md'))
+
+    @staticmethod
+    def _hash_file(path: Path) -> str:
+        digest = hashlib.sha256()
+        with path.open('rb') as fh:
+            for block in iter(lambda: fh.read(HASH_BLOCK_BYTES), b''):
+                digest.update(block)
+        return digest.hexdigest()
+
+    @staticmethod
+    def _count_chunks(stats: BuildStats, rows: int, aliases: List[List[str]]) -> None:
+        stats.chunks += rows + len(aliases)
+        for _, _, kind in aliases:
+            if kind == 'exact':
+                stats.exact_duplicates += 1
+            else:
+                stats.near_duplicates += 1
+
+    def _segments(
+        self,
+        plan: List[_FilePlan],
+        files: Dict[str, Dict[str, Any]],
+        previous: IndexSnapshot | None,
+        stats: BuildStats,
+    ) -> Iterator[Tuple[int, Segment]]:
+        "Yield ``(files_done, segment)`` in row order, recording each file's row range in ``files``."
+        rows = 0
+        batch = _Batch()
+        vector_bytes = 4 * EMBEDDING_DIMENSION
+        duplicates = DuplicateIndex(threshold=self.dedup_threshold, min_words=self.dedup_min_words)
+        for files_done, item in enumerate(plan, start=1):
+            start = rows
+            aliases: List[List[str]] = []
+            if item.reuse:
+                if batch.documents:
+                    yield files_done - 1, batch
+                    batch = _Batch()
+                count = int(item.reuse['count'])
+                first = int(item.reuse['start'])
+                if self.dedup and previous is not None:
+                    for row in range(first, first + count):
+                        duplicates.add(previous.documents[row], previous.sources[row])
+                    aliases = list(item.reuse.get('aliases', []))
+                yield files_done, _Reuse(start=first, count=count)
+                rows += count
+            else:
+                for idx, chunk in enumerate(self._chunk_file(item.path)):
+                    source = self._source(item.path, idx)
+                    if self.dedup and chunk:
+                        primary, kind = duplicates.match(chunk)
+                        if primary is not None and kind is not None:
+                            aliases.append([source, primary, kind])
+                            continue
+                        duplicates.add(chunk, source)
+                    batch.documents.append(chunk)
+                    batch.sources.append(source)
+                    batch.text_bytes += len(chunk)
+                    rows += 1
+                    buffered = batch.text_bytes + len(batch.documents) * vector_bytes
+                    if len(batch.documents) >= self.batch_size or buffered >= self.memory_limit_bytes:
+                        yield files_done - 1, batch
+                        batch = _Batch()
+                self._count_chunks(stats, rows - start, aliases)
+            files[item.path.name] = {
+                'sha256': item.digest,
+                'chunk_size': self.chunk_size,
+                'start': start,
+                'count': rows - start,
+            }
+            if aliases:
+                files[item.path.name]['aliases'] = aliases
+        if batch.documents:
+            yield len(plan), batch
+
+    def _embed(
+        self, segments: Iterator[Tuple[int, Segment]], stats: BuildStats
+    ) -> Iterator[Tuple[int, Segment, np.ndarray | None]]:
+        if self.workers > 1:
+            yield from self._embed_parallel(segments, stats)
+            return
+        for files_done, segment in segments:
+            if isinstance(segment, _Reuse):
+                yield files_done, segment, None
+                continue
+            started = time.perf_counter()
+            vectors = self._encode(segment.documents)
+            elapsed = time.perf_counter() - started
+            stats.embed_seconds += elapsed
+            stats.worker_seconds += elapsed
+            stats.embedded += len(segment.documents)
+            yield files_done, segment, vectors
+
+    def _embed_parallel(
+        self, segments: Iterator[Tuple[int, Segment]], stats: BuildStats
+    ) -> Iterator[Tuple[int, Segment, np.ndarray | None]]:
+        threads = max(1, (os.cpu_count() or 1) // self.workers)
+        # Bounded look-ahead keeps at most a couple of batches per worker in memory.
+        window = 2 * self.workers
+        pending: Deque[Tuple[int, Segment, Future | None]] = deque()
+        with ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker,
+            initargs=(self.model_name, self.batch_size, threads),
+        ) as pool:
+            started = time.perf_counter() - stats.embed_seconds
+
+            def collect() -> Tuple[int, Segment, np.ndarray | None]:
+                files_done, segment, future = pending.popleft()
+                if future is None:
+                    return files_done, segment, None
+                vectors, seconds = future.result()
+                stats.worker_seconds += seconds
+                stats.embedded += len(vectors)
+                stats.embed_seconds = time.perf_counter() - started
+                return files_done, segment, vectors
+
+            for files_done, segment in segments:
+                future = None
+                if isinstance(segment, _Batch):
+                    future = pool.submit(_encode_in_worker, segment.documents)
+                pending.append((files_done, segment, future))
+                while len(pending) > window:
+                    yield collect()
+            while pending:
+                yield collect()
+
+    def _copy_rows(
+        self,
+        previous: IndexSnapshot,
+        segment: _Reuse,
+        writer: IndexWriter,
+        lexical: BM25Builder,
+        risk: ChunkRiskScanner,
+    ) -> None:
+        row_bytes = 4 * previous.manifest.dimension + ASSUMED_CHUNK_BYTES
+        block = max(1, self.memory_limit_bytes // row_bytes)
+        for offset in range(segment.start, segment.start + segment.count, block):
+            end = min(segment.start + segment.count, offset + block)
+            documents = previous.documents[offset:end]
+            writer.append(documents, previous.sources[offset:end], previous.embeddings[offset:end])
+            lexical.add(documents)
+            risk.add(documents)
+
+    def _open_previous(self) -> IndexSnapshot | None:
+        if not self.store.exists():
+            return None
+        try:
+            snapshot = self.store.open()
+        except (IndexFormatError, OSError, ValueError):
+            return None
+        stored = snapshot.manifest.extra.get('dedup') or {'enabled': False}
+        same_dedup = all(stored.get(key) == value for key, value in self._dedup_config().items())
+        # Rows depend on what was collapsed, so changing the dedup settings means a full rebuild.
+        if snapshot.manifest.model_name != self.model_name or not same_dedup:
+            snapshot.close()
+            return None
+        return snapshot
+
+    def _encode(self, chunks: List[str]) -> np.ndarray:
+        if not chunks:
+            return np.zeros((0, EMBEDDING_DIMENSION), dtype=np.float32)
+        vectors = self.model.encode(
+            chunks,
+            batch_size=self.batch_size,
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+        )
+        return np.asarray(vectors, dtype=np.float32)
+
+    def _corpus(self, stats: BuildStats) -> IndexedCorpus:
+        snapshot = self.store.open()
+        try:
+            return IndexedCorpus(
+                path=snapshot.path,
+                sources=list(snapshot.sources),
+                model_name=snapshot.manifest.model_name,
+                generation=snapshot.manifest.generation,
+                count=snapshot.manifest.count,
+                stats=stats,
+            )
+        finally:
+            snapshot.close()
+
+    def _chunk_file(self, path: Path) -> Iterator[str]:
+        "Stream fixed-size word chunks without holding the whole file; empty files yield one ''."
+        words: List[str] = []
+        emitted = False
+        with path.open('r', encoding='utf-8') as fh:
+            for line in fh:
+                words.extend(line.split())
+                while len(words) >= self.chunk_size:
+                    yield ' '.join(words[: self.chunk_size])
+                    del words[: self.chunk_size]
+                    emitted = True
+        if words or not emitted:
+            yield ' '.join(words)
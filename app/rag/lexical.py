@@ -0,0 +1,186 @@
+from __future__ import annotations
+
+import re
+from array import array
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Sequence, Tuple
+
+import numpy as np
+
+from app.rag.ann import SearchHits, top_indices
+from app.rag.store import IndexSnapshot
+
+BM25_TERMS = 'bm25.terms'
+BM25_OFFSETS = 'bm25.offsets'
+BM25_DOCS = 'bm25.docs'
+BM25_TFS = 'bm25.tfs'
+BM25_LENGTHS = 'bm25.lengths'
+
+_TOKEN_RE = re.compile(r'[a-z0-9]+(?:[-_.:/][a-z0-9]+)*')
+_PART_RE = re.compile(r'[-_.:/]')
+
+
+def tokenize(text: str) -> List[str]:
+    """Lower-cased word tokens; compound identifiers (``INC-1042``, ``ERR_TIMEOUT``) are kept
+    whole and also split into their parts so partial matches still score."""
+    tokens: List[str] = []
+    for token in _TOKEN_RE.findall(text.lower()):
+        tokens.append(token)
+        if _PART_RE.search(token):
+            tokens.extend(part for part in _PART_RE.split(token) if part)
+    return tokens
+
+
+class BM25Builder:
+    """Accumulates postings row by row in flat typed arrays and packs them into CSR form.
+
+    Rows must be added in index order; ``arrays()`` returns the postings sorted by term with
+    ``offsets[t]:offsets[t + 1]`` delimiting the (doc, tf) pairs of term ``t``.
+    """
+
+    def __init__(self, *, k1: float = 1.2, b: float = 0.75) -> None:
+        self.k1 = k1
+        self.b = b
+        self.vocabulary: Dict[str, int] = {}
+        self._terms = array('i')
+        self._docs = array('i')
+        self._tfs = array('i')
+        self._lengths = array('i')
+
+    @property
+    def rows(self) -> int:
+        return len(self._lengths)
+
+    def add(self, documents: Iterable[str]) -> None:
+        for document in documents:
+            row = len(self._lengths)
+            tokens = tokenize(document)
+            for term, tf in Counter(tokens).items():
+                self._terms.append(self.vocabulary.setdefault(term, len(self.vocabulary)))
+                self._docs.append(row)
+                self._tfs.append(tf)
+            self._lengths.append(len(tokens))
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        terms = np.frombuffer(self._terms, dtype=np.int32) if self._terms else np.zeros(0, np.int32)
+        order = np.argsort(terms, kind='stable')
+        offsets = np.zeros(len(self.vocabulary) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(terms, minlength=len(self.vocabulary)), out=offsets[1:])
+        vocabulary = '\n'.join(self.vocabulary).encode('utf-8')
+        return {
+            BM25_TERMS: np.frombuffer(vocabulary, dtype=np.uint8).copy(),
+            BM25_OFFSETS: offsets,
+            BM25_DOCS: np.asarray(self._docs, dtype=np.int32)[order],
+            BM25_TFS: np.asarray(self._tfs, dtype=np.int32)[order],
+            BM25_LENGTHS: np.asarray(self._lengths, dtype=np.int32),
+        }
+
+    def manifest_entry(self) -> Dict[str, Any]:
+        average = sum(self._lengths) / self.rows if self.rows else 0.0
+        return {
+            'kind': 'bm25',
+            'k1': self.k1,
+            'b': self.b,
+            'terms': len(self.vocabulary),
+            'postings': len(self._docs),
+            'avg_length': average,
+        }
+
+
+class BM25Index:
+    "Okapi BM25 over memory-mapped CSR postings; no model is needed to score a query."
+
+    def __init__(
+        self,
+        vocabulary: Dict[str, int],
+        offsets: np.ndarray,
+        docs: np.ndarray,
+        tfs: np.ndarray,
+        lengths: np.ndarray,
+        *,
+        k1: float = 1.2,
+        b: float = 0.75,
+    ) -> None:
+        self.vocabulary = vocabulary
+        self.offsets = offsets
+        self.docs = docs
+        self.tfs = tfs
+        self.lengths = lengths
+        self.k1 = k1
+        self.b = b
+        rows = len(lengths)
+        average = float(np.mean(lengths)) if rows else 0.0
+        self._norm = (k1 * (1 - b + b * np.asarray(lengths) / max(average, 1e-9))).astype(np.float32)
+        df = np.diff(np.asarray(offsets))
+        self._idf = np.log1p((rows - df + 0.5) / (df + 0.5)).astype(np.float32)
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray], *, k1: float = 1.2, b: float = 0.75) -> 'BM25Index':
+        terms = arrays[BM25_TERMS]
+        words = bytes(terms).decode('utf-8').split('\n') if len(terms) else []
+        vocabulary = {word: idx for idx, word in enumerate(words)}
+        return cls(
+            vocabulary,
+            arrays[BM25_OFFSETS],
+            arrays[BM25_DOCS],
+            arrays[BM25_TFS],
+            arrays[BM25_LENGTHS],
+            k1=k1,
+            b=b,
+        )
+
+    @classmethod
+    def from_snapshot(cls, snapshot: IndexSnapshot) -> 'BM25Index | None':
+        entry = snapshot.manifest.extra.get('lexical')
+        names = (BM25_TERMS, BM25_OFFSETS, BM25_DOCS, BM25_TFS, BM25_LENGTHS)
+        arrays = {name: snapshot.load_array(name) for name in names}
+        if not entry or any(item is None for item in arrays.values()):
+            return None
+        return cls.from_arrays(arrays, k1=entry['k1'], b=entry['b'])  # type: ignore[arg-type]
+
+    def scores(self, query: str) -> Tuple[np.ndarray, np.ndarray]:
+        "Candidate rows (every row sharing a term with ``query``) and their BM25 scores."
+        parts_ids: List[np.ndarray] = []
+        parts_scores: List[np.ndarray] = []
+        for term, qtf in Counter(tokenize(query)).items():
+            term_id = self.vocabulary.get(term)
+            if term_id is None:
+                continue
+            start, end = int(self.offsets[term_id]), int(self.offsets[term_id + 1])
+            docs = np.asarray(self.docs[start:end])
+            tfs = np.asarray(self.tfs[start:end], dtype=np.float32)
+            weight = self._idf[term_id] * qtf
+            parts_ids.append(docs)
+            parts_scores.append(weight * tfs * (self.k1 + 1) / (tfs + self._norm[docs]))
+        if not parts_ids:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        ids = np.concatenate(parts_ids)
+        candidates, inverse = np.unique(ids, return_inverse=True)
+        totals = np.zeros(len(candidates), dtype=np.float32)
+        np.add.at(totals, inverse, np.concatenate(parts_scores))
+        return candidates.astype(np.int64), totals
+
+    def search(self, query: str, top_k: int) -> SearchHits:
+        candidates, totals = self.scores(query)
+        best = top_indices(totals, top_k)
+        return candidates[best], totals[best]
+
+    def search_many(self, queries: Sequence[str], top_k: int) -> SearchHits:
+        ids = np.full((len(queries), top_k), -1, dtype=np.int64)
+        scores = np.full((len(queries), top_k), -np.inf, dtype=np.float32)
+        for row, query in enumerate(queries):
+            hit_ids, hit_scores = self.search(query, top_k)
+            ids[row, : len(hit_ids)] = hit_ids
+            scores[row, : len(hit_scores)] = hit_scores
+        return ids, scores
+
+
+def reciprocal_rank_fusion(rankings: Sequence[np.ndarray], top_k: int, *, k: int = 60) -> SearchHits:
+    "Fuse ranked id lists (``-1`` padding ignored) by summing ``1 / (k + rank)`` per id."
+    fused: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, idx in enumerate(ranking.tolist(), start=1):
+            if idx >= 0:
+                fused[idx] = fused.get(idx, 0.0) + 1.0 / (k + rank)
+    ordered = sorted(fused, key=lambda idx: -fused[idx])[:top_k]
+    return np.asarray(ordered, dtype=np.int64), np.asarray([fused[idx] for idx in ordered], dtype=np.float32)
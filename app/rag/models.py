@@ -0,0 +1,199 @@
+from __future__ import annotations
+
+import copy
+import threading
+import time
+from dataclasses import asdict, dataclass
+from typing import Any, Callable, Dict, Protocol
+
+import numpy as np
+
+
+class EmbeddingModel(Protocol):
+    def encode(self, sentences: Any, **kwargs: Any) -> np.ndarray: ...
+
+
+ModelLoader = Callable[[str], EmbeddingModel]
+QUERY_ENCODERS = ('default', 'fast')
+WARM_UP_QUERIES = (
+    'restart the service',
+    'who has to approve a production deploy while an incident is open?',
+)
+
+
+@dataclass
+class ModelStats:
+    name: str
+    load_seconds: float
+    resident_bytes: int
+    acquisitions: int = 0
+    injected: bool = False
+
+
+def load_sentence_transformer(name: str) -> EmbeddingModel:
+    from sentence_transformers import SentenceTransformer
+
+    return SentenceTransformer(name)
+
+
+def resident_bytes(model: Any) -> int:
+    "Bytes held by a torch module's parameters and buffers; 0 for models that are not modules."
+    total = 0
+    for attr in ('parameters', 'buffers'):
+        tensors = getattr(model, attr, None)
+        if not callable(tensors):
+            continue
+        total += sum(t.numel() * t.element_size() for t in tensors())
+    return total
+
+
+class EmbeddingModelRegistry:
+    """Loads each embedding model at most once per process and hands out the shared instance.
+
+    Loads are serialised per model name, so concurrent first callers wait for one load instead
+    of each pulling the weights. ``register`` installs a ready-made model (e.g. a test fake)
+    under a name without touching the loader; ``unregister`` removes it again.
+    """
+
+    def __init__(self, loader: ModelLoader = load_sentence_transformer) -> None:
+        self.loader = loader
+        self._models: Dict[str, EmbeddingModel] = {}
+        self._stats: Dict[str, ModelStats] = {}
+        self._load_locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def get(self, name: str, loader: ModelLoader | None = None) -> EmbeddingModel:
+        "The shared model for ``name``, loaded with ``loader`` (default: the registry's) on first use."
+        with self._lock:
+            model = self._models.get(name)
+            if model is not None:
+                self._stats[name].acquisitions += 1
+                return model
+            load_lock = self._load_locks.setdefault(name, threading.Lock())
+        with load_lock:
+            with self._lock:
+                model = self._models.get(name)
+                if model is not None:
+                    self._stats[name].acquisitions += 1
+                    return model
+            started = time.perf_counter()
+            model = (loader or self.loader)(name)
+            stats = ModelStats(name, time.perf_counter() - started, resident_bytes(model), acquisitions=1)
+            with self._lock:
+                self._models[name] = model
+                self._stats[name] = stats
+            return model
+
+    def register(self, name: str, model: EmbeddingModel) -> None:
+        with self._lock:
+            self._models[name] = model
+            self._stats[name] = ModelStats(name, 0.0, resident_bytes(model), injected=True)
+
+    def unregister(self, name: str) -> None:
+        "Drop ``name`` and the query encoders derived from it (``name@<options>``)."
+        with self._lock:
+            for key in [key for key in self._models if key == name or key.startswith(f'{name}@')]:
+                del self._models[key]
+                self._stats.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._models.clear()
+            self._stats.clear()
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            models = [asdict(stats) for stats in self._stats.values()]
+        return {
+            'models': models,
+            'loaded': len(models),
+            'resident_bytes': sum(item['resident_bytes'] for item in models),
+        }
+
+
+_MODEL_REGISTRY: EmbeddingModelRegistry | None = None
+_REGISTRY_LOCK = threading.Lock()
+
+
+def get_model_registry() -> EmbeddingModelRegistry:
+    global _MODEL_REGISTRY
+    if _MODEL_REGISTRY is None:
+        with _REGISTRY_LOCK:
+            if _MODEL_REGISTRY is None:
+                _MODEL_REGISTRY = EmbeddingModelRegistry()
+    return _MODEL_REGISTRY
+
+
+def get_embedding_model(name: str) -> EmbeddingModel:
+    return get_model_registry().get(name)
+
+
+@dataclass(frozen=True)
+class QueryEncoderOptions:
+    "CPU fast path for query encoding: dynamic int8 linear layers, thread count, truncation."
+
+    quantize: bool = True
+    threads: int = 0
+    max_seq_length: int = 128
+
+    @property
+    def key(self) -> str:
+        return f'query-int8={int(self.quantize)}-threads={self.threads}-seq={self.max_seq_length}'
+
+
+def query_encoder_options(settings: Any, encoder: str | None = None) -> QueryEncoderOptions | None:
+    "Options for the ``fast`` query encoder, or ``None`` when queries use the indexing model as is."
+    encoder = (encoder or settings.RAG_QUERY_ENCODER or 'default').lower()
+    if encoder not in QUERY_ENCODERS:
+        raise ValueError(f"Unknown query encoder '{encoder}'; expected one of {QUERY_ENCODERS}")
+    if encoder == 'default':
+        return None
+    return QueryEncoderOptions(
+        threads=settings.RAG_QUERY_THREADS, max_seq_length=settings.RAG_QUERY_MAX_SEQ_LENGTH
+    )
+
+
+def build_fast_query_encoder(base: EmbeddingModel, options: QueryEncoderOptions) -> EmbeddingModel:
+    """A copy of ``base`` tuned for single short queries on CPU.
+
+    Dynamic quantisation stores the ``nn.Linear`` weights as int8 and quantises activations on
+    the fly, so the output stays in the same vector space as the float32 index; callers still
+    pass ``normalize_embeddings=True`` and compare by cosine. ``threads`` sets torch's intra-op
+    pool for the whole process. Models that are not torch modules (injected fakes) are returned
+    unchanged.
+    """
+    try:
+        import torch
+    except ImportError:  # pragma: no cover - sentence-transformers cannot load without torch either
+        return base
+    if not isinstance(base, torch.nn.Module):
+        return base
+    if options.threads > 0:
+        torch.set_num_threads(options.threads)
+    if options.quantize:
+        model = torch.ao.quantization.quantize_dynamic(base, {torch.nn.Linear}, dtype=torch.qint8)
+    else:
+        model = copy.deepcopy(base)
+    model.eval()
+    if options.max_seq_length and hasattr(model, 'max_seq_length'):
+        model.max_seq_length = options.max_seq_length
+    return model
+
+
+def get_query_encoder(name: str, options: QueryEncoderOptions | None = None) -> EmbeddingModel:
+    "Model used to encode queries against an index built with ``name``; shared like any other."
+    if options is None:
+        return get_embedding_model(name)
+    registry = get_model_registry()
+    return registry.get(
+        f'{name}@{options.key}', loader=lambda _: build_fast_query_encoder(registry.get(name), options)
+    )
+
+
+def warm_up(model: EmbeddingModel, rounds: int = 2) -> float:
+    "Run a few throwaway encodes so the first real query does not pay for lazy init; returns seconds."
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for query in WARM_UP_QUERIES:
+            model.encode([query], convert_to_numpy=True, normalize_embeddings=True)
+    return time.perf_counter() - started
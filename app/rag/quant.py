@@ -0,0 +1,167 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Any, Dict, Tuple
+
+import numpy as np
+
+from app.rag.ann import SearchHits, top_indices, top_indices_many
+from app.rag.store import IndexSnapshot
+
+QUANT_CODES = 'quant.codes'
+QUANT_SCALES = 'quant.scales'
+PCA_COMPONENTS = 'pca.components'
+PCA_MEAN = 'pca.mean'
+QUANTIZATION_KINDS = ('float16', 'int8')
+BLOCK_ROWS = 16384
+QUERY_BLOCK = 64
+
+
+@dataclass
+class Projection:
+    """PCA projection fitted on the stored embeddings.
+
+    Rows are centred before projecting; queries are not, which only shifts every score of a
+    query by the same constant and so keeps the ranking of the centred inner product.
+    """
+
+    components: np.ndarray
+    mean: np.ndarray
+
+    def apply(self, vectors: np.ndarray) -> np.ndarray:
+        return (np.asarray(vectors, dtype=np.float32) - self.mean) @ self.components.T
+
+    def apply_query(self, queries: np.ndarray) -> np.ndarray:
+        return np.asarray(queries, dtype=np.float32) @ self.components.T
+
+
+def fit_pca(embeddings: np.ndarray, dims: int, *, sample_rows: int = 20_000, seed: int = 0) -> Projection:
+    "Top ``dims`` principal axes, fitted on at most ``sample_rows`` rows."
+    rows = embeddings.shape[0]
+    rng = np.random.default_rng(seed)
+    ids = np.sort(rng.choice(rows, size=min(rows, sample_rows), replace=False))
+    sample = np.asarray(embeddings[ids], dtype=np.float32)
+    mean = sample.mean(axis=0)
+    _, _, vt = np.linalg.svd(sample - mean, full_matrices=False)
+    dims = max(1, min(dims, vt.shape[0]))
+    return Projection(components=vt[:dims].astype(np.float32), mean=mean.astype(np.float32))
+
+
+def quantize_rows(vectors: np.ndarray, kind: str) -> Tuple[np.ndarray, np.ndarray | None]:
+    "Encode rows as float16, or as int8 with one absmax scale per row."
+    if kind == 'float16':
+        return vectors.astype(np.float16), None
+    if kind == 'int8':
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+        return codes, scales.astype(np.float32)
+    raise ValueError(f"Unknown quantization '{kind}'; expected one of {QUANTIZATION_KINDS}")
+
+
+def quantize(
+    embeddings: np.ndarray, kind: str, *, pca_dims: int | None = None
+) -> Tuple[Dict[str, np.ndarray], Dict[str, Any]]:
+    """Compact copy of ``embeddings`` plus the manifest entry describing it.
+
+    Rows are converted in blocks so the full float32 matrix never has to be resident.
+    """
+    projection = fit_pca(embeddings, pca_dims) if pca_dims else None
+    rows = embeddings.shape[0]
+    dimension = projection.components.shape[0] if projection else embeddings.shape[1]
+    codes = np.empty((rows, dimension), dtype=np.float16 if kind == 'float16' else np.int8)
+    scales = np.empty(rows, dtype=np.float32) if kind == 'int8' else None
+    for start in range(0, rows, BLOCK_ROWS):
+        block = np.asarray(embeddings[start : start + BLOCK_ROWS], dtype=np.float32)
+        if projection:
+            block = projection.apply(block)
+        block_codes, block_scales = quantize_rows(block, kind)
+        codes[start : start + len(block)] = block_codes
+        if scales is not None and block_scales is not None:
+            scales[start : start + len(block)] = block_scales
+    arrays: Dict[str, np.ndarray] = {QUANT_CODES: codes}
+    if scales is not None:
+        arrays[QUANT_SCALES] = scales
+    if projection:
+        arrays[PCA_COMPONENTS] = projection.components
+        arrays[PCA_MEAN] = projection.mean
+    entry = {
+        'kind': kind,
+        'dimension': int(dimension),
+        # as requested, so a rebuild can compare it with the setting; capped PCA shows in 'dimension'
+        'pca_dims': int(pca_dims) if projection and pca_dims else None,
+        'scale': 'per-vector absmax / 127' if kind == 'int8' else None,
+        'bytes': int(sum(array.nbytes for array in arrays.values())),
+        'float32_bytes': int(rows * embeddings.shape[1] * 4),
+    }
+    return arrays, entry
+
+
+class QuantizedSearch:
+    """Two-pass search: score every row on the compact codes, then rescore a shortlist of
+    ``rescore * top_k`` rows against the full-precision matrix.
+
+    Only the shortlisted float32 rows are read, so the resident working set is the codes.
+    """
+
+    def __init__(
+        self,
+        embeddings: np.ndarray,
+        codes: np.ndarray,
+        scales: np.ndarray | None = None,
+        projection: Projection | None = None,
+        *,
+        rescore: int = 4,
+    ) -> None:
+        self.embeddings = embeddings
+        self.codes = codes
+        self.scales = scales
+        self.projection = projection
+        self.rescore = max(1, rescore)
+
+    @classmethod
+    def from_snapshot(cls, snapshot: IndexSnapshot, *, rescore: int = 4) -> 'QuantizedSearch | None':
+        codes = snapshot.load_array(QUANT_CODES)
+        if codes is None or 'quantization' not in snapshot.manifest.extra:
+            return None
+        components = snapshot.load_array(PCA_COMPONENTS)
+        mean = snapshot.load_array(PCA_MEAN)
+        projection = None
+        if components is not None and mean is not None:
+            projection = Projection(components=np.asarray(components), mean=np.asarray(mean))
+        scales = snapshot.load_array(QUANT_SCALES)
+        return cls(snapshot.embeddings, codes, scales, projection, rescore=rescore)
+
+    def approximate_scores(self, queries: np.ndarray) -> np.ndarray:
+        "First-pass ``(queries, rows)`` scores from the compact codes."
+        if self.projection:
+            queries = self.projection.apply_query(queries)
+        queries = np.asarray(queries, dtype=np.float32)
+        scores = np.empty((len(queries), len(self.codes)), dtype=np.float32)
+        for start in range(0, len(self.codes), BLOCK_ROWS):
+            block = np.asarray(self.codes[start : start + BLOCK_ROWS], dtype=np.float32)
+            part = queries @ block.T
+            if self.scales is not None:
+                part *= self.scales[start : start + len(block)]
+            scores[:, start : start + len(block)] = part
+        return scores
+
+    def search(self, query: np.ndarray, top_k: int) -> SearchHits:
+        ids, scores = self.search_many(query[None, :], top_k)
+        keep = ids[0] >= 0
+        return ids[0][keep], scores[0][keep]
+
+    def search_many(self, queries: np.ndarray, top_k: int) -> SearchHits:
+        ids = np.full((len(queries), top_k), -1, dtype=np.int64)
+        scores = np.full((len(queries), top_k), -np.inf, dtype=np.float32)
+        # Query blocks bound the (queries, rows) first-pass score matrix.
+        for first in range(0, len(queries), QUERY_BLOCK):
+            block = queries[first : first + QUERY_BLOCK]
+            shortlists = top_indices_many(self.approximate_scores(block), top_k * self.rescore)
+            for row, (query, shortlist) in enumerate(zip(block, shortlists), start=first):
+                candidates = np.sort(shortlist)
+                exact = np.asarray(self.embeddings[candidates], dtype=np.float32) @ query
+                best = top_indices(exact, top_k)
+                ids[row, : len(best)] = candidates[best]
+                scores[row, : len(best)] = exact[best]
+        return ids, scores
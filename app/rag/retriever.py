@@ -1,69 +1,572 @@
 from __future__ import annotations
 
-import pickle
+import heapq
+import threading
+import time
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Iterable, List, Sequence, Tuple
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
 
 import numpy as np
-from sentence_transformers import SentenceTransformer
 
 from app.config import get_settings
-from app.rag.indexer import CorpusIndexer
+from app.rag.ann import ExactSearch, IVFSearch, SearchHits, VectorSearch
+from app.rag.batching import get_embedding_batcher
+from app.rag.bootstrap import IndexBootstrap, ensure_index
+from app.rag.cache import RetrievalCache, get_retrieval_cache, normalise_query
+from app.rag.collection import (
+    CENTROID_ARRAY,
+    DEFAULT_COLLECTION,
+    centroid,
+    collection_index_root,
+    discover_collections,
+)
+from app.rag.dedup import alias_map
+from app.rag.defenses import ChunkRisk
+from app.rag.indexer import DEFAULT_CORPUS_DIR, CorpusIndexer
+from app.rag.lexical import BM25Builder, BM25Index, reciprocal_rank_fusion
+from app.rag.models import EmbeddingModel, get_embedding_model, get_query_encoder, query_encoder_options
+from app.rag.quant import QuantizedSearch
+from app.rag.store import IndexSnapshot, IndexStore, resolve_index_root
 
 RetrieverResult = Tuple[str, str]
+ScoredResult = Tuple[str, str, float]
+RETRIEVAL_MODES = ('dense', 'lexical', 'hybrid')
+HYBRID_CANDIDATES = 20
+INJECTION_POLICIES = ('off', 'downrank', 'filter')
+# Extra candidates fetched when flagged chunks may have to be dropped from the top-k.
+RISK_OVERFETCH = 64
+# Subtracted from a demoted hit's score so cross-shard merging keeps it below every clean hit.
+RISK_DEMOTION = 1e6
+
+
+@dataclass(eq=False)
+class _IndexState:
+    "Everything one index generation needs to answer a query; replaced as a unit, never mutated."
+
+    documents: Sequence[str]
+    sources: Sequence[str]
+    search: VectorSearch
+    lexical: BM25Index | None
+    model_name: str
+    version: str
+    degraded: bool
+    snapshot: IndexSnapshot | None = None
+    aliases: Dict[str, Tuple[str, ...]] = field(default_factory=dict)
+    centroid: np.ndarray | None = None
+    risk: ChunkRisk | None = None
+    readers: int = 0
+    retired: bool = False
+
+    @property
+    def generation(self) -> int | None:
+        return self.snapshot.manifest.generation if self.snapshot and not self.degraded else None
+
+    def close(self) -> None:
+        if self.snapshot is not None:
+            self.snapshot.close()
 
 
 class CorpusRetriever:
-    "Loads a persisted embedding index and surfaces top-k semantic matches for a query."
+    """Loads a persisted embedding index and surfaces top-k semantic matches for a query.
+
+    ``mode`` picks the ranking: ``dense`` (embedding similarity), ``lexical`` (BM25 over the
+    inverted index; never loads the embedding model) or ``hybrid`` (reciprocal-rank fusion of
+    both). ``search_mode`` is the dense backend: ``exact`` (brute force), ``ivf`` (inverted-file
+    ANN, probing ``nprobe`` lists), ``quantized`` (first pass on float16/int8 codes, exact rescore
+    of ``rescore`` x top-k rows) or ``auto``, which uses IVF, then quantized codes, whenever the
+    indexer published them for the generation. ``query_encoder='fast'`` encodes queries with an
+    int8 dynamically quantised copy of the indexing model (see ``build_fast_query_encoder``).
 
-    def __init__(self, settings=None, top_k: int = 3) -> None:
+    Chunks the indexer flagged as prompt-injection risks are dropped (``injection_policy=
+    'filter'``) or ranked after every clean hit (``'downrank'``); ``risk_report`` lists the
+    sources that were kept out of a top-k.
+
+    With a ``bootstrap`` the retriever never builds the index itself: until the bootstrap
+    reports ready it serves ``degraded`` BM25 results, from the published index if one exists
+    or from an in-memory index over the raw corpus chunks, and then switches to the full index.
+
+    Newly published generations are picked up without a restart: at most every
+    ``reload_interval`` seconds a query checks the store's ``CURRENT`` pointer and, if it moved,
+    a background thread opens the new generation and swaps it in. Each query pins the state it
+    started with, and a replaced generation is closed once its last reader finishes.
+
+    Every subdirectory of the corpus is a named collection with its own shard (a child retriever
+    with ``collection`` set). ``retrieve`` searches the ``collections`` it is given or, without a
+    filter, routes each query to the ``route_top_n`` shards whose centroid vectors are closest to
+    it, then merges the partial top-k lists by score.
+    """
+
+    def __init__(
+        self,
+        settings=None,
+        top_k: int = 3,
+        *,
+        mode: str | None = None,
+        search_mode: str | None = None,
+        nprobe: int | None = None,
+        rescore: int | None = None,
+        cache: RetrievalCache | None = None,
+        bootstrap: IndexBootstrap | None = None,
+        reload_interval: float | None = None,
+        collection: str = DEFAULT_COLLECTION,
+        route_top_n: int | None = None,
+        query_encoder: str | None = None,
+        injection_policy: str | None = None,
+    ) -> None:
         self.settings = settings or get_settings()
         self.top_k = top_k
-        self._documents: List[str] = []
-        self._sources: List[str] = []
-        self._embeddings: np.ndarray = np.zeros((0, 1), dtype=np.float32)
-        self._model_name: str = "sentence-transformers/all-MiniLM-L6-v2"
-        self._model: SentenceTransformer | None = None
-        self._ensure_index()
+        self.mode = (mode or self.settings.RAG_RETRIEVAL_MODE or 'dense').lower()
+        if self.mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Unknown retrieval mode '{self.mode}'; expected one of {RETRIEVAL_MODES}")
+        self.search_mode = (search_mode or self.settings.RAG_SEARCH_MODE or 'auto').lower()
+        self.nprobe = nprobe or self.settings.RAG_IVF_NPROBE
+        self.rescore = rescore or self.settings.RAG_RESCORE_FACTOR
+        self.query_encoder = (query_encoder or self.settings.RAG_QUERY_ENCODER or 'default').lower()
+        self.query_options = query_encoder_options(self.settings, self.query_encoder)
+        self.injection_policy = (injection_policy or self.settings.RAG_INJECTION_POLICY or 'off').lower()
+        if self.injection_policy not in INJECTION_POLICIES:
+            raise ValueError(
+                f"Unknown injection policy '{self.injection_policy}'; expected one of {INJECTION_POLICIES}"
+            )
+        self._suppressed: Dict[str, int] = {}
+        self.cache = cache or get_retrieval_cache()
+        if reload_interval is None:
+            reload_interval = self.settings.RAG_RELOAD_CHECK_SECONDS
+        self.reload_interval = reload_interval
+        self.collection = collection
+        self.route_top_n = self.settings.RAG_ROUTE_TOP_N if route_top_n is None else route_top_n
+        self._state_lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._reloading = False
+        self._last_check = time.monotonic()
+        index_root, _ = resolve_index_root(Path(self.settings.RAG_INDEX_PATH))
+        self._store = IndexStore(collection_index_root(index_root, collection))
+        if bootstrap is None or bootstrap.ready:
+            self._state = self._load_state()
+        else:
+            self._state = self._degraded_state()
+            bootstrap.on_ready(self.refresh)
+        self._shards: Dict[str, CorpusRetriever] = {collection: self}
+        if collection == DEFAULT_COLLECTION:
+            for name in discover_collections(DEFAULT_CORPUS_DIR, index_root)[1:]:
+                self._shards[name] = CorpusRetriever(
+                    self.settings,
+                    top_k,
+                    mode=self.mode,
+                    search_mode=self.search_mode,
+                    nprobe=self.nprobe,
+                    rescore=self.rescore,
+                    cache=self.cache,
+                    bootstrap=bootstrap,
+                    reload_interval=reload_interval,
+                    collection=name,
+                    query_encoder=self.query_encoder,
+                    injection_policy=self.injection_policy,
+                )
+
+    @property
+    def model(self) -> EmbeddingModel:
+        return get_embedding_model(self._state.model_name)
 
     @property
-    def model(self) -> SentenceTransformer:
-        if self._model is None:
-            self._model = SentenceTransformer(self._model_name)
-        return self._model
-
-    def _ensure_index(self) -> None:
-        index_path = Path(self.settings.RAG_INDEX_PATH)
-        if not index_path.exists():
-            corpus_dir = Path(__file__).resolve().parent.parent / 'data' / 'corpus'
-            CorpusIndexer(corpus_dir, index_path).build()
-        with index_path.open('rb') as fh:
-            payload = pickle.load(fh)
-        if 'embeddings' not in payload:
-            corpus_dir = Path(__file__).resolve().parent.parent / 'data' / 'corpus'
-            CorpusIndexer(corpus_dir, index_path).build()
-            with index_path.open('rb') as fh:
-                payload = pickle.load(fh)
-        self._documents = payload['documents']
-        self._sources = payload['sources']
-        self._embeddings = np.asarray(payload['embeddings'], dtype=np.float32)
-        self._model_name = payload.get('model_name', self._model_name)
-
-    def retrieve(self, query: str, top_k: int | None = None) -> List[RetrieverResult]:
-        query = (query or '').strip()
-        if not query or not len(self._documents):
-            return []
+    def degraded(self) -> bool:
+        return any(shard._state.degraded for shard in self._shards.values())
+
+    @property
+    def collections(self) -> List[str]:
+        return list(self._shards)
+
+    @property
+    def generation(self) -> int | None:
+        return self._state.generation
+
+    def sources_for(self, source: str) -> List[str]:
+        "``source`` followed by every source whose duplicate chunk the indexer collapsed into it."
+        aliases = [alias for shard in self._shards.values() for alias in shard._state.aliases.get(source, ())]
+        return [source, *aliases]
+
+    def refresh(self) -> None:
+        "Open the current index generation and swap it in, leaving degraded mode."
+        with self._reload_lock:
+            self._swap(self._load_state())
+
+    def reload(self, *, force: bool = False) -> Dict[str, object]:
+        """Swap in the generation ``CURRENT`` points at if it differs from the one being served.
+
+        Safe to call while queries run; they finish on the generation they started with.
+        """
+        result = self._reload_shard(force)
+        children = {
+            name: shard._reload_shard(force) for name, shard in self._shards.items() if shard is not self
+        }
+        if children:
+            result['collections'] = children
+        return result
+
+    def _reload_shard(self, force: bool) -> Dict[str, object]:
+        with self._reload_lock:
+            previous = self._state
+            current = self._store.current_path()
+            stale = previous.degraded or previous.snapshot is None or previous.snapshot.path != current
+            if current is not None and (stale or force):
+                self._swap(self._load_state())
+        return {'previous': previous.generation, 'current': self.generation, 'swapped': self._state is not previous}
+
+    def _maybe_reload(self) -> None:
+        "Cheap periodic check of the ``CURRENT`` pointer; a moved pointer reloads off-thread."
+        if self.reload_interval <= 0 or self._state.degraded:
+            return
+        now = time.monotonic()
+        if now - self._last_check < self.reload_interval:
+            return
+        self._last_check = now
+        snapshot = self._state.snapshot
+        if snapshot is None or self._store.current_path() == snapshot.path:
+            return
+        with self._state_lock:
+            if self._reloading:
+                return
+            self._reloading = True
+
+        def run() -> None:
+            try:
+                self.reload()
+            finally:
+                with self._state_lock:
+                    self._reloading = False
+
+        threading.Thread(target=run, name='rag-index-reload', daemon=True).start()
+
+    def _swap(self, state: _IndexState) -> None:
+        with self._state_lock:
+            previous, self._state = self._state, state
+            previous.retired = True
+            drained = previous.readers == 0
+        if drained:
+            previous.close()
+
+    def _acquire(self) -> _IndexState:
+        with self._state_lock:
+            state = self._state
+            state.readers += 1
+            return state
+
+    def _release(self, state: _IndexState) -> None:
+        with self._state_lock:
+            state.readers -= 1
+            drained = state.retired and state.readers == 0
+        if drained:
+            state.close()
+
+    def _load_state(self) -> _IndexState:
+        store = ensure_index(self.settings, DEFAULT_CORPUS_DIR, self.collection)
+        snapshot = store.open()
+        root = str(store.root.resolve())
+        self.cache.observe_index(root, snapshot.manifest.generation)
+        return _IndexState(
+            documents=snapshot.documents,
+            sources=snapshot.sources,
+            search=self._select_search(snapshot),
+            lexical=BM25Index.from_snapshot(snapshot),
+            model_name=snapshot.manifest.model_name,
+            version=f'{root}@{snapshot.manifest.generation}',
+            degraded=False,
+            snapshot=snapshot,
+            aliases=alias_map(snapshot.manifest.extra.get('files', {})),
+            centroid=self._centroid(snapshot),
+            risk=ChunkRisk.from_snapshot(snapshot),
+        )
+
+    @staticmethod
+    def _centroid(snapshot: IndexSnapshot) -> np.ndarray | None:
+        "Routing vector of the shard; generations published before routing get it computed here."
+        published = snapshot.load_array(CENTROID_ARRAY)
+        if published is not None:
+            return np.asarray(published, dtype=np.float32)
+        return centroid(snapshot.embeddings) if snapshot.manifest.count else None
+
+    def _degraded_state(self) -> _IndexState:
+        "Lexical-only state that needs neither the embedding model nor a finished index build."
+        root = self._store.root.resolve()
+        empty = ExactSearch(np.zeros((0, 1), dtype=np.float32))
+        if self._store.exists():
+            snapshot = self._store.open()
+            lexical = BM25Index.from_snapshot(snapshot)
+            if lexical is not None:
+                return _IndexState(
+                    documents=snapshot.documents,
+                    sources=snapshot.sources,
+                    search=empty,
+                    lexical=lexical,
+                    model_name=snapshot.manifest.model_name,
+                    version=f'{root}@{snapshot.manifest.generation}:degraded',
+                    degraded=True,
+                    snapshot=snapshot,
+                    aliases=alias_map(snapshot.manifest.extra.get('files', {})),
+                    risk=ChunkRisk.from_snapshot(snapshot),
+                )
+            snapshot.close()
+        indexer = CorpusIndexer.from_settings(self.settings, DEFAULT_CORPUS_DIR, collection=self.collection)
+        documents: List[str] = []
+        sources: List[str] = []
+        for source, chunk in indexer.iter_chunks():
+            sources.append(source)
+            documents.append(chunk)
+        builder = BM25Builder()
+        builder.add(documents)
+        return _IndexState(
+            documents=documents,
+            sources=sources,
+            search=empty,
+            lexical=BM25Index.from_arrays(builder.arrays(), k1=builder.k1, b=builder.b),
+            model_name=indexer.model_name,
+            version=f'{root}@corpus:degraded',
+            degraded=True,
+            risk=ChunkRisk.scan(documents),
+        )
+
+    def _select_search(self, snapshot: IndexSnapshot) -> VectorSearch:
+        if self.search_mode in ('auto', 'ivf'):
+            ivf = IVFSearch.from_snapshot(snapshot, nprobe=self.nprobe)
+            if ivf is not None:
+                return ivf
+        if self.search_mode in ('auto', 'quantized'):
+            quantized = QuantizedSearch.from_snapshot(snapshot, rescore=self.rescore)
+            if quantized is not None:
+                return quantized
+        return ExactSearch(snapshot.embeddings)
+
+    def retrieve(
+        self, query: str, top_k: int | None = None, *, collections: Sequence[str] | None = None
+    ) -> List[RetrieverResult]:
+        return self.retrieve_many([query], top_k, collections=collections)[0]
+
+    def retrieve_many(
+        self,
+        queries: Sequence[str],
+        top_k: int | None = None,
+        *,
+        collections: Sequence[str] | None = None,
+    ) -> List[List[RetrieverResult]]:
+        """Retrieve for several queries at once.
+
+        Queries missing from the caches are encoded in one batched forward pass and scored with a
+        single matrix product, so prefetching a whole plan costs about as much as one lookup.
+        """
+        scored = self.retrieve_scored(queries, top_k, collections=collections)
+        return [[(text, source) for text, source, _ in hits] for hits in scored]
+
+    def retrieve_scored(
+        self,
+        queries: Sequence[str],
+        top_k: int | None = None,
+        *,
+        collections: Sequence[str] | None = None,
+    ) -> List[List[ScoredResult]]:
+        "``retrieve_many`` with the ranking score of each hit, merged across the searched shards."
         top_k = top_k or self.top_k
-        query_vector = self.model.encode([query], convert_to_numpy=True, normalize_embeddings=True)[0]
-        scores = self._embeddings @ query_vector
-        ranked = np.argsort(-scores)[:top_k]
-        return [(self._documents[idx], self._sources[idx]) for idx in ranked]
+        if collections is None:
+            shards = list(self._shards.values())
+        else:
+            unknown = sorted(set(collections) - set(self._shards))
+            if unknown:
+                raise ValueError(f'Unknown collections {unknown}; expected some of {self.collections}')
+            shards = [self._shards[name] for name in dict.fromkeys(collections)]
+        if len(shards) == 1:
+            return shards[0]._search_shard(queries, top_k)
+
+        routes = self._route(queries, shards) if collections is None else [shards] * len(queries)
+        partials: List[List[ScoredResult]] = [[] for _ in queries]
+        for shard in shards:
+            positions = [position for position, route in enumerate(routes) if shard in route]
+            if not positions:
+                continue
+            for position, hits in zip(positions, shard._search_shard([queries[p] for p in positions], top_k)):
+                partials[position].extend(hits)
+        return [heapq.nlargest(top_k, hits, key=lambda hit: hit[2]) for hits in partials]
+
+    def _route(self, queries: Sequence[str], shards: List['CorpusRetriever']) -> List[List['CorpusRetriever']]:
+        """Shards to search per query: the ``route_top_n`` whose centroids score highest against the
+        query embedding. Lexical mode, degraded shards and ``route_top_n <= 0`` search everything."""
+        routable = [shard for shard in shards if shard._state.centroid is not None]
+        state = self._state
+        if self.mode == 'lexical' or state.degraded or not 0 < self.route_top_n < len(routable):
+            return [shards] * len(queries)
+        fixed = [shard for shard in shards if shard._state.degraded]
+        normalised = [normalise_query(query) for query in queries]
+        vectors = self._encode_queries(state, [query or ' ' for query in normalised])
+        centroids = np.stack([shard._state.centroid for shard in routable])  # type: ignore[misc]
+        scores = vectors @ centroids.T
+        routes = []
+        for row in scores:
+            best = np.argsort(-row, kind='stable')[: self.route_top_n]
+            routes.append(fixed + [routable[idx] for idx in sorted(best.tolist())])
+        return routes
+
+    def _search_shard(self, queries: Sequence[str], top_k: int) -> List[List[ScoredResult]]:
+        self._maybe_reload()
+        state = self._acquire()
+        try:
+            return self._retrieve_many(state, queries, top_k)
+        finally:
+            self._release(state)
+
+    def _retrieve_many(
+        self, state: _IndexState, queries: Sequence[str], top_k: int
+    ) -> List[List[ScoredResult]]:
+        normalised = [normalise_query(query) for query in queries]
+        results: List[List[ScoredResult] | None] = [None] * len(normalised)
+        pending: Dict[str, List[int]] = {}
+        for position, query in enumerate(normalised):
+            if not query or not len(state.documents):
+                results[position] = []
+                continue
+            cached = self.cache.results.get(self._result_key(state, query, top_k))
+            if cached is not None:
+                results[position] = list(cached)
+            else:
+                pending.setdefault(query, []).append(position)
+
+        if pending:
+            unique = list(pending)
+            ranked, scores = self._rank_guarded(state, unique, top_k)
+            for query, row, row_scores in zip(unique, ranked, scores):
+                hits = tuple(
+                    (state.documents[idx], state.sources[idx], float(score))
+                    for idx, score in zip(row, row_scores)
+                    if idx >= 0
+                )
+                self.cache.results.put(self._result_key(state, query, top_k), hits)
+                for position in pending[query]:
+                    results[position] = list(hits)
+        return [hits or [] for hits in results]
+
+    def _rank_guarded(self, state: _IndexState, queries: List[str], top_k: int) -> SearchHits:
+        "``_rank`` with flagged chunks filtered out or demoted according to ``injection_policy``."
+        risk = state.risk
+        if self.injection_policy == 'off' or risk is None or not risk.flagged:
+            return self._rank(state, queries, top_k)
+        ids, scores = self._rank(state, queries, top_k + min(risk.flagged, RISK_OVERFETCH))
+        guarded = np.full((len(queries), top_k), -1, dtype=np.int64)
+        guarded_scores = np.full((len(queries), top_k), -np.inf, dtype=np.float32)
+        suppressed: List[str] = []
+        for row in range(len(queries)):
+            valid = ids[row] >= 0
+            flagged = valid & (risk.scores[np.maximum(ids[row], 0)] > 0)
+            clean = valid & ~flagged
+            row_scores = scores[row].astype(np.float64)
+            if self.injection_policy == 'downrank':
+                row_scores = np.where(flagged, row_scores - RISK_DEMOTION, row_scores)
+                order = np.concatenate([np.flatnonzero(clean), np.flatnonzero(flagged)])[:top_k]
+            else:
+                order = np.flatnonzero(clean)[:top_k]
+            guarded[row, : len(order)] = ids[row][order]
+            guarded_scores[row, : len(order)] = row_scores[order]
+            # Flagged chunks that would have made the top-k but were dropped or pushed out of it.
+            kept = set(ids[row][order].tolist())
+            pushed = [idx for idx in ids[row][:top_k][flagged[:top_k]].tolist() if idx not in kept]
+            suppressed.extend(state.sources[idx] for idx in pushed)
+        if suppressed:
+            with self._state_lock:
+                for source in suppressed:
+                    self._suppressed[source] = self._suppressed.get(source, 0) + 1
+        return guarded, guarded_scores
+
+    def risk_report(self) -> Dict[str, object]:
+        "Flagged chunks per collection and how often each source was kept out of a top-k."
+        collections: Dict[str, object] = {}
+        suppressed: Dict[str, int] = {}
+        for name, shard in self._shards.items():
+            state = shard._state
+            risk = state.risk
+            flagged = []
+            if risk is not None:
+                flagged = [
+                    {'source': state.sources[row], 'score': float(risk.scores[row]), 'rules': risk.reasons(row)}
+                    for row in np.flatnonzero(risk.scores > 0).tolist()
+                ]
+            collections[name] = {'scanned': risk is not None, 'flagged': flagged}
+            with shard._state_lock:
+                suppressed.update(shard._suppressed)
+        return {'policy': self.injection_policy, 'collections': collections, 'suppressed': suppressed}
+
+    def _rank(self, state: _IndexState, queries: List[str], top_k: int) -> SearchHits:
+        "Row ids per query, best first and padded with -1, with their ranking scores."
+        lexical = state.lexical
+        if state.degraded:
+            if lexical is None:
+                return (
+                    np.full((len(queries), top_k), -1, dtype=np.int64),
+                    np.full((len(queries), top_k), -np.inf, dtype=np.float32),
+                )
+            return lexical.search_many(queries, top_k)
+        # Generations published before the inverted index existed can only be ranked densely.
+        if lexical is None or self.mode == 'dense':
+            return state.search.search_many(self._encode_queries(state, queries), top_k)
+        if self.mode == 'lexical':
+            return lexical.search_many(queries, top_k)
+        depth = max(top_k, HYBRID_CANDIDATES)
+        dense_ids, _ = state.search.search_many(self._encode_queries(state, queries), depth)
+        lexical_ids, _ = lexical.search_many(queries, depth)
+        fused = np.full((len(queries), top_k), -1, dtype=np.int64)
+        fused_scores = np.full((len(queries), top_k), -np.inf, dtype=np.float32)
+        for row in range(len(queries)):
+            ids, scores = reciprocal_rank_fusion([dense_ids[row], lexical_ids[row]], top_k)
+            fused[row, : len(ids)] = ids
+            fused_scores[row, : len(scores)] = scores
+        return fused, fused_scores
+
+    def _result_key(self, state: _IndexState, query: str, top_k: int) -> Tuple[object, ...]:
+        options = (self.mode, self.search_mode, self.nprobe, self.rescore, self.injection_policy)
+        return (query, top_k, state.version, *options)
+
+    def _encode_queries(self, state: _IndexState, queries: List[str]) -> np.ndarray:
+        model_name = state.model_name
+        if self.query_options is not None:
+            model_name = f'{model_name}@{self.query_options.key}'
+        vectors: List[np.ndarray | None] = [self.cache.vectors.get((model_name, q)) for q in queries]
+        missing = [idx for idx, vector in enumerate(vectors) if vector is None]
+        if missing:
+            encoded = self._encode_missing(state, [queries[idx] for idx in missing])
+            for idx, vector in zip(missing, np.asarray(encoded, dtype=np.float32)):
+                vector = np.array(vector)
+                vector.setflags(write=False)
+                self.cache.vectors.put((model_name, queries[idx]), vector, vector.nbytes)
+                vectors[idx] = vector
+        return np.stack(vectors)  # type: ignore[arg-type]
+
+    def _encode_missing(self, state: _IndexState, queries: List[str]) -> np.ndarray:
+        "Encode through the shared micro-batcher, so concurrent requests share a forward pass."
+        if not self.settings.RAG_EMBED_BATCHING:
+            encoder = get_query_encoder(state.model_name, self.query_options)
+            return encoder.encode(queries, convert_to_numpy=True, normalize_embeddings=True)
+        batcher = get_embedding_batcher(
+            state.model_name,
+            self.query_options,
+            max_batch_size=self.settings.RAG_EMBED_BATCH_MAX_SIZE,
+            max_wait_ms=self.settings.RAG_EMBED_BATCH_MAX_WAIT_MS,
+        )
+        return batcher.encode(queries)
+
+
+def cited_sources(
+    retrieved: Sequence[RetrieverResult], sources_for: Callable[[str], List[str]] | None = None
+) -> List[str]:
+    """Distinct sources of ``retrieved`` in rank order. With ``sources_for`` (a retriever's
+    ``sources_for``) each is followed by the sources whose duplicate chunk was collapsed into it."""
+    sources = (source for _, source in retrieved)
+    if sources_for is not None:
+        sources = (cited for source in list(sources) for cited in sources_for(source))
+    return list(dict.fromkeys(sources))
 
 
-def require_citations(text: str, retrieved: Sequence[RetrieverResult]) -> str:
+def require_citations(
+    text: str, retrieved: Sequence[RetrieverResult], sources_for: Callable[[str], List[str]] | None = None
+) -> str:
     if not retrieved:
         return text
-    cited = list(dict.fromkeys(source for _, source in retrieved))
+    cited = cited_sources(retrieved, sources_for)
     citation_tags = ' '.join(f"[source:{source}]" for source in cited)
     if citation_tags in text:
         return text
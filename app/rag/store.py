@@ -0,0 +1,394 @@
+from __future__ import annotations
+
+import json
+import mmap
+import os
+import pickle
+import shutil
+import struct
+import uuid
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Sequence, Tuple, overload
+
+import numpy as np
+
+FORMAT_VERSION = 1
+CURRENT_POINTER = 'CURRENT'
+MANIFEST_FILE = 'manifest.json'
+EMBEDDINGS_FILE = 'embeddings.npy'
+DOCUMENTS_FILE = 'documents.bin'
+OFFSETS_FILE = 'documents.offsets.npy'
+SOURCES_FILE = 'sources.json'
+KEEP_GENERATIONS = 2
+DEFAULT_DIMENSION = 384
+NPY_HEADER_BYTES = 128
+
+
+class IndexFormatError(RuntimeError):
+    pass
+
+
+def _npy_header(shape: Tuple[int, ...], dtype: np.dtype) -> bytes:
+    # Fixed-size v1.0 header so a streamed file can be stamped with its final shape in place.
+    body = repr({'descr': np.lib.format.dtype_to_descr(dtype), 'fortran_order': False, 'shape': shape})
+    body = body.ljust(NPY_HEADER_BYTES - 11) + '\n'
+    return np.lib.format.MAGIC_PREFIX + bytes([1, 0]) + struct.pack('<H', len(body)) + body.encode('latin1')
+
+
+class _NpyAppender:
+    "Appends rows to a ``.npy`` file of not-yet-known length."
+
+    def __init__(self, path: Path, dtype: Any, row_shape: Tuple[int, ...] | None = None) -> None:
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.row_shape = row_shape
+        self.rows = 0
+        self._fh = path.open('wb')
+        self._fh.write(b'\x00' * NPY_HEADER_BYTES)
+
+    def append(self, block: np.ndarray) -> None:
+        block = np.ascontiguousarray(block, dtype=self.dtype)
+        if self.row_shape is None:
+            self.row_shape = tuple(block.shape[1:])
+        if tuple(block.shape[1:]) != self.row_shape:
+            raise ValueError(f'expected rows of shape {self.row_shape}, got {block.shape[1:]}')
+        self._fh.write(block.tobytes())
+        self.rows += len(block)
+
+    def close(self) -> None:
+        if self._fh.closed:
+            return
+        self._fh.seek(0)
+        self._fh.write(_npy_header((self.rows, *(self.row_shape or ())), self.dtype))
+        self._fh.close()
+
+
+def resolve_index_root(path: Path) -> Tuple[Path, Path | None]:
+    "Map a configured index path onto the index directory and any legacy pickle next to it."
+    path = Path(path)
+    if path.suffix == '.pkl':
+        return path.with_suffix(''), path
+    return path, path.with_suffix('.pkl')
+
+
+@dataclass
+class IndexManifest:
+    generation: int
+    model_name: str
+    dimension: int
+    count: int
+    format_version: int = FORMAT_VERSION
+    created_at: str = field(default_factory=lambda: datetime.utcnow().isoformat())
+    extra: Dict[str, Any] = field(default_factory=dict)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'IndexManifest':
+        version = int(data.get('format_version', 0))
+        if version != FORMAT_VERSION:
+            raise IndexFormatError(f'Unsupported index format version {version}')
+        return cls(
+            generation=int(data['generation']),
+            model_name=str(data['model_name']),
+            dimension=int(data['dimension']),
+            count=int(data['count']),
+            format_version=version,
+            created_at=str(data.get('created_at', '')),
+            extra=dict(data.get('extra', {})),
+        )
+
+
+class DocumentBlob(Sequence[str]):
+    "Read-only view over the offset-indexed chunk texts, decoded lazily from a memory map."
+
+    def __init__(self, blob_path: Path, offsets_path: Path) -> None:
+        self._offsets = np.load(offsets_path, mmap_mode='r')
+        self._file = blob_path.open('rb')
+        if blob_path.stat().st_size:
+            self._buffer: mmap.mmap | bytes = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self._buffer = b''
+
+    def __len__(self) -> int:
+        return max(0, len(self._offsets) - 1)
+
+    @overload
+    def __getitem__(self, index: int) -> str: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> List[str]: ...
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        index = int(index)
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('document index out of range')
+        start, end = int(self._offsets[index]), int(self._offsets[index + 1])
+        return bytes(self._buffer[start:end]).decode('utf-8')
+
+    def __iter__(self) -> Iterator[str]:
+        for index in range(len(self)):
+            yield self[index]
+
+    def close(self) -> None:
+        if isinstance(self._buffer, mmap.mmap):
+            self._buffer.close()
+        self._file.close()
+
+
+@dataclass
+class IndexSnapshot:
+    "One opened index generation; the embedding matrix and documents are backed by the OS page cache."
+
+    path: Path
+    manifest: IndexManifest
+    documents: Sequence[str]
+    sources: List[str]
+    embeddings: np.ndarray
+
+    def load_array(self, name: str) -> np.ndarray | None:
+        "Memory-map an auxiliary array published alongside the matrix, if this generation has one."
+        path = self.path / f'{name}.npy'
+        if not path.exists():
+            return None
+        return np.load(path, mmap_mode='r')
+
+    def close(self) -> None:
+        if isinstance(self.documents, DocumentBlob):
+            self.documents.close()
+
+
+class IndexStore:
+    "Reads and atomically publishes generations of the on-disk RAG index."
+
+    def __init__(self, root: Path) -> None:
+        self.root = Path(root)
+
+    def exists(self) -> bool:
+        return self.current_path() is not None
+
+    def current_path(self) -> Path | None:
+        pointer = self.root / CURRENT_POINTER
+        if not pointer.exists():
+            return None
+        path = self.root / pointer.read_text(encoding='utf-8').strip()
+        if not (path / MANIFEST_FILE).exists():
+            return None
+        return path
+
+    def read_manifest(self, path: Path | None = None) -> IndexManifest | None:
+        path = path or self.current_path()
+        if path is None:
+            return None
+        data = json.loads((path / MANIFEST_FILE).read_text(encoding='utf-8'))
+        return IndexManifest.from_dict(data)
+
+    def open(self) -> IndexSnapshot:
+        path = self.current_path()
+        if path is None:
+            raise FileNotFoundError(f'No published index under {self.root}')
+        manifest = self.read_manifest(path)
+        assert manifest is not None
+        if manifest.count:
+            embeddings = np.load(path / EMBEDDINGS_FILE, mmap_mode='r')
+        else:
+            embeddings = np.zeros((0, manifest.dimension), dtype=np.float32)
+        if embeddings.shape != (manifest.count, manifest.dimension) or embeddings.dtype != np.float32:
+            raise IndexFormatError(f'Embedding matrix in {path} does not match its manifest')
+        sources = json.loads((path / SOURCES_FILE).read_text(encoding='utf-8'))
+        documents = DocumentBlob(path / DOCUMENTS_FILE, path / OFFSETS_FILE)
+        if len(documents) != manifest.count or len(sources) != manifest.count:
+            documents.close()
+            raise IndexFormatError(f'Document table in {path} does not match its manifest')
+        return IndexSnapshot(
+            path=path,
+            manifest=manifest,
+            documents=documents,
+            sources=sources,
+            embeddings=embeddings,
+        )
+
+    def writer(self, model_name: str, *, dimension: int = DEFAULT_DIMENSION) -> 'IndexWriter':
+        "Start streaming a new generation into a staging directory; nothing is visible until commit."
+        self.root.mkdir(parents=True, exist_ok=True)
+        return IndexWriter(self, model_name, dimension=dimension)
+
+    def publish(
+        self,
+        documents: Sequence[str],
+        sources: Sequence[str],
+        embeddings: np.ndarray,
+        *,
+        model_name: str,
+        extra: Dict[str, Any] | None = None,
+        arrays: Dict[str, np.ndarray] | None = None,
+    ) -> IndexManifest:
+        "Write a fully materialised generation and flip ``CURRENT`` to it."
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if embeddings.ndim != 2 or embeddings.shape[0] != len(documents) or len(sources) != len(documents):
+            raise ValueError('documents, sources and embeddings must have matching lengths')
+        with self.writer(model_name, dimension=int(embeddings.shape[1])) as writer:
+            writer.append(documents, sources, embeddings)
+            return writer.commit(extra=extra, arrays=arrays)
+
+    def migrate_legacy(self, pickle_path: Path) -> IndexManifest | None:
+        "One-shot conversion of a pickled index written by older releases; returns None if unusable."
+        pickle_path = Path(pickle_path)
+        if not pickle_path.exists():
+            return None
+        with pickle_path.open('rb') as fh:
+            payload = pickle.load(fh)
+        if not isinstance(payload, dict) or 'embeddings' not in payload:
+            return None
+        documents = list(payload.get('documents', []))
+        embeddings = np.asarray(payload['embeddings'], dtype=np.float32)
+        if not documents:
+            # An empty pickled list loses its column count.
+            embeddings = embeddings.reshape(0, embeddings.shape[-1] if embeddings.ndim == 2 else 384)
+        return self.publish(
+            documents,
+            list(payload.get('sources', [])),
+            embeddings,
+            model_name=str(payload.get('model_name', 'sentence-transformers/all-MiniLM-L6-v2')),
+            extra={'migrated_from': pickle_path.name},
+        )
+
+    def _generations(self) -> List[int]:
+        generations = []
+        for child in self.root.glob('gen-*'):
+            try:
+                generations.append(int(child.name.split('-', 1)[1]))
+            except ValueError:
+                continue
+        return sorted(generations)
+
+    def _next_generation(self) -> int:
+        generations = self._generations()
+        return (generations[-1] if generations else 0) + 1
+
+    @staticmethod
+    def _generation_name(generation: int) -> str:
+        return f'gen-{generation:06d}'
+
+    def _promote(self, staging: Path, manifest: IndexManifest) -> None:
+        final = self.root / self._generation_name(manifest.generation)
+        os.rename(staging, final)
+        self._point_current_at(final.name)
+        self._prune()
+
+    def _point_current_at(self, name: str) -> None:
+        pointer = self.root / CURRENT_POINTER
+        staging = self.root / f'{CURRENT_POINTER}.{uuid.uuid4().hex}'
+        staging.write_text(name, encoding='utf-8')
+        os.replace(staging, pointer)
+
+    def _prune(self) -> None:
+        # Readers keep their own mappings open, so unlinking superseded generations is safe.
+        for generation in self._generations()[:-KEEP_GENERATIONS]:
+            shutil.rmtree(self.root / self._generation_name(generation), ignore_errors=True)
+
+
+class IndexWriter:
+    """Streams chunks, sources and embedding rows of one generation straight to disk.
+
+    Memory use is bounded by whatever block the caller appends. The generation only becomes
+    visible on :meth:`commit`; leaving the context manager without committing discards it.
+    """
+
+    def __init__(self, store: IndexStore, model_name: str, *, dimension: int) -> None:
+        self.store = store
+        self.model_name = model_name
+        self.dimension = dimension
+        self.staging = store.root / f'.tmp-{uuid.uuid4().hex}'
+        self.staging.mkdir()
+        self._embeddings = _NpyAppender(self.staging / EMBEDDINGS_FILE, np.float32)
+        self._offsets = _NpyAppender(self.staging / OFFSETS_FILE, np.int64, ())
+        self._offsets.append(np.zeros(1, dtype=np.int64))
+        self._documents = (self.staging / DOCUMENTS_FILE).open('wb')
+        self._sources = (self.staging / SOURCES_FILE).open('w', encoding='utf-8')
+        self._sources.write('[')
+        self._first_source = True
+        self._position = 0
+        self._done = False
+
+    def __enter__(self) -> 'IndexWriter':
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        if not self._done:
+            self.abort()
+
+    @property
+    def count(self) -> int:
+        return self._offsets.rows - 1
+
+    def append(self, documents: Sequence[str], sources: Iterable[str], embeddings: np.ndarray) -> None:
+        sources = list(sources)
+        if len(embeddings) != len(documents) or len(sources) != len(documents):
+            raise ValueError('documents, sources and embeddings must have matching lengths')
+        if not len(documents):
+            return
+        offsets = np.empty(len(documents), dtype=np.int64)
+        for idx, document in enumerate(documents):
+            encoded = document.encode('utf-8')
+            self._documents.write(encoded)
+            self._position += len(encoded)
+            offsets[idx] = self._position
+        for source in sources:
+            self._sources.write(('' if self._first_source else ',') + json.dumps(source))
+            self._first_source = False
+        self._offsets.append(offsets)
+        self._embeddings.append(np.asarray(embeddings, dtype=np.float32))
+
+    def embeddings(self) -> np.ndarray:
+        "Finish the matrix and map it back read-only, e.g. to train search structures before commit."
+        if self._embeddings.row_shape is None:
+            self._embeddings.row_shape = (self.dimension,)
+        self._embeddings.close()
+        if not self._embeddings.rows:
+            return np.zeros((0, self._embeddings.row_shape[0]), dtype=np.float32)
+        return np.load(self._embeddings.path, mmap_mode='r')
+
+    def commit(
+        self,
+        *,
+        extra: Dict[str, Any] | None = None,
+        arrays: Dict[str, np.ndarray] | None = None,
+    ) -> IndexManifest:
+        matrix = self.embeddings()
+        self._offsets.close()
+        self._documents.close()
+        self._sources.write(']')
+        self._sources.close()
+        try:
+            for name, array in (arrays or {}).items():
+                np.save(self.staging / f'{name}.npy', np.ascontiguousarray(array))
+            manifest = IndexManifest(
+                generation=self.store._next_generation(),
+                model_name=self.model_name,
+                dimension=int(matrix.shape[1]),
+                count=self.count,
+                extra=dict(extra or {}),
+            )
+            (self.staging / MANIFEST_FILE).write_text(
+                json.dumps(asdict(manifest), indent=2, sort_keys=True), encoding='utf-8'
+            )
+            del matrix
+            self.store._promote(self.staging, manifest)
+        except BaseException:
+            self.abort()
+            raise
+        self._done = True
+        return manifest
+
+    def abort(self) -> None:
+        self._done = True
+        for handle in (self._documents, self._sources):
+            handle.close()
+        self._embeddings.close()
+        self._offsets.close()
+        shutil.rmtree(self.staging, ignore_errors=True)
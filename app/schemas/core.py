@@ -39,3 +39,5 @@ class RunMetrics(BaseModel):
     hallucination_rate: float
     p95_latency_ms: float
     total_cost_usd: float
+    critical_path_ms: float = 0.0
+    critical_path_no_overlap_ms: float = 0.0
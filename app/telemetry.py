@@ -4,11 +4,32 @@ import threading
 import time
 from collections import defaultdict
 from contextlib import contextmanager
-from typing import Dict, Iterable, List
+from contextvars import ContextVar
+from typing import Dict, Iterable, Iterator, List
 
 MetricStore = Dict[str, List[float]]
 _metrics: MetricStore = defaultdict(list)
 _lock = threading.Lock()
+# the store of the run being timed in this context, see metrics_scope
+_scope: ContextVar[MetricStore | None] = ContextVar('metrics_scope', default=None)
+
+
+def _store() -> MetricStore:
+    scoped = _scope.get()
+    return _metrics if scoped is None else scoped
+
+
+@contextmanager
+def metrics_scope() -> Iterator[MetricStore]:
+    """Record spans to a store of their own while the block runs, so runs in progress at the same
+    time don't collect each other's timings. Threads see the scope when started with a copy of the
+    context (``contextvars.copy_context().run``)."""
+    store: MetricStore = defaultdict(list)
+    token = _scope.set(store)
+    try:
+        yield store
+    finally:
+        _scope.reset(token)
 
 
 @contextmanager
@@ -19,17 +40,17 @@ def span(name: str):
     finally:
         duration_ms = (time.perf_counter() - start) * 1000
         with _lock:
-            _metrics[name].append(duration_ms)
+            _store()[name].append(duration_ms)
 
 
 def collect_metrics() -> MetricStore:
     with _lock:
-        return {k: list(v) for k, v in _metrics.items()}
+        return {k: list(v) for k, v in _store().items()}
 
 
 def reset_metrics() -> None:
     with _lock:
-        _metrics.clear()
+        _store().clear()
 
 
 def p95(durations_ms: Iterable[float]) -> float:
@@ -0,0 +1,52 @@
+import asyncio
+import re
+from typing import Callable, Iterator, List
+
+import pytest
+
+from app.config import Settings
+from app.metrics.llm_usage import LLMUsageLogger
+from providers.base import StubProvider
+
+
+class StubLLM(StubProvider):
+    """The stub provider with its calls recorded. ``hold`` runs before each answer (and after the
+    first chunk of a stream), so a test can keep a call in flight or make it fail."""
+
+    def __init__(self, settings: Settings) -> None:
+        super().__init__(settings)
+        self.calls: List[str] = []
+        self.streams: List[str] = []
+        self.hold: Callable[[], None] = lambda: None
+
+    def generate(self, prompt: str, system: str | None = None, max_tokens: int = 512) -> str:
+        self.calls.append(prompt)
+        self.hold()
+        return super().generate(prompt, system=system, max_tokens=max_tokens)
+
+    async def agenerate(self, prompt: str, system: str | None = None, max_tokens: int = 512) -> str:
+        self.calls.append(prompt)
+        await asyncio.to_thread(self.hold)
+        return super().generate(prompt, system=system, max_tokens=max_tokens)
+
+    def generate_stream(self, prompt: str, system: str | None = None, max_tokens: int = 512) -> Iterator[str]:
+        self.streams.append(prompt)
+        chunks = re.findall(r'\S+\s*', super().generate(prompt, system=system, max_tokens=max_tokens))
+        yield chunks[0]
+        self.hold()
+        yield from chunks[1:]
+
+
+@pytest.fixture
+def settings(tmp_path) -> Settings:
+    return Settings(DB_PATH=tmp_path / 'usage.sqlite')
+
+
+@pytest.fixture
+def usage_logger(settings: Settings) -> LLMUsageLogger:
+    return LLMUsageLogger(settings)
+
+
+@pytest.fixture
+def stub_llm(settings: Settings) -> StubLLM:
+    return StubLLM(settings)
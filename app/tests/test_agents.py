@@ -1,12 +1,22 @@
+import asyncio
+import contextlib
 import json
-import httpx
+import sqlite3
+import threading
 
+import httpx
 import pytest
 
-from app.llm import call_llm
-from app.llm_rate_limit import RateLimiter
+from app.config import Settings, get_settings
+from app.governance.costs import CostTracker
+from app.llm import acall_llm, call_llm
+from app.llm_rate_limit import RateLimiter, RateLimitExceeded
 from app.main import OpsCopilotRuntime, TaskRequest
+from app.metrics.llm_usage import LLMUsageLogger
 from app.schemas.core import ExecutionResult, PlanStep
+from app.telemetry import collect_metrics, metrics_scope, span
+from providers.base import LoopClients, StubProvider
+from providers.openai_provider import Provider
 
 
 def test_end_to_end_agents_happy_path():
@@ -137,3 +147,93 @@ def test_call_llm_retries_and_fallback():
     data = json.loads(result)
     assert isinstance(data.get("steps"), list)
     assert provider.calls == 2
+
+
+def test_acall_llm_retries_logs_usage_and_shares_limits(tmp_path):
+    settings = Settings(OPENAI_API_KEY='sk-test', DB_PATH=tmp_path / 'usage.sqlite')
+    seen = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        prompt = json.loads(request.content)['messages'][1]['content']
+        seen.append(prompt)
+        if prompt == 'flaky' and seen.count('flaky') == 1:
+            return httpx.Response(503, json={'error': 'busy'})
+        return httpx.Response(
+            200,
+            json={
+                'model': 'gpt-4o-mini',
+                'choices': [{'message': {'content': f'echo {prompt}'}}],
+                'usage': {'prompt_tokens': 3, 'completion_tokens': 2, 'total_tokens': 5},
+            },
+        )
+
+    provider = Provider(settings=settings)
+    provider._async_clients = LoopClients(base_url=provider.api_base, transport=httpx.MockTransport(handler))
+
+    async def run():
+        clients.append(provider._async_clients.get())
+        limiter = RateLimiter()
+        limiter.configure('provider:openai', per_minute=4)
+        calls = [
+            acall_llm(
+                provider,
+                system='s',
+                prompt=prompt,
+                usage_logger=LLMUsageLogger(settings),
+                rate_limiter=limiter,
+                rate_limit_keys=['provider:openai'],
+                backoff_seconds=0.01,
+            )
+            for prompt in ('flaky', 'b', 'c')
+        ]
+        results = await asyncio.gather(*calls)
+        with pytest.raises(RateLimitExceeded):
+            await limiter.aacquire('provider:openai', block=False)
+        await provider.aclose()
+        return results
+
+    clients = []
+    assert asyncio.run(run()) == ['echo flaky', 'echo b', 'echo c']
+    assert seen.count('flaky') == 2
+
+    async def again():
+        clients.append(provider._async_clients.get())
+        return await acall_llm(provider, system='s', prompt='again', usage_logger=LLMUsageLogger(settings))
+
+    # A later event loop gets its own client instead of the first loop's (closed) one.
+    assert asyncio.run(again()) == 'echo again'
+    assert clients[0] is not clients[1] and clients[0].is_closed
+    with sqlite3.connect(settings.DB_PATH) as conn:
+        rows = conn.execute('SELECT provider, model, total_tokens FROM llm_usage').fetchall()
+    assert rows == [('openai', 'gpt-4o-mini', 5)] * 4
+
+
+def test_provider_usage_and_costs_are_per_call_and_per_run_across_threads():
+    provider = StubProvider(get_settings())
+    tracker = CostTracker()
+    barrier = threading.Barrier(2)
+    usages, run_costs, run_spans = {}, {}, {}
+
+    def call(words: int, run: bool) -> None:
+        prompt = ' '.join(['word'] * words)
+        provider.generate(prompt)
+        barrier.wait()  # both calls have finished before either reads its usage
+        usages[words] = provider.pop_last_usage()['prompt_tokens']
+        scopes = (tracker.run_scope(), metrics_scope()) if run else (contextlib.nullcontext(),) * 2
+        with scopes[0], scopes[1]:
+            for _ in range(500):
+                tracker.track('a b c', 'd e f')
+                with span(f'call_{words}'):
+                    pass
+            run_costs[words], run_spans[words] = tracker.total_cost, set(collect_metrics())
+
+    threads = [threading.Thread(target=call, args=(words, words == 7)) for words in (3, 7)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=10)
+    assert usages == {3: 3, 7: 7}
+    # the run on the second thread counts its own calls only, and the first thread's stay out of it
+    unit = CostTracker().track('a b c', 'd e f')
+    assert run_costs[7] == pytest.approx(500 * unit) and tracker.total_cost == pytest.approx(500 * unit)
+    assert run_spans[7] == {'call_7'} and 'call_3' in collect_metrics() and 'call_7' not in collect_metrics()
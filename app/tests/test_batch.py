@@ -0,0 +1,122 @@
+import json
+import sqlite3
+from email import message_from_bytes, policy
+
+import httpx
+import pytest
+
+from app.config import Settings
+from app.evaluation.batch import BatchPending, BatchRunner
+from app.evaluation.harness import Scenario, evaluate
+from app.llm import call_llm
+from app.main import OpsCopilotRuntime, TaskRequest
+from app.schemas.core import PlanStep
+from providers.base import StubProvider, batch_output_line
+
+
+class BatchServer:
+    "Stand-in for the Files and Batches endpoints; jobs complete on their second status poll."
+
+    def __init__(self) -> None:
+        self.stub = StubProvider(Settings())
+        self.files = {}
+        self.batches = {}
+
+    def handle(self, request: httpx.Request) -> httpx.Response:
+        path = request.url.path.removeprefix('/v1')
+        assert path != '/chat/completions', 'batch mode must not make live calls'
+        if path == '/files':
+            head = f"Content-Type: {request.headers['content-type']}\r\n\r\n".encode()
+            form = message_from_bytes(head + request.content, policy=policy.HTTP)
+            part = next(part for part in form.iter_parts() if part.get_filename())
+            file_id = f'file-{len(self.files)}'
+            self.files[file_id] = part.get_payload(decode=True).decode()
+            return httpx.Response(200, json={'id': file_id})
+        if path == '/batches':
+            body = json.loads(request.content)
+            assert body['endpoint'] == '/v1/chat/completions'
+            batch_id = f'batch-{len(self.batches)}'
+            self.batches[batch_id] = {'input': body['input_file_id'], 'polls': 0}
+            return httpx.Response(200, json={'id': batch_id, 'status': 'validating'})
+        if path.startswith('/batches/'):
+            batch_id = path.rsplit('/', 1)[1]
+            batch = self.batches[batch_id]
+            batch['polls'] += 1
+            if batch['polls'] < 2:
+                return httpx.Response(200, json={'id': batch_id, 'status': 'in_progress'})
+            output_id = f"{batch['input']}-output"
+            if output_id not in self.files:
+                lines = self.files[batch['input']].splitlines()
+                self.files[output_id] = '\n'.join(self._answer(line) for line in lines)
+            return httpx.Response(200, json={'id': batch_id, 'status': 'completed', 'output_file_id': output_id})
+        file_id = path.split('/')[2]
+        return httpx.Response(200, text=self.files[file_id])
+
+    def _answer(self, line: str) -> str:
+        request = json.loads(line)
+        assert request['method'] == 'POST' and request['url'] == '/v1/chat/completions'
+        system, user = (message['content'] for message in request['body']['messages'])
+        text = self.stub.generate(user, system=system, max_tokens=request['body']['max_tokens'])
+        usage = {'prompt_tokens': 200, 'completion_tokens': 100, 'total_tokens': 300}
+        return json.dumps(batch_output_line(request['custom_id'], text, 'gpt-4o-mini', usage))
+
+
+def test_harness_batch_mode_runs_scenarios_through_batch_jobs(tmp_path):
+    settings = Settings(OPENAI_API_KEY='sk-test', LLM_PROVIDER='openai', DB_PATH=tmp_path / 'ops.sqlite')
+    server = BatchServer()
+    runtime = OpsCopilotRuntime(settings=settings, governed=True)
+    runtime.provider._client = httpx.Client(
+        base_url=runtime.provider.api_base, transport=httpx.MockTransport(server.handle)
+    )
+    scenarios = [
+        Scenario('Prepare release', 'Draft pull request summary referencing guidelines', ['release'], False),
+        Scenario('Rotate credentials', 'Update Jira ticket for the key rotation runbook', ['rotation'], True),
+    ]
+    runner = BatchRunner(settings, sleep=lambda seconds: None)
+    batched = evaluate(runtime, scenarios, auto_approve=True, batch=runner, label='governed')
+
+    live = OpsCopilotRuntime(governed=True)
+    assert batched['success_rate'] == evaluate(live, scenarios, auto_approve=True)['success_rate']
+    assert runtime.planner.provider is runtime.provider
+    stats = runner.stats()
+    assert stats['jobs'] == len(server.batches) >= 3
+    assert set(stats['requests_by_stage']) == {'planner', 'executor', 'reviewer'}
+    assert stats['failed_requests'] == 0
+    planned = runner.for_scenario('governed', 1)
+    assert planned[0].stage == 'planner' and planned[0].batch_id == 'batch-0'
+    with sqlite3.connect(settings.DB_PATH) as conn:
+        billed = conn.execute(
+            "SELECT COUNT(1), SUM(cost_usd) FROM llm_usage WHERE provider = 'openai-batch'"
+        ).fetchone()
+    assert billed[0] == stats['requests']
+    # 200 prompt + 100 completion tokens at half of gpt-4o-mini's list price
+    assert billed[1] == pytest.approx(stats['requests'] * (200 * 0.15 + 100 * 0.60) / 1e6 / 2)
+    # Scenarios resume where they were suspended: each runs once, with a live run's costs, and
+    # makes its audit writes and tool actions once.
+    assert len(runtime.recent_runs) == len(live.recent_runs) == len(scenarios)
+    costs = [[run.metrics.total_cost_usd for run in rt.recent_runs] for rt in (runtime, live)]
+    assert costs[0] == costs[1] and all(costs[0])
+    with sqlite3.connect(settings.DB_PATH) as conn:
+        audit = [(agent, action, json.loads(payload)) for agent, action, payload in conn.execute(
+            'SELECT agent, action, payload_json FROM audit_logs'
+        )]
+    received = [payload for _, action, payload in audit if action == 'step_received']
+    assert len({payload['step_id'] for payload in received}) == len(received)
+    tool_steps = [payload for payload in received if payload['tool'] in ('github', 'jira')]
+    assert tool_steps and len([agent for agent, _, _ in audit if agent.startswith('Mock')]) == len(tool_steps)
+
+
+def test_deferred_calls_skip_retries_and_fallbacks(stub_llm, usage_logger):
+    def pending() -> None:
+        raise BatchPending('executor-1')
+
+    stub_llm.hold = pending
+    with pytest.raises(BatchPending):
+        call_llm(stub_llm, system='s', prompt='p', usage_logger=usage_logger)
+    assert stub_llm.calls == ['p']
+
+    runtime = OpsCopilotRuntime(governed=True)
+    runtime.executor.provider = stub_llm
+    step = PlanStep(id='deferred-step', instruction='Summarise the rollout', tool='none')
+    with pytest.raises(BatchPending):
+        runtime.executor.act(runtime.create_task(TaskRequest(title='t', description='d', desired_outcome='o')), step)
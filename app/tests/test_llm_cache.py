@@ -0,0 +1,74 @@
+import json
+import sqlite3
+
+import numpy as np
+
+from app.llm import call_llm
+from app.llm_cache import LLMResponseCache, SemanticResponseCache
+
+
+class BagOfWords:
+    "A deterministic stand-in encoder: prompts with the same words get the same vector."
+
+    def encode(self, sentences, **kwargs):
+        vectors = np.zeros((len(sentences), 64), dtype=np.float32)
+        for row, sentence in enumerate(sentences):
+            for word in sentence.split():
+                vectors[row, sum(map(ord, word)) % 64] += 1
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def test_call_llm_response_cache_ttl_lru_and_agent_flags(settings, stub_llm, usage_logger):
+    cache = LLMResponseCache(settings, ttl_seconds=60, max_entries=2, agents='planner')
+
+    def ask(prompt: str, agent: str = 'planner') -> str:
+        return call_llm(
+            stub_llm, system='s', prompt=prompt, usage_logger=usage_logger, agent=agent, response_cache=cache
+        )
+
+    first = ask('alpha')
+    assert ask('alpha') == first and stub_llm.calls == ['alpha']
+    ask('alpha', agent='reviewer')
+    assert stub_llm.calls == ['alpha', 'alpha'], 'reviewer is not a cached agent'
+
+    ask('beta')
+    ask('alpha')  # refreshes alpha, so gamma evicts beta
+    ask('gamma')
+    ask('beta')
+    assert stub_llm.calls == ['alpha', 'alpha', 'beta', 'gamma', 'beta']
+    assert cache.stats()['entries'] == 2 and cache.stats()['evictions'] >= 1
+
+    with sqlite3.connect(settings.DB_PATH) as conn:
+        conn.execute('UPDATE llm_cache SET created_at = created_at - 120')
+    ask('gamma')
+    assert stub_llm.calls[-1] == 'gamma' and cache.stats()['expired'] == 1
+
+    with sqlite3.connect(settings.DB_PATH) as conn:
+        hits = conn.execute('SELECT cost_usd, latency_ms, total_tokens FROM llm_usage WHERE cache_hit = 1').fetchall()
+    assert len(hits) == 2 and all(cost == 0 and latency == 0 and tokens > 0 for cost, latency, tokens in hits)
+    assert usage_logger.cache_savings()['cache_hits'] == 2
+
+
+def test_semantic_cache_reuses_near_identical_prompts_per_agent(settings, stub_llm, usage_logger):
+    semantic = SemanticResponseCache(
+        settings, encoder=BagOfWords(), thresholds={'planner': 0.99}, audit_rate=1.0
+    )
+
+    def ask(prompt: str, agent: str = 'planner') -> str:
+        return call_llm(
+            stub_llm, system='s', prompt=prompt, usage_logger=usage_logger, agent=agent, semantic_cache=semantic
+        )
+
+    first = ask('Task 101: prepare   release notes for payments')
+    assert ask('task 202: Prepare release notes for payments') == first
+    assert ask('Rotate database credentials for payments') != first
+    ask('Task 7: prepare release notes for payments', agent='reviewer')
+
+    stats = semantic.stats()['agents']['planner']
+    assert (stats['hits'], stats['misses'], stats['entries']) == (1, 2, 2)
+    savings = usage_logger.cache_savings()
+    assert savings['layers']['semantic']['cache_hits'] == 1 and savings['calls'] == 4
+    with sqlite3.connect(settings.DB_PATH) as conn:
+        samples = conn.execute("SELECT payload_json FROM audit_logs WHERE action = 'semantic_cache_sample'").fetchall()
+    sample = json.loads(samples[0][0])
+    assert len(samples) == 1 and sample['similarity'] >= 0.99 and sample['prompt'].startswith('task 202')
@@ -0,0 +1,96 @@
+import asyncio
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app.llm import acall_llm, call_llm, stream_llm
+from app.llm_rate_limit import RateLimiter
+from app.llm_singleflight import SingleFlight
+
+
+@pytest.fixture
+def flights() -> SingleFlight:
+    return SingleFlight()
+
+
+def wait_for_waiters(flights: SingleFlight, count: int) -> None:
+    "Keep the leader's call in flight until ``count`` callers are waiting on it."
+    deadline = time.monotonic() + 5
+    while flights.stats()['waiting'] < count and time.monotonic() < deadline:
+        time.sleep(0.005)
+
+
+def test_single_flight_shares_one_provider_call_across_threads_and_coroutines(
+    settings, stub_llm, usage_logger, flights
+):
+    stub_llm.hold = lambda: wait_for_waiters(flights, 3)
+    limiter = RateLimiter()
+    limiter.configure('provider:stub', per_minute=100)
+    options = dict(system='s', usage_logger=usage_logger, rate_limiter=limiter, rate_limit_keys=['provider:stub'])
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        futures = [
+            pool.submit(call_llm, stub_llm, prompt='same', single_flight=flights, **options) for _ in range(4)
+        ]
+        results = {future.result(timeout=10) for future in futures}
+
+    async def run():
+        calls = [acall_llm(stub_llm, prompt='again', single_flight=flights, **options) for _ in range(4)]
+        return set(await asyncio.gather(*calls))
+
+    assert len(results) == 1 and len(asyncio.run(run())) == 1
+    assert stub_llm.calls == ['same', 'again']
+    stats = flights.stats()
+    assert (stats['leaders'], stats['waiters'], stats['max_waiters'], stats['in_flight']) == (2, 6, 3, 0)
+    assert len(limiter._buckets['provider:stub'].timestamps) == 2
+    with sqlite3.connect(settings.DB_PATH) as conn:
+        assert conn.execute('SELECT COUNT(1) FROM llm_usage').fetchone()[0] == 2
+
+
+def test_single_flight_keeps_agents_apart_and_never_blocks_the_event_loop(stub_llm, usage_logger, flights):
+    options = dict(system='s', prompt='same', usage_logger=usage_logger, single_flight=flights)
+
+    async def run():
+        started = asyncio.Event()
+
+        async def lead():
+            started.set()
+            await asyncio.sleep(0.05)
+            return 'async'
+
+        leader = asyncio.ensure_future(flights.ado('key', lead))
+        await started.wait()
+        # A sync caller on the loop's own thread leads its own call instead of waiting on the loop.
+        assert flights.do('key', lambda: 'sync') == ('sync', False)
+        assert await leader == ('async', False)
+        return await asyncio.gather(
+            acall_llm(stub_llm, agent='planner', **options), acall_llm(stub_llm, agent='reviewer', **options)
+        )
+
+    assert len(asyncio.run(asyncio.wait_for(run(), timeout=5))) == 2
+    assert flights.stats()['waiters'] == 0
+
+
+def test_streamed_requests_share_one_flight_with_streams_and_calls(stub_llm, usage_logger, flights):
+    # the leader has streamed its first chunk by the time the others join
+    stub_llm.hold = lambda: wait_for_waiters(flights, 2)
+    options = dict(system='s', prompt='same', usage_logger=usage_logger, single_flight=flights)
+    results = {}
+    threads = [
+        threading.Thread(target=lambda: results.__setitem__('stream', list(stream_llm(stub_llm, **options)))),
+        threading.Thread(target=lambda: results.__setitem__('waiting', list(stream_llm(stub_llm, **options)))),
+        threading.Thread(target=lambda: results.__setitem__('call', call_llm(stub_llm, **options))),
+    ]
+    for thread in threads:
+        thread.start()
+        time.sleep(0.02)
+    for thread in threads:
+        thread.join(timeout=10)
+
+    assert stub_llm.streams == ['same'] and stub_llm.calls == []
+    text = ''.join(results['stream'])
+    assert ''.join(results['waiting']) == text and results['call'] == text
+    assert flights.stats()['waiters'] == 2
@@ -0,0 +1,84 @@
+import json
+import threading
+
+import httpx
+
+from app.agents.plan_stream import PlanStepParser
+from app.config import Settings
+from app.main import OpsCopilotRuntime, TaskRequest
+from providers.openai_provider import Provider
+
+
+def release_request() -> TaskRequest:
+    return TaskRequest(
+        title='Prepare release',
+        description='Draft pull request summary referencing guidelines',
+        risk_level='medium',
+        desired_outcome='Document release plan',
+    )
+
+
+def test_provider_stream_usage_and_task_event_stream(tmp_path):
+    chunks = [
+        {'model': 'gpt-4o-mini', 'choices': [{'delta': {'role': 'assistant'}}]},
+        {'model': 'gpt-4o-mini', 'choices': [{'delta': {'content': 'Hel'}}]},
+        {'model': 'gpt-4o-mini', 'choices': [{'delta': {'content': 'lo'}}]},
+        {'model': 'gpt-4o-mini', 'choices': [], 'usage': {'prompt_tokens': 4, 'completion_tokens': 2, 'total_tokens': 6}},
+    ]
+    body = ''.join(f'data: {json.dumps(chunk)}\n\n' for chunk in chunks) + 'data: [DONE]\n\n'
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        assert json.loads(request.content)['stream'] is True
+        return httpx.Response(200, text=body, headers={'content-type': 'text/event-stream'})
+
+    provider = Provider(settings=Settings(OPENAI_API_KEY='sk-test', DB_PATH=tmp_path / 'usage.sqlite'))
+    provider._client = httpx.Client(base_url=provider.api_base, transport=httpx.MockTransport(handler))
+    assert list(provider.generate_stream('hi', system='s')) == ['Hel', 'lo']
+    assert provider.pop_last_usage() == {
+        'prompt_tokens': 4, 'completion_tokens': 2, 'total_tokens': 6, 'model': 'gpt-4o-mini'
+    }
+
+    runtime = OpsCopilotRuntime(governed=True)
+    events = list(runtime.stream_task(runtime.create_task(release_request()), auto_approve=True, overlap=False))
+    kinds = [event['event'] for event in events]
+    assert kinds[0] == 'task' and kinds[-1] == 'done'
+    first_plan = kinds.index('plan')
+    assert first_plan > 1 and set(kinds[1:first_plan]) == {'plan_token'}
+    plan = json.loads(''.join(event['text'] for event in events[1:first_plan]))
+    assert len(plan['steps']) == len(events[first_plan]['steps'])
+    assert kinds.count('step') >= 1 and kinds.count('review') == kinds.count('step')
+
+
+def test_plan_steps_execute_while_planner_is_still_streaming():
+    parser = PlanStepParser()
+    text = 'Plan: {"steps": [{"tool": "none", "instruction": "say \\"}\\" {ok}"}, {"tool": "jira", "instruction": "b"}]}'
+    parsed = [step for i in range(0, len(text), 5) for step in parser.feed(text[i : i + 5])]
+    assert [step['instruction'] for step in parsed] == ['say "}" {ok}', 'b'] and parser.done
+
+    runtime = OpsCopilotRuntime(governed=True)
+    first_reviewed = threading.Event()
+    steps = [
+        {'tool': 'none', 'instruction': 'Summarise the release runbook.', 'needs_approval': False},
+        {'tool': 'github', 'instruction': 'Open a tracking issue for the release.', 'needs_approval': True},
+        {'tool': 'shell', 'instruction': 'Not an allowed tool, runs as none.'},
+        {'tool': 'none', 'instruction': ''},
+    ]
+
+    def generate_stream(prompt: str, system: str | None = None, max_tokens: int = 512):
+        yield '{"steps": ['
+        for index, step in enumerate(steps):
+            yield (', ' if index else '') + json.dumps(step)
+            if index == 0:
+                assert first_reviewed.wait(10), 'step 1 should be reviewed before step 2 is written'
+        yield ']}'
+
+    runtime.provider.generate_stream = generate_stream
+    events = []
+    for event in runtime.stream_task(runtime.create_task(release_request()), auto_approve=True, overlap=True):
+        events.append(event)
+        if event['event'] == 'review':
+            first_reviewed.set()
+    kinds = [event['event'] for event in events]
+    assert kinds.index('review') < kinds.index('plan') and kinds.count('plan_step') == 3
+    plan = events[kinds.index('plan')]['steps']
+    assert [step['tool'] for step in plan] == ['none', 'github', 'none'] and plan[1]['needs_approval']
@@ -3,9 +3,17 @@ from __future__ import annotations
 import os
 
 import httpx
-from typing import Dict, Optional
+from typing import Any, Dict, Iterator, List, Optional, Sequence
 
 from app.config import Settings
+from providers.base import LoopClients, UsageSlot, batch_request_line, read_chat_stream, to_jsonl
+
+API_VERSION = '2023-07-01-preview'
+# usage on the final streamed chunk (stream_options.include_usage) needs a newer API version
+STREAM_API_VERSION = '2024-10-21'
+# files and batches (the deployment must be a Global Batch one)
+BATCH_API_VERSION = '2024-10-21'
+FILE_TIMEOUT = 300.0
 
 
 class Provider:
@@ -22,41 +30,120 @@ class Provider:
         self.model = os.getenv('AZURE_OPENAI_MODEL', deployment)
         self.provider_name = 'azure'
         self._client = httpx.Client(timeout=10.0)
-        self._last_usage: Optional[Dict[str, int]] = None
+        self._async_clients = LoopClients(timeout=10.0)
+        self._usage = UsageSlot()
 
-    def generate(self, prompt: str, system: str | None = None, max_tokens: int = 512) -> str:
-        url = f"{self.endpoint}/openai/deployments/{self.deployment}/chat/completions?api-version=2023-07-01-preview"
-        payload = {
+    def _url(self, api_version: str = API_VERSION) -> str:
+        return f"{self.endpoint}/openai/deployments/{self.deployment}/chat/completions?api-version={api_version}"
+
+    def _resource_url(self, path: str) -> str:
+        return f"{self.endpoint}/openai/{path}?api-version={BATCH_API_VERSION}"
+
+    def _payload(self, prompt: str, system: str | None, max_tokens: int) -> Dict[str, Any]:
+        return {
             'messages': [
                 {'role': 'system', 'content': system or ''},
                 {'role': 'user', 'content': prompt},
             ],
             'max_tokens': max_tokens,
         }
-        response = self._client.post(
-            url,
-            headers={'api-key': self.api_key, 'Content-Type': 'application/json'},
-            json=payload,
-        )
+
+    def _headers(self) -> Dict[str, str]:
+        return {'api-key': self.api_key, 'Content-Type': 'application/json'}
+
+    def _parse(self, response: httpx.Response) -> str:
         response.raise_for_status()
         data = response.json()
         usage = data.get('usage') or {}
         model_name = data.get('model', self.model)
-        self._last_usage = {
-            'prompt_tokens': usage.get('prompt_tokens', 0),
-            'completion_tokens': usage.get('completion_tokens', 0),
-            'total_tokens': usage.get('total_tokens', 0),
-            'model': model_name,
-        }
+        self._usage.set(
+            {
+                'prompt_tokens': usage.get('prompt_tokens', 0),
+                'completion_tokens': usage.get('completion_tokens', 0),
+                'total_tokens': usage.get('total_tokens', 0),
+                'model': model_name,
+            }
+        )
         return data['choices'][0]['message']['content']
 
+    def generate(self, prompt: str, system: str | None = None, max_tokens: int = 512) -> str:
+        response = self._client.post(self._url(), headers=self._headers(), json=self._payload(prompt, system, max_tokens))
+        return self._parse(response)
+
+    def generate_stream(self, prompt: str, system: str | None = None, max_tokens: int = 512) -> Iterator[str]:
+        payload = {
+            **self._payload(prompt, system, max_tokens),
+            'stream': True,
+            'stream_options': {'include_usage': True},
+        }
+        url = self._url(STREAM_API_VERSION)
+        with self._client.stream('POST', url, headers=self._headers(), json=payload) as response:
+            response.raise_for_status()
+            self._usage.set((yield from read_chat_stream(response.iter_lines(), self.model)))
+
+    async def agenerate(self, prompt: str, system: str | None = None, max_tokens: int = 512) -> str:
+        response = await self._async_clients.get().post(
+            self._url(), headers=self._headers(), json=self._payload(prompt, system, max_tokens)
+        )
+        # usage is recorded and returned without yielding; see the OpenAI provider
+        return self._parse(response)
+
+    def batch_line(
+        self, custom_id: str, prompt: str, system: str | None = None, max_tokens: int = 512
+    ) -> Dict[str, Any]:
+        # batch lines name the deployment as the model and use a path without the /v1 prefix
+        body = {'model': self.deployment, **self._payload(prompt, system, max_tokens)}
+        return batch_request_line(custom_id, body, url='/chat/completions')
+
+    def submit_batch(
+        self, lines: Sequence[Dict[str, Any]], *, completion_window: str = '24h', metadata: Dict[str, str] | None = None
+    ) -> str:
+        headers = {'api-key': self.api_key}
+        upload = self._client.post(
+            self._resource_url('files'),
+            headers=headers,
+            data={'purpose': 'batch'},
+            files={'file': ('batch.jsonl', to_jsonl(lines), 'application/jsonl')},
+            timeout=FILE_TIMEOUT,
+        )
+        upload.raise_for_status()
+        response = self._client.post(
+            self._resource_url('batches'),
+            headers=self._headers(),
+            json={
+                'input_file_id': upload.json()['id'],
+                'endpoint': '/chat/completions',
+                'completion_window': completion_window,
+                'metadata': metadata or {},
+            },
+        )
+        response.raise_for_status()
+        return response.json()['id']
+
+    def batch_status(self, batch_id: str) -> Dict[str, Any]:
+        response = self._client.get(self._resource_url(f'batches/{batch_id}'), headers=self._headers())
+        response.raise_for_status()
+        return response.json()
+
+    def batch_output(self, batch: Dict[str, Any]) -> List[str]:
+        lines: List[str] = []
+        for key in ('output_file_id', 'error_file_id'):
+            if batch.get(key):
+                response = self._client.get(
+                    self._resource_url(f'files/{batch[key]}/content'), headers=self._headers(), timeout=FILE_TIMEOUT
+                )
+                response.raise_for_status()
+                lines.extend(response.text.splitlines())
+        return lines
+
     def estimate_cost(self, input_tokens: int, output_tokens: int) -> float:
         return (input_tokens + output_tokens) / 100000
 
     def pop_last_usage(self) -> Optional[Dict[str, int]]:
-        usage = self._last_usage
-        self._last_usage = None
-        return usage
+        return self._usage.pop()
+
+    async def aclose(self) -> None:
+        await self._async_clients.aclose()
 
     def __del__(self):
         try:
@@ -1,9 +1,15 @@
 from __future__ import annotations
 
+import asyncio
 import math
+import re
+import threading
+import weakref
 from dataclasses import dataclass, field
 import json
-from typing import Dict, Optional, Protocol
+from typing import Any, Dict, Generator, Iterable, Iterator, List, Optional, Protocol, Sequence
+
+import httpx
 
 from app.config import Settings, get_settings
 
@@ -11,19 +17,196 @@ from app.config import Settings, get_settings
 class BaseProvider(Protocol):
     def generate(self, prompt: str, system: str | None = None, max_tokens: int = 512) -> str: ...
 
+    async def agenerate(self, prompt: str, system: str | None = None, max_tokens: int = 512) -> str: ...
+
+    def generate_stream(self, prompt: str, system: str | None = None, max_tokens: int = 512) -> Iterator[str]: ...
+
     def estimate_cost(self, input_tokens: int, output_tokens: int) -> float: ...
 
 
+class BatchProvider(Protocol):
+    "Providers that can run chat requests offline through an OpenAI-style Batch API."
+
+    def batch_line(
+        self, custom_id: str, prompt: str, system: str | None = None, max_tokens: int = 512
+    ) -> Dict[str, Any]: ...
+
+    def submit_batch(
+        self, lines: Sequence[Dict[str, Any]], *, completion_window: str = "24h", metadata: Dict[str, str] | None = None
+    ) -> str: ...
+
+    def batch_status(self, batch_id: str) -> Dict[str, Any]: ...
+
+    def batch_output(self, batch: Dict[str, Any]) -> List[str]: ...
+
+
 class ProviderFactoryError(RuntimeError):
     pass
 
 
+BATCH_ENDPOINT = "/v1/chat/completions"
+BATCH_TERMINAL_STATES = frozenset({"completed", "failed", "expired", "cancelled"})
+
+
+@dataclass
+class BatchResult:
+    "One line of a batch job's output (or error) file."
+
+    custom_id: str
+    text: str = ""
+    usage: Dict[str, int] = field(default_factory=dict)
+    model: str = ""
+    error: str | None = None
+
+
+def batch_request_line(custom_id: str, body: Dict[str, Any], url: str = BATCH_ENDPOINT) -> Dict[str, Any]:
+    return {"custom_id": custom_id, "method": "POST", "url": url, "body": body}
+
+
+def batch_output_line(custom_id: str, text: str, model: str, usage: Dict[str, int]) -> Dict[str, Any]:
+    "A successful output-file line, as the Batch API writes it."
+    return {
+        "id": f"batch_req_{custom_id}",
+        "custom_id": custom_id,
+        "response": {
+            "status_code": 200,
+            "body": {
+                "object": "chat.completion",
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                "usage": usage,
+            },
+        },
+        "error": None,
+    }
+
+
+def to_jsonl(lines: Iterable[Dict[str, Any]]) -> bytes:
+    return "".join(json.dumps(line, ensure_ascii=False) + "\n" for line in lines).encode("utf-8")
+
+
+def parse_batch_output(lines: Iterable[str]) -> Dict[str, BatchResult]:
+    "Output and error file lines by ``custom_id``; failed requests and non-200 responses carry ``error``."
+    results: Dict[str, BatchResult] = {}
+    for line in lines:
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        custom_id = str(record.get("custom_id"))
+        response = record.get("response") or {}
+        body = response.get("body") or {}
+        error = record.get("error")
+        if error is None and response.get("status_code") != 200:
+            error = body.get("error") or f"status {response.get('status_code')}"
+        if error is not None:
+            message = error.get("message") if isinstance(error, dict) else str(error)
+            results[custom_id] = BatchResult(custom_id, error=message or "request failed")
+            continue
+        usage = body.get("usage") or {}
+        results[custom_id] = BatchResult(
+            custom_id,
+            text=body["choices"][0]["message"]["content"] or "",
+            usage={
+                "prompt_tokens": usage.get("prompt_tokens", 0),
+                "completion_tokens": usage.get("completion_tokens", 0),
+                "total_tokens": usage.get("total_tokens", 0),
+            },
+            model=body.get("model", ""),
+        )
+    return results
+
+
+def iter_sse_data(lines: Iterable[str]) -> Iterator[Dict[str, Any]]:
+    "JSON payloads of server-sent ``data:`` lines, up to ``[DONE]``."
+    for line in lines:
+        if not line.startswith("data:"):
+            continue
+        data = line[5:].strip()
+        if data == "[DONE]":
+            return
+        if data:
+            yield json.loads(data)
+
+
+def read_chat_stream(lines: Iterable[str], model: str) -> Generator[str, None, Dict[str, Any]]:
+    """Yield the content deltas of a streamed chat completion; return its usage.
+
+    Usage comes from the final chunk (sent when ``stream_options.include_usage`` is set); a stream
+    without one returns zero counts.
+    """
+    usage: Dict[str, Any] = {}
+    for chunk in iter_sse_data(lines):
+        model = chunk.get("model") or model
+        usage = chunk.get("usage") or usage
+        for choice in chunk.get("choices") or ():
+            text = (choice.get("delta") or {}).get("content")
+            if text:
+                yield text
+    return {
+        "prompt_tokens": usage.get("prompt_tokens", 0),
+        "completion_tokens": usage.get("completion_tokens", 0),
+        "total_tokens": usage.get("total_tokens", 0),
+        "model": model,
+    }
+
+
+class LoopClients:
+    """One ``httpx.AsyncClient`` per event loop.
+
+    A client's connection pool is bound to the loop that first used it, so a provider shared by
+    several loops (successive ``asyncio.run`` calls, or threads running their own) opens one for
+    each. Clients of loops that are gone are dropped with them.
+    """
+
+    def __init__(self, **options: Any) -> None:
+        self.options = options
+        self._clients: 'weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]' = (
+            weakref.WeakKeyDictionary()
+        )
+        self._lock = threading.Lock()
+
+    def get(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            client = self._clients.get(loop)
+            if client is None:
+                client = self._clients[loop] = httpx.AsyncClient(**self.options)
+        return client
+
+    async def aclose(self) -> None:
+        "Close the running loop's client."
+        with self._lock:
+            client = self._clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
+
+
+class UsageSlot:
+    """A provider's last-call usage, kept per thread.
+
+    Agents share one provider across threads (the planner streams while the executor runs), so
+    ``pop_last_usage`` has to return the usage of the call this thread just made.
+    """
+
+    def __init__(self) -> None:
+        self._local = threading.local()
+
+    def set(self, usage: Optional[Dict[str, Any]]) -> None:
+        self._local.usage = usage
+
+    def pop(self) -> Optional[Dict[str, Any]]:
+        usage = getattr(self._local, "usage", None)
+        self._local.usage = None
+        return usage
+
+
 @dataclass
 class StubProvider:
     settings: Settings
     model: str = "stub-001"
     provider_name: str = "stub"
-    _last_usage: Optional[Dict[str, int]] = field(default=None, init=False, repr=False)
+    _usage: UsageSlot = field(default_factory=UsageSlot, init=False, repr=False)
+    _batches: Dict[str, List[str]] = field(default_factory=dict, init=False, repr=False)
 
     def generate(self, prompt: str, system: str | None = None, max_tokens: int = 512) -> str:
         text: str
@@ -64,20 +247,65 @@ class StubProvider:
 
         prompt_tokens = max(1, len((prompt or "").split()))
         completion_tokens = max(1, len(text.split()))
-        self._last_usage = {
-            "prompt_tokens": prompt_tokens,
-            "completion_tokens": completion_tokens,
-            "total_tokens": prompt_tokens + completion_tokens,
-        }
+        self._usage.set(
+            {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            }
+        )
         return text
 
+    async def agenerate(self, prompt: str, system: str | None = None, max_tokens: int = 512) -> str:
+        return self.generate(prompt=prompt, system=system, max_tokens=max_tokens)
+
+    def generate_stream(self, prompt: str, system: str | None = None, max_tokens: int = 512) -> Iterator[str]:
+        "The ``generate`` text, word by word."
+        yield from re.findall(r"\S+\s*", self.generate(prompt=prompt, system=system, max_tokens=max_tokens))
+
+    def batch_line(
+        self, custom_id: str, prompt: str, system: str | None = None, max_tokens: int = 512
+    ) -> Dict[str, Any]:
+        body = {
+            "model": self.model,
+            "messages": [{"role": "system", "content": system or ""}, {"role": "user", "content": prompt}],
+            "max_tokens": max_tokens,
+        }
+        return batch_request_line(custom_id, body)
+
+    def submit_batch(
+        self, lines: Sequence[Dict[str, Any]], *, completion_window: str = "24h", metadata: Dict[str, str] | None = None
+    ) -> str:
+        "Answers every line on the spot; the job is already ``completed`` when this returns."
+        output = []
+        for line in lines:
+            body = line["body"]
+            messages = {message["role"]: message["content"] for message in body["messages"]}
+            text = self.generate(messages.get("user", ""), system=messages.get("system"), max_tokens=body["max_tokens"])
+            usage = self.pop_last_usage() or {}
+            output.append(json.dumps(batch_output_line(line["custom_id"], text, self.model, usage)))
+        batch_id = f"batch_stub_{len(self._batches) + 1}"
+        self._batches[batch_id] = output
+        return batch_id
+
+    def batch_status(self, batch_id: str) -> Dict[str, Any]:
+        count = len(self._batches[batch_id])
+        return {
+            "id": batch_id,
+            "status": "completed",
+            "output_file_id": batch_id,
+            "error_file_id": None,
+            "request_counts": {"total": count, "completed": count, "failed": 0},
+        }
+
+    def batch_output(self, batch: Dict[str, Any]) -> List[str]:
+        return list(self._batches.get(batch.get("output_file_id") or "", []))
+
     def estimate_cost(self, input_tokens: int, output_tokens: int) -> float:
         return (input_tokens + output_tokens) / 100000
 
     def pop_last_usage(self) -> Optional[Dict[str, int]]:
-        usage = self._last_usage
-        self._last_usage = None
-        return usage
+        return self._usage.pop()
 
 
 _DEFECTIVE = {
@@ -1,11 +1,15 @@
 from __future__ import annotations
 
 import os
-from typing import Dict, Optional
+from typing import Any, Dict, Iterator, List, Optional, Sequence
 
 import httpx
 
 from app.config import Settings
+from providers.base import BATCH_ENDPOINT, LoopClients, UsageSlot, batch_request_line, read_chat_stream, to_jsonl
+
+# batch input and output files can be large; the 10s chat timeout is too short to move them
+FILE_TIMEOUT = 300.0
 
 
 class Provider:
@@ -20,38 +24,117 @@ class Provider:
         self.model = (settings.OPENAI_MODEL or os.getenv('OPENAI_MODEL') or 'gpt-4o-mini')
         self.provider_name = 'openai'
         self._client = httpx.Client(base_url=self.api_base, timeout=10.0)
-        self._last_usage: Optional[Dict[str, int]] = None
+        self._async_clients = LoopClients(base_url=self.api_base, timeout=10.0)
+        self._usage = UsageSlot()
 
-    def generate(self, prompt: str, system: str | None = None, max_tokens: int = 512) -> str:
-        payload = {
+    def _payload(self, prompt: str, system: str | None, max_tokens: int) -> Dict[str, Any]:
+        return {
             'model': self.model,
             'messages': [{'role': 'system', 'content': system or ''}, {'role': 'user', 'content': prompt}],
             'max_tokens': max_tokens,
         }
-        response = self._client.post(
-            '/chat/completions',
-            headers={'Authorization': f'Bearer {self.api_key}'},
-            json=payload,
-        )
+
+    def _headers(self) -> Dict[str, str]:
+        return {'Authorization': f'Bearer {self.api_key}'}
+
+    def _parse(self, response: httpx.Response) -> str:
         response.raise_for_status()
         data = response.json()
         usage = data.get('usage') or {}
         model_name = data.get('model', self.model)
-        self._last_usage = {
-            'prompt_tokens': usage.get('prompt_tokens', 0),
-            'completion_tokens': usage.get('completion_tokens', 0),
-            'total_tokens': usage.get('total_tokens', 0),
-            'model': model_name,
-        }
+        self._usage.set(
+            {
+                'prompt_tokens': usage.get('prompt_tokens', 0),
+                'completion_tokens': usage.get('completion_tokens', 0),
+                'total_tokens': usage.get('total_tokens', 0),
+                'model': model_name,
+            }
+        )
         return data['choices'][0]['message']['content']
 
+    def generate(self, prompt: str, system: str | None = None, max_tokens: int = 512) -> str:
+        response = self._client.post(
+            '/chat/completions',
+            headers=self._headers(),
+            json=self._payload(prompt, system, max_tokens),
+        )
+        return self._parse(response)
+
+    def generate_stream(self, prompt: str, system: str | None = None, max_tokens: int = 512) -> Iterator[str]:
+        payload = {
+            **self._payload(prompt, system, max_tokens),
+            'stream': True,
+            'stream_options': {'include_usage': True},
+        }
+        with self._client.stream('POST', '/chat/completions', headers=self._headers(), json=payload) as response:
+            response.raise_for_status()
+            self._usage.set((yield from read_chat_stream(response.iter_lines(), self.model)))
+
+    async def agenerate(self, prompt: str, system: str | None = None, max_tokens: int = 512) -> str:
+        response = await self._async_clients.get().post(
+            '/chat/completions',
+            headers=self._headers(),
+            json=self._payload(prompt, system, max_tokens),
+        )
+        # no await between recording usage and returning, so the caller's pop_last_usage
+        # sees this call's usage even with other coroutines in flight on the same provider
+        return self._parse(response)
+
+    def batch_line(
+        self, custom_id: str, prompt: str, system: str | None = None, max_tokens: int = 512
+    ) -> Dict[str, Any]:
+        return batch_request_line(custom_id, self._payload(prompt, system, max_tokens))
+
+    def submit_batch(
+        self, lines: Sequence[Dict[str, Any]], *, completion_window: str = '24h', metadata: Dict[str, str] | None = None
+    ) -> str:
+        "Upload ``lines`` as a JSONL batch input file and start a batch job on it; returns the batch id."
+        upload = self._client.post(
+            '/files',
+            headers=self._headers(),
+            data={'purpose': 'batch'},
+            files={'file': ('batch.jsonl', to_jsonl(lines), 'application/jsonl')},
+            timeout=FILE_TIMEOUT,
+        )
+        upload.raise_for_status()
+        response = self._client.post(
+            '/batches',
+            headers=self._headers(),
+            json={
+                'input_file_id': upload.json()['id'],
+                'endpoint': BATCH_ENDPOINT,
+                'completion_window': completion_window,
+                'metadata': metadata or {},
+            },
+        )
+        response.raise_for_status()
+        return response.json()['id']
+
+    def batch_status(self, batch_id: str) -> Dict[str, Any]:
+        response = self._client.get(f'/batches/{batch_id}', headers=self._headers())
+        response.raise_for_status()
+        return response.json()
+
+    def batch_output(self, batch: Dict[str, Any]) -> List[str]:
+        "Lines of the job's output file followed by its error file (either may be absent)."
+        lines: List[str] = []
+        for key in ('output_file_id', 'error_file_id'):
+            if batch.get(key):
+                response = self._client.get(
+                    f'/files/{batch[key]}/content', headers=self._headers(), timeout=FILE_TIMEOUT
+                )
+                response.raise_for_status()
+                lines.extend(response.text.splitlines())
+        return lines
+
     def estimate_cost(self, input_tokens: int, output_tokens: int) -> float:
         return (input_tokens + output_tokens) / 100000
 
     def pop_last_usage(self) -> Optional[Dict[str, int]]:
-        usage = self._last_usage
-        self._last_usage = None
-        return usage
+        return self._usage.pop()
+
+    async def aclose(self) -> None:
+        await self._async_clients.aclose()
 
     def __del__(self):
         try:
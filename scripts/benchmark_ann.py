@@ -0,0 +1,102 @@
+from __future__ import annotations
+
+import argparse
+import json
+import time
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+
+from app.config import get_settings
+from app.rag.ann import ExactSearch, IVFSearch, build_ivf
+from app.rag.store import IndexStore, resolve_index_root
+
+REPORT_PATH = Path("reports/ann_report.json")
+NPROBES = [1, 2, 4, 8, 16, 32]
+
+
+def synthetic_corpus(rows: int, dimension: int, clusters: int, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((clusters, dimension)).astype(np.float32)
+    labels = rng.integers(0, clusters, size=rows)
+    vectors = centres[labels] + 0.35 * rng.standard_normal((rows, dimension)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def sample_queries(embeddings: np.ndarray, count: int, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed + 1)
+    picks = np.asarray(embeddings[rng.integers(0, len(embeddings), size=count)], dtype=np.float32)
+    noisy = picks + 0.1 * rng.standard_normal(picks.shape).astype(np.float32)
+    return noisy / np.linalg.norm(noisy, axis=1, keepdims=True)
+
+
+def measure(search, queries: np.ndarray, top_k: int) -> Dict[str, object]:
+    latencies: List[float] = []
+    hits: List[np.ndarray] = []
+    for query in queries:
+        start = time.perf_counter()
+        ids, _ = search.search(query, top_k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        hits.append(ids)
+    return {
+        "p50_ms": round(float(np.percentile(latencies, 50)), 4),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 4),
+        "hits": hits,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Recall@k vs latency of IVF search against exact search.")
+    parser.add_argument("--synthetic", type=int, default=50_000, help="rows of synthetic data (0 = use the live index)")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--lists", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    if args.synthetic:
+        embeddings = synthetic_corpus(args.synthetic, 384, clusters=max(8, args.synthetic // 500), seed=args.seed)
+        source = f"synthetic:{args.synthetic}"
+    else:
+        root, _ = resolve_index_root(get_settings().RAG_INDEX_PATH)
+        embeddings = IndexStore(root).open().embeddings
+        source = str(root)
+    queries = sample_queries(embeddings, args.queries, args.seed)
+
+    started = time.perf_counter()
+    lists = build_ivf(embeddings, args.lists)
+    build_seconds = time.perf_counter() - started
+
+    exact = measure(ExactSearch(embeddings), queries, args.top_k)
+    truth = exact.pop("hits")
+    rows = []
+    for nprobe in NPROBES:
+        if nprobe > len(lists.centroids):
+            break
+        result = measure(IVFSearch(embeddings, lists, nprobe=nprobe), queries, args.top_k)
+        hits = result.pop("hits")
+        recall = np.mean([len(set(a.tolist()) & set(b.tolist())) / max(1, len(b)) for a, b in zip(hits, truth)])
+        rows.append({"nprobe": nprobe, f"recall@{args.top_k}": round(float(recall), 4), **result})
+
+    report = {
+        "source": source,
+        "rows": int(len(embeddings)),
+        "lists": int(len(lists.centroids)),
+        "build_seconds": round(build_seconds, 2),
+        "exact": exact,
+        "ivf": rows,
+    }
+    REPORT_PATH.parent.mkdir(parents=True, exist_ok=True)
+    REPORT_PATH.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print(f"exact   p50={exact['p50_ms']}ms p95={exact['p95_ms']}ms")
+    for row in rows:
+        print(
+            f"nprobe={row['nprobe']:<3} recall@{args.top_k}={row[f'recall@{args.top_k}']:.3f} "
+            f"p50={row['p50_ms']}ms p95={row['p95_ms']}ms"
+        )
+    print(f"Wrote {REPORT_PATH.resolve()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import re
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+
+from app.config import get_settings
+from app.rag.ann import ExactSearch
+from app.rag.indexer import DEFAULT_CORPUS_DIR, CorpusIndexer
+from app.rag.models import get_embedding_model
+
+REPORT_PATH = Path("reports/dedup_report.json")
+
+
+def make_corpus(target: Path, copies: int, seed: int) -> None:
+    """Copy the demo corpus, plus ``copies`` lightly edited variants of each file.
+
+    Variants mimic the boilerplate real runbook corpora accumulate: the same text pasted into
+    another page with a word or two changed.
+    """
+    rng = random.Random(seed)
+    target.mkdir(parents=True)
+    for path in sorted(DEFAULT_CORPUS_DIR.glob("*.md")):
+        text = path.read_text(encoding="utf-8")
+        shutil.copy(path, target / path.name)
+        for copy in range(copies):
+            words = text.split()
+            if words:
+                words[rng.randrange(len(words))] = rng.choice(["service", "team", "alert", "runbook"])
+            (target / f"{path.stem}-copy{copy}.md").write_text(" ".join(words), encoding="utf-8")
+
+
+def directory_bytes(path: Path) -> int:
+    return sum(item.stat().st_size for item in path.rglob("*") if item.is_file())
+
+
+def origin(source: str) -> str:
+    "Source with the ``-copyN`` suffix dropped, so a variant and its original compare equal."
+    name, _, chunk = source.partition("#")
+    return f"{re.sub(r'-copy[0-9]+(?=[.]md$)', '', name)}#{chunk}"
+
+
+def duplicate_rate(hits: List[np.ndarray], sources) -> float:
+    "Share of top-k slots holding a copy of a chunk that already appeared higher up."
+    repeated = slots = 0
+    for row in hits:
+        seen = set()
+        for idx in row:
+            if idx < 0:
+                continue
+            key = origin(sources[idx])
+            repeated += key in seen
+            seen.add(key)
+            slots += 1
+    return repeated / slots if slots else 0.0
+
+
+def run(corpus: Path, scratch: Path, dedup: bool, queries: np.ndarray, top_k: int) -> Dict[str, object]:
+    index_path = scratch / ("dedup" if dedup else "plain") / "rag_index"
+    settings = get_settings().model_copy(update={"RAG_INDEX_PATH": index_path})
+    indexer = CorpusIndexer.from_settings(settings, corpus, dedup=dedup)
+    built = indexer.build(full=True)
+    snapshot = indexer.store.open()
+    try:
+        search = ExactSearch(snapshot.embeddings)
+        latencies: List[float] = []
+        hits: List[np.ndarray] = []
+        for query in queries:
+            start = time.perf_counter()
+            ids, _ = search.search(query, top_k)
+            latencies.append((time.perf_counter() - start) * 1000)
+            hits.append(ids)
+        return {
+            "dedup": dedup,
+            "chunks": built.stats.chunks,
+            "rows": snapshot.manifest.count,
+            "exact_duplicates": built.stats.exact_duplicates,
+            "near_duplicates": built.stats.near_duplicates,
+            "embedding_bytes": int(snapshot.embeddings.nbytes),
+            "index_bytes": directory_bytes(index_path),
+            "build_seconds": round(built.stats.elapsed_seconds, 3),
+            "search_p50_ms": round(float(np.percentile(latencies, 50)), 4),
+            f"top{top_k}_duplicate_rate": round(duplicate_rate(hits, snapshot.sources), 4),
+        }
+    finally:
+        snapshot.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Index size and retrieval impact of near-duplicate chunk removal.")
+    parser.add_argument("--copies", type=int, default=2, help="edited copies of every corpus file to add")
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    from app.evaluation.harness import load_scenarios
+
+    descriptions = [scenario.description for scenario in load_scenarios()]
+    model = get_embedding_model(CorpusIndexer.from_settings(get_settings(), DEFAULT_CORPUS_DIR).model_name)
+    queries = np.asarray(
+        model.encode(descriptions, convert_to_numpy=True, normalize_embeddings=True), dtype=np.float32
+    )
+    with tempfile.TemporaryDirectory() as tmp:
+        scratch = Path(tmp)
+        corpus = scratch / "corpus"
+        make_corpus(corpus, args.copies, args.seed)
+        plain = run(corpus, scratch, False, queries, args.top_k)
+        deduped = run(corpus, scratch, True, queries, args.top_k)
+
+    report = {
+        "copies": args.copies,
+        "queries": int(len(queries)),
+        "runs": [plain, deduped],
+        "reduction_ratio": round(1 - deduped["rows"] / plain["rows"], 4) if plain["rows"] else 0.0,
+        "index_bytes_saved": plain["index_bytes"] - deduped["index_bytes"],
+    }
+    REPORT_PATH.parent.mkdir(parents=True, exist_ok=True)
+    REPORT_PATH.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    for row in report["runs"]:
+        label = "dedup" if row["dedup"] else "no dedup"
+        print(
+            f"{label:<9} rows={row['rows']:<6} bytes={row['index_bytes']:<9} "
+            f"p50={row['search_p50_ms']}ms top{args.top_k} duplicates={row[f'top{args.top_k}_duplicate_rate']:.1%}"
+        )
+    print(f"reduction ratio {report['reduction_ratio']:.1%}, {report['index_bytes_saved']} bytes saved")
+    print(f"Wrote {REPORT_PATH.resolve()}")
+
+
+if __name__ == "__main__":
+    main()
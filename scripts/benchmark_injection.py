@@ -0,0 +1,96 @@
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import re
+import time
+from pathlib import Path
+from typing import Callable, Dict, List
+
+from app.rag.defenses import REDACTED, InjectionEngine, InjectionRule, get_injection_engine
+
+REPORT_PATH = Path("reports/injection_report.json")
+WORDS = (
+    "ignore previous system rules override change leak data secret token reveal prompt instructions "
+    "pretend developer mode disable safety filter policy bypass admin password credentials print dump"
+).split()
+
+
+def synthetic_rules(base: List[InjectionRule], count: int, seed: int) -> List[InjectionRule]:
+    "The live pack padded with random three-word phrases (and every tenth rule a regex) up to ``count``."
+    rng = random.Random(seed)
+    rules = list(base)
+    while len(rules) < count:
+        words = rng.sample(WORDS, 3)
+        name = f"synthetic_{len(rules)}"
+        if len(rules) % 10 == 0:
+            rules.append(InjectionRule(name, regex=r"\s+".join(words)))
+        else:
+            rules.append(InjectionRule(name, phrases=(" ".join(words),)))
+    return rules[:count]
+
+
+def corpus_text(size_mb: float) -> str:
+    root = Path("app/data/corpus")
+    docs = [path.read_text(encoding="utf-8") for path in sorted(root.rglob("*.md"))] or ["runbook step " * 200]
+    text = "\n\n".join(docs)
+    target = int(size_mb * 1024 * 1024)
+    return (text * (target // max(1, len(text)) + 1))[:target]
+
+
+def per_rule_loop(rules: List[InjectionRule]) -> Callable[[str], object]:
+    "The old scan: one search and one substitution per rule."
+    patterns = []
+    for rule in rules:
+        sources = [rule.regex] if rule.regex else []
+        sources += [r"\s+".join(map(re.escape, phrase.split())) for phrase in rule.phrases]
+        patterns.append(re.compile("|".join(sources), re.IGNORECASE))
+
+    def run(text: str) -> object:
+        fired = [idx for idx, pattern in enumerate(patterns) if pattern.search(text)]
+        for pattern in patterns:
+            text = pattern.sub(REDACTED, text)
+        return fired, text
+
+    return run
+
+
+def throughput(run: Callable[[str], object], text: str, rounds: int) -> float:
+    best = float("inf")
+    for _ in range(rounds):
+        start = time.perf_counter()
+        run(text)
+        best = min(best, time.perf_counter() - start)
+    return round(len(text.encode("utf-8")) / (1024 * 1024) / max(best, 1e-9), 2)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Injection scan throughput (MB/s) as the pattern pack grows.")
+    parser.add_argument("--sizes", default="5,50,200,500", help="comma-separated rule counts")
+    parser.add_argument("--text-mb", type=float, default=2.0)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    base = get_injection_engine().rules
+    text = corpus_text(args.text_mb)
+    results: List[Dict[str, object]] = []
+    for count in (int(value) for value in args.sizes.split(",")):
+        rules = synthetic_rules(base, count, args.seed)
+        engine = InjectionEngine(rules)
+        loop = throughput(per_rule_loop(rules), text, args.rounds)
+        single = throughput(engine.scan_and_redact, text, args.rounds)
+        results.append(
+            {"rules": count, "per_rule_mb_s": loop, "engine_mb_s": single, "speedup": round(single / max(loop, 1e-9), 2)}
+        )
+        print(f"{count:>5} rules  per-rule {loop:>8} MB/s  engine {single:>8} MB/s  ({results[-1]['speedup']}x)")
+
+    report = {"text_mb": args.text_mb, "rounds": args.rounds, "results": results}
+    REPORT_PATH.parent.mkdir(parents=True, exist_ok=True)
+    REPORT_PATH.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print(f"Wrote {REPORT_PATH.resolve()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+from __future__ import annotations
+
+import argparse
+import json
+import re
+import time
+from pathlib import Path
+from statistics import mean
+from typing import Dict, List
+
+from app.evaluation.harness import load_scenarios
+from app.main import OpsCopilotRuntime, TaskRequest
+
+REPORT_PATH = Path("reports/plan_overlap_report.json")
+
+
+def slow_down(runtime: OpsCopilotRuntime, first_token_ms: float, token_ms: float) -> None:
+    """Give the stub provider a real model's pacing: ``first_token_ms`` before any output, then
+    ``token_ms`` per token, whether the completion is streamed or returned whole."""
+    provider = runtime.provider
+    generate = provider.generate
+
+    def tokens(prompt: str, system: str | None, max_tokens: int) -> List[str]:
+        return re.findall(r"\S+\s*", generate(prompt, system=system, max_tokens=max_tokens))
+
+    def slow_generate(prompt: str, system: str | None = None, max_tokens: int = 512) -> str:
+        parts = tokens(prompt, system, max_tokens)
+        time.sleep((first_token_ms + token_ms * len(parts)) / 1000)
+        return "".join(parts)
+
+    def slow_stream(prompt: str, system: str | None = None, max_tokens: int = 512):
+        parts = tokens(prompt, system, max_tokens)
+        time.sleep(first_token_ms / 1000)
+        for part in parts:
+            time.sleep(token_ms / 1000)
+            yield part
+
+    provider.generate = slow_generate
+    provider.generate_stream = slow_stream
+
+
+def run(runtime: OpsCopilotRuntime, scenarios, overlap: bool) -> Dict[str, float]:
+    critical: List[float] = []
+    sequential: List[float] = []
+    for scenario in scenarios:
+        request = TaskRequest(
+            title=scenario.title,
+            description=scenario.description,
+            risk_level="high" if scenario.risky else "medium",
+            desired_outcome="; ".join(scenario.expected_keywords),
+        )
+        response = runtime.run_task(runtime.create_task(request), auto_approve=True, overlap=overlap)
+        critical.append(response.metrics.critical_path_ms)
+        sequential.append(response.metrics.critical_path_no_overlap_ms)
+    return {
+        "mean_critical_path_ms": round(mean(critical), 2),
+        "mean_critical_path_no_overlap_ms": round(mean(sequential), 2),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Critical-path latency of tasks with and without plan/execute overlap.")
+    parser.add_argument("--first-token-ms", type=float, default=150.0, help="simulated time to first token")
+    parser.add_argument("--token-ms", type=float, default=5.0, help="simulated decode time per token")
+    parser.add_argument("--scenarios", type=int, default=5)
+    args = parser.parse_args()
+
+    runtime = OpsCopilotRuntime(governed=True)
+    slow_down(runtime, args.first_token_ms, args.token_ms)
+    scenarios = load_scenarios()[: args.scenarios]
+    sequential = run(runtime, scenarios, overlap=False)
+    overlapped = run(runtime, scenarios, overlap=True)
+    saved = sequential["mean_critical_path_ms"] - overlapped["mean_critical_path_ms"]
+    report = {
+        "scenarios": len(scenarios),
+        "first_token_ms": args.first_token_ms,
+        "token_ms": args.token_ms,
+        "sequential": sequential,
+        "overlap": overlapped,
+        "saved_ms": round(saved, 2),
+        "speedup": round(sequential["mean_critical_path_ms"] / max(overlapped["mean_critical_path_ms"], 1e-9), 2),
+    }
+    REPORT_PATH.parent.mkdir(parents=True, exist_ok=True)
+    REPORT_PATH.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print(f"sequential  critical path {sequential['mean_critical_path_ms']} ms")
+    print(
+        f"overlap     critical path {overlapped['mean_critical_path_ms']} ms "
+        f"(back to back it would be {overlapped['mean_critical_path_no_overlap_ms']} ms)"
+    )
+    print(f"saved {report['saved_ms']} ms per task ({report['speedup']}x)")
+    print(f"Wrote {REPORT_PATH.resolve()}")
+
+
+if __name__ == "__main__":
+    main()
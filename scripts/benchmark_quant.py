@@ -0,0 +1,113 @@
+from __future__ import annotations
+
+import argparse
+import json
+import time
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+
+from app.config import get_settings
+from app.rag.ann import ExactSearch
+from app.rag.quant import PCA_COMPONENTS, PCA_MEAN, QUANT_CODES, QUANT_SCALES, Projection, QuantizedSearch, quantize
+from app.rag.store import IndexStore, resolve_index_root
+from scripts.benchmark_ann import sample_queries, synthetic_corpus
+
+REPORT_PATH = Path("reports/quant_report.json")
+CONFIGS = [("float16", None), ("int8", None), ("float16", 128), ("int8", 128), ("int8", 64)]
+RESCORE_FACTORS = [1, 4, 10]
+
+
+def harness_queries(model_name: str) -> np.ndarray:
+    from app.evaluation.harness import load_scenarios
+    from app.rag.models import get_embedding_model
+
+    descriptions = [scenario.description for scenario in load_scenarios()]
+    vectors = get_embedding_model(model_name).encode(descriptions, convert_to_numpy=True, normalize_embeddings=True)
+    return np.asarray(vectors, dtype=np.float32)
+
+
+def recall(hits: np.ndarray, truth: np.ndarray) -> float:
+    return float(np.mean([len(set(a.tolist()) & set(b.tolist())) / max(1, len(b)) for a, b in zip(hits, truth)]))
+
+
+def measure(search, queries: np.ndarray, top_k: int) -> Dict[str, object]:
+    latencies: List[float] = []
+    hits: List[np.ndarray] = []
+    for query in queries:
+        start = time.perf_counter()
+        ids, _ = search.search(query, top_k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        hits.append(ids)
+    return {"p50_ms": round(float(np.percentile(latencies, 50)), 4), "hits": hits}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Memory saved vs recall@k lost for quantised embedding storage.")
+    parser.add_argument("--synthetic", type=int, default=0, help="rows of synthetic data (0 = live index + harness queries)")
+    parser.add_argument("--queries", type=int, default=200, help="synthetic queries (ignored for the live index)")
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    if args.synthetic:
+        embeddings = synthetic_corpus(args.synthetic, 384, clusters=max(8, args.synthetic // 500), seed=args.seed)
+        queries = sample_queries(embeddings, args.queries, args.seed)
+        source = f"synthetic:{args.synthetic}"
+    else:
+        root, _ = resolve_index_root(get_settings().RAG_INDEX_PATH)
+        snapshot = IndexStore(root).open()
+        embeddings = snapshot.embeddings
+        queries = harness_queries(snapshot.manifest.model_name)
+        source = f"{root} (harness queries)"
+
+    exact = measure(ExactSearch(embeddings), queries, args.top_k)
+    truth = exact.pop("hits")
+    rows = []
+    for kind, pca_dims in CONFIGS:
+        if pca_dims and pca_dims >= embeddings.shape[1]:
+            continue
+        arrays, entry = quantize(embeddings, kind, pca_dims=pca_dims)
+        projection = None
+        if PCA_COMPONENTS in arrays:
+            projection = Projection(components=arrays[PCA_COMPONENTS], mean=arrays[PCA_MEAN])
+        for factor in RESCORE_FACTORS:
+            search = QuantizedSearch(
+                embeddings, arrays[QUANT_CODES], arrays.get(QUANT_SCALES), projection, rescore=factor
+            )
+            result = measure(search, queries, args.top_k)
+            rows.append(
+                {
+                    "kind": kind,
+                    "pca_dims": pca_dims,
+                    "rescore": factor,
+                    "bytes": entry["bytes"],
+                    "memory_saved": round(1 - entry["bytes"] / entry["float32_bytes"], 4),
+                    f"recall@{args.top_k}": round(recall(result.pop("hits"), truth), 4),
+                    **result,
+                }
+            )
+
+    report = {
+        "source": source,
+        "rows": int(len(embeddings)),
+        "queries": int(len(queries)),
+        "float32_bytes": int(embeddings.shape[0] * embeddings.shape[1] * 4),
+        "exact": exact,
+        "quantized": rows,
+    }
+    REPORT_PATH.parent.mkdir(parents=True, exist_ok=True)
+    REPORT_PATH.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print(f"exact            p50={exact['p50_ms']}ms  ({report['float32_bytes']} bytes)")
+    for row in rows:
+        label = f"{row['kind']}" + (f"+pca{row['pca_dims']}" if row["pca_dims"] else "")
+        print(
+            f"{label:<13} x{row['rescore']:<3} saved={row['memory_saved']:.0%} "
+            f"recall@{args.top_k}={row[f'recall@{args.top_k}']:.3f} p50={row['p50_ms']}ms"
+        )
+    print(f"Wrote {REPORT_PATH.resolve()}")
+
+
+if __name__ == "__main__":
+    main()
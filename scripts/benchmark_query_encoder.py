@@ -0,0 +1,102 @@
+from __future__ import annotations
+
+import argparse
+import json
+import time
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+
+from app.config import get_settings
+from app.rag.ann import ExactSearch
+from app.rag.models import QueryEncoderOptions, get_query_encoder, warm_up
+from app.rag.store import IndexStore, resolve_index_root
+
+REPORT_PATH = Path("reports/query_encoder_report.json")
+
+
+def queries_from_harness() -> List[str]:
+    from app.evaluation.harness import load_scenarios
+
+    return [scenario.description for scenario in load_scenarios()]
+
+
+def measure(encoder, queries: List[str], rounds: int) -> Dict[str, object]:
+    "Single-query encode latency, the way ``CorpusRetriever.retrieve`` calls the model."
+    warm_up(encoder)
+    latencies: List[float] = []
+    vectors = []
+    for _ in range(rounds):
+        vectors = []
+        for query in queries:
+            start = time.perf_counter()
+            vector = encoder.encode([query], convert_to_numpy=True, normalize_embeddings=True)
+            latencies.append((time.perf_counter() - start) * 1000)
+            vectors.append(np.asarray(vector, dtype=np.float32)[0])
+    return {
+        "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 3),
+        "vectors": np.stack(vectors),
+    }
+
+
+def recall(hits: np.ndarray, truth: np.ndarray) -> float:
+    return float(np.mean([len(set(a.tolist()) & set(b.tolist())) / max(1, len(b)) for a, b in zip(hits, truth)]))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Latency and recall of the fast (int8) query encoder vs the default.")
+    parser.add_argument("--model", default="", help="embedding model (default: the live index's model)")
+    parser.add_argument("--rounds", type=int, default=3, help="passes over the harness queries")
+    parser.add_argument("--threads", type=int, default=0)
+    parser.add_argument("--max-seq-length", type=int, default=128)
+    parser.add_argument("--top-k", type=int, default=3)
+    args = parser.parse_args()
+
+    root, _ = resolve_index_root(get_settings().RAG_INDEX_PATH)
+    store = IndexStore(root)
+    snapshot = store.open() if store.exists() else None
+    model_name = args.model or (snapshot.manifest.model_name if snapshot else "sentence-transformers/all-MiniLM-L6-v2")
+    queries = queries_from_harness()
+    options = QueryEncoderOptions(threads=args.threads, max_seq_length=args.max_seq_length)
+
+    default = measure(get_query_encoder(model_name), queries, args.rounds)
+    fast = measure(get_query_encoder(model_name, options), queries, args.rounds)
+    fast_vectors = fast.pop("vectors")
+    cosine = np.sum(default.pop("vectors") * fast_vectors, axis=1)
+    report: Dict[str, object] = {
+        "model": model_name,
+        "queries": len(queries),
+        "rounds": args.rounds,
+        "options": {"threads": args.threads, "max_seq_length": args.max_seq_length, "quantize": True},
+        "default": default,
+        "fast": fast,
+        "speedup_p50": round(float(default["p50_ms"]) / max(float(fast["p50_ms"]), 1e-9), 2),
+        "cosine_mean": round(float(cosine.mean()), 5),
+        "cosine_min": round(float(cosine.min()), 5),
+    }
+    if snapshot is not None and snapshot.manifest.model_name == model_name and snapshot.manifest.count:
+        search = ExactSearch(snapshot.embeddings)
+        default_vectors = np.asarray(
+            get_query_encoder(model_name).encode(queries, convert_to_numpy=True, normalize_embeddings=True),
+            dtype=np.float32,
+        )
+        truth, _ = search.search_many(default_vectors, args.top_k)
+        hits, _ = search.search_many(fast_vectors, args.top_k)
+        report[f"recall@{args.top_k}"] = round(recall(hits, truth), 4)
+    if snapshot is not None:
+        snapshot.close()
+
+    REPORT_PATH.parent.mkdir(parents=True, exist_ok=True)
+    REPORT_PATH.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print(f"default  p50={default['p50_ms']}ms p99={default['p99_ms']}ms")
+    print(f"fast     p50={fast['p50_ms']}ms p99={fast['p99_ms']}ms  ({report['speedup_p50']}x)")
+    print(f"cosine to default: mean {report['cosine_mean']}, min {report['cosine_min']}")
+    if f"recall@{args.top_k}" in report:
+        print(f"recall@{args.top_k} vs default encoder: {report[f'recall@{args.top_k}']}")
+    print(f"Wrote {REPORT_PATH.resolve()}")
+
+
+if __name__ == "__main__":
+    main()
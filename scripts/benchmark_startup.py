@@ -0,0 +1,111 @@
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+from statistics import median
+from typing import Dict, List
+
+REPORT_PATH = Path("reports/startup_report.json")
+HEAVY_MODULES = ["torch", "sentence_transformers", "transformers"]
+
+PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import app.main
+imported = time.perf_counter() - started
+# Checked before the lifespan hook starts the bootstrap thread.
+heavy = [name for name in {heavy_modules!r} if name in sys.modules]
+from fastapi.testclient import TestClient
+with TestClient(app.main.app) as client:
+    serving = time.perf_counter() - started
+    healthz = client.get('/healthz').status_code
+    first_ready = client.get('/readyz').status_code
+    ready = None
+    deadline = time.perf_counter() + {timeout}
+    while time.perf_counter() < deadline:
+        if client.get('/readyz').status_code == 200:
+            ready = time.perf_counter() - started
+            break
+        time.sleep(0.05)
+print(json.dumps({{
+    'import_seconds': imported,
+    'serving_seconds': serving,
+    'healthz_status': healthz,
+    'readyz_status_at_start': first_ready,
+    'ready_seconds': ready,
+    'heavy_modules_at_import': heavy,
+}}))
+"""
+
+
+def probe(env: Dict[str, str], timeout: float) -> Dict[str, object]:
+    code = PROBE.format(timeout=timeout, heavy_modules=HEAVY_MODULES)
+    output = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True, check=True)
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def import_profile(env: Dict[str, str], limit: int = 15) -> List[Dict[str, object]]:
+    "Modules with the largest cumulative import time, from ``python -X importtime``."
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"], env=env, capture_output=True, text=True
+    )
+    rows: List[Dict[str, object]] = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = (part.strip() for part in line[len("import time:") :].split("|"))
+        rows.append(
+            {
+                "module": name,
+                "cumulative_ms": round(int(cumulative_us) / 1000, 1),
+                "self_ms": round(int(self_us) / 1000, 1),
+            }
+        )
+    rows.sort(key=lambda row: -float(row["cumulative_ms"]))  # type: ignore[arg-type]
+    return rows[:limit]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Import time, time to /healthz and time to /readyz for app.main.")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--cold", action="store_true", help="point RAG_INDEX_PATH at an empty directory to force a build")
+    parser.add_argument("--timeout", type=float, default=600.0, help="seconds to wait for /readyz")
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    runs = []
+    for _ in range(args.runs):
+        with tempfile.TemporaryDirectory() as scratch:
+            if args.cold:
+                env["RAG_INDEX_PATH"] = str(Path(scratch) / "rag_index")
+            runs.append(probe(env, args.timeout))
+
+    def summary(key: str) -> float | None:
+        values = [run[key] for run in runs if run[key] is not None]
+        return round(median(values), 3) if values else None
+
+    report = {
+        "runs": runs,
+        "cold_index": args.cold,
+        "median_import_seconds": summary("import_seconds"),
+        "median_serving_seconds": summary("serving_seconds"),
+        "median_ready_seconds": summary("ready_seconds"),
+        "import_profile": import_profile(env),
+    }
+    REPORT_PATH.parent.mkdir(parents=True, exist_ok=True)
+    REPORT_PATH.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print(f"import app.main      {report['median_import_seconds']}s (median of {args.runs})")
+    print(f"serving /healthz     {report['median_serving_seconds']}s")
+    ready = report["median_ready_seconds"]
+    print(f"/readyz 200          {f'{ready}s' if ready is not None else f'not within {args.timeout}s'}")
+    print(f"heavy modules loaded at import: {runs[0]['heavy_modules_at_import'] or 'none'}")
+    print(f"Wrote {REPORT_PATH.resolve()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,25 @@
 from __future__ import annotations
 
+import argparse
 from pathlib import Path
 
 from app.config import get_settings
+from app.rag.collection import discover_collections
 from app.rag.indexer import CorpusIndexer
+from app.rag.store import resolve_index_root
 from app.tools.sandbox_repo import SandboxRepo
 
 
 def main() -> None:
+    parser = argparse.ArgumentParser(description='Build the RAG index and initialise the sandbox repo.')
+    parser.add_argument('--workers', type=int, default=0, help='embedding worker processes (0 = settings)')
+    args = parser.parse_args()
+
     settings = get_settings()
     corpus_dir = Path(__file__).resolve().parents[1] / 'app' / 'data' / 'corpus'
-    CorpusIndexer(corpus_dir, settings.RAG_INDEX_PATH).build()
+    index_root, _ = resolve_index_root(Path(settings.RAG_INDEX_PATH))
+    for collection in discover_collections(corpus_dir, index_root):
+        CorpusIndexer.from_settings(settings, corpus_dir, collection=collection, workers=args.workers).build()
     SandboxRepo(Path(settings.SANDBOX_REPO_PATH))
     print('Demo environment seeded: index built and sandbox repo initialised.')
 